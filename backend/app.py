@@ -1,36 +1,46 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List
-import io
+from typing import Optional, List, Dict, Any
+import asyncio
+import copy
+import functools
 import json
+import os
 import uuid
 import numpy as np
 import pandas as pd
 
-from preprocessing import DataPreprocessor
-from kmeans_engine import KMeansEngine
+from preprocessing import DataPreprocessor, iter_frame_chunks, STREAM_CHUNK_ROWS
+from kmeans_engine import run_clustering
 from conclusion_engine import ConclusionEngine
-from db_connector import SQLServerConnector
+from db_connector import (
+    create_connector, schema_cache_stats, max_watermark, watermark_to_json, watermark_from_json
+)
+from db_pool import pool_stats, close_all_pools
+from columnar import COLUMNAR_MEDIA_TYPE, wants_columnar, pack_columnar
+from model_registry import ModelRegistry
+from session_store import create_session_manager, SESSION_BACKEND
+from jobs import JobManager, SharedJobStore, TERMINAL_STATES, kmeans_task, preprocess_task, save_clusters_task
+from result_cache import ResultCache, fingerprint_dataframe, make_cache_key
+from upload_store import SpooledUpload, UploadTooLarge, MAX_UPLOAD_SIZE
+from fast_json import FastJSONResponse, dumps as dump_json
+from http_cache import (
+    COMPRESS_MIN_BYTES, CACHE_HEADERS, negotiate_encoding, compress_body,
+    should_compress, encoded_etag, make_etag, etag_matches
+)
 
 # ==================== CONSTANTS ====================
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB max file size
-
-# Custom JSON encoder for numpy/pandas types
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (np.integer, np.floating)):
-            if np.isnan(obj) or np.isinf(obj):
-                return None
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif pd.isna(obj):
-            return None
-        return super().default(obj)
-
-app = FastAPI(title="KPDL - K-means Processing & Data Learning")
+MAX_FILE_SIZE = MAX_UPLOAD_SIZE  # upload được spool xuống đĩa, không giữ trong RAM
+MAX_LOD_RESOLUTION = 1024  # lưới tối đa cho /kmeans/lod
+
+# Response mặc định: orjson, ghi thẳng mảng/số numpy và NaN -> null
+app = FastAPI(
+    title="KPDL - K-means Processing & Data Learning",
+    default_response_class=FastJSONResponse
+)
 
 # Enable CORS for React frontend - Restricted to localhost only
 app.add_middleware(
@@ -45,35 +55,328 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+model_registry = ModelRegistry()
+result_cache = ResultCache()
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    job_manager.shutdown()
+    close_all_pools()
+
 # ==================== SESSION STORAGE ====================
-# Session-based storage for multi-user support
-sessions = {}
-
-def get_session(session_id: str) -> dict:
-    """Get or create a session by ID"""
-    if session_id not in sessions:
-        sessions[session_id] = {
-            "df": None,
-            "X_processed": None,
-            "preprocessor": None,
-            "kmeans_engine": None,
-            "cluster_stats": None,
-            "selected_columns": None
-        }
-    return sessions[session_id]
+# Session-based storage for multi-user support (TTL + LRU theo memory budget).
+# KPDL_SESSION_BACKEND=shared cho phép chạy nhiều uvicorn worker.
+session_manager = create_session_manager()
+# Backend shared: trạng thái job lưu cạnh session để worker nào cũng trả lời được /jobs/{id}
+job_manager = JobManager(store=SharedJobStore(os.path.join(session_manager.root_dir, "jobs.db"))
+                         if SESSION_BACKEND == "shared" else None)
+
+def get_session(session_id: str, create: bool = False) -> dict:
+    """Get a session by ID; only entry-point endpoints may create one implicitly"""
+    state = session_manager.get(session_id, create=create)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return state
 
 def clear_session(session_id: str):
     """Clear a specific session"""
-    if session_id in sessions:
-        del sessions[session_id]
+    session_manager.delete(session_id)
+
+_budget_task = None
+
+@app.middleware("http")
+async def enforce_session_budget(request: Request, call_next):
+    """
+    Pin the request's session while it is served, then evict idle / least
+    recently used sessions in a worker thread (at most one sweep at a time).
+    """
+    global _budget_task
+    session_id = request.headers.get("x-session-id") or "default"
+    await run_in_threadpool(session_manager.pin, session_id)
+    try:
+        response = await call_next(request)
+    finally:
+        await run_in_threadpool(session_manager.unpin, session_id)
+    if _budget_task is None or _budget_task.done():
+        # Ước lượng dung lượng session tốn CPU: không chặn event loop, không chờ
+        _budget_task = asyncio.create_task(run_in_threadpool(session_manager.enforce_budget))
+    return response
+
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    """gzip / zstd (theo Accept-Encoding) cho body JSON / columnar từ COMPRESS_MIN_BYTES trở lên"""
+    response = await call_next(request)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if response.status_code == 304:
+        # 304 mang đúng ETag mà response 200 gửi cho cùng Accept-Encoding
+        if encoding is not None and "etag" in response.headers:
+            response.headers["etag"] = encoded_etag(response.headers["etag"], encoding)
+        response.headers["vary"] = _vary_accept_encoding(response.headers.getlist("vary"))
+        return response
+    if response.status_code != 200 or not should_compress(
+        response.headers.get("content-type"), response.headers
+    ):
+        return response
+    
+    response.headers["vary"] = _vary_accept_encoding(response.headers.getlist("vary"))
+    if encoding is None:
+        return response
+    
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    # Giữ nguyên raw headers (Set-Cookie lặp lại...), chỉ thay các header phụ thuộc body
+    compressed = Response(content=b"", status_code=response.status_code)
+    compressed.raw_headers = [(k, v) for k, v in response.raw_headers if k != b"content-length"]
+    headers = compressed.headers
+    # Response có ETag luôn được nén khi client nhận encoding, kể cả body nhỏ:
+    # ETag của 200 và 304 chỉ phụ thuộc Accept-Encoding
+    if len(body) >= COMPRESS_MIN_BYTES or "etag" in headers:
+        # Nén vài MB tốn CPU: chạy ngoài event loop
+        body = await run_in_threadpool(compress_body, body, encoding)
+        headers["content-encoding"] = encoding
+        if "etag" in headers:
+            headers["etag"] = encoded_etag(headers["etag"], encoding)
+    compressed.body = body
+    headers["content-length"] = str(len(body))
+    return compressed
+
+def _vary_accept_encoding(vary_headers):
+    """Single Vary value merging every Vary header, with Accept-Encoding added once"""
+    values = []
+    for vary in vary_headers:
+        for value in vary.split(","):
+            value = value.strip()
+            if value and value not in values:
+                values.append(value)
+    if "Accept-Encoding" not in values:
+        values.append("Accept-Encoding")
+    return ", ".join(values)
 
 # ==================== MODELS ====================
 class PreprocessRequest(BaseModel):
     selected_columns: Optional[List[str]] = None
+    precision: str = "float64"  # float64 | float32 (giảm một nửa bộ nhớ cho cả pipeline)
+    stream: bool = False  # fit theo chunk, không giữ ma trận đã scale (K-Means phải chạy mode=minibatch)
 
 class KMeansRequest(BaseModel):
     k: Optional[int] = None
     auto_k: bool = False
+    k_min: int = 2
+    k_max: int = 5
+    time_budget: Optional[float] = None  # seconds, chỉ dùng khi auto_k
+    n_jobs: Optional[int] = None
+    silhouette_mode: str = "auto"  # auto | full | sampled | simplified
+    silhouette_sample_size: int = 10000
+    mode: str = "full"  # full | minibatch
+    chunk_size: int = 10000
+    batch_size: int = 4096
+
+class PredictRequest(BaseModel):
+    rows: Optional[List[Dict[str, Any]]] = None
+    view_name: Optional[str] = None
+    id_column: Optional[str] = None
+    chunk_size: int = 100000
+    handle_unknown: str = "mode"  # mode | error
+    include_labels: bool = True
+
+class SaveModelRequest(BaseModel):
+    model_id: Optional[str] = None
+    description: Optional[str] = None
+
+# ==================== HELPERS ====================
+
+def _kmeans_response(kmeans_engine, k_info, fit_result, cluster_stats):
+    """JSON body shared by POST /kmeans and clustering jobs"""
+    return {
+        "status": "success",
+        "k_info": k_info,
+        "fit_info": fit_result,
+        "clustering": kmeans_engine.get_results(),
+        "statistics": cluster_stats
+    }
+
+def _set_clustering(state, kmeans_engine, cluster_stats, k_info, fit_info):
+    """Store a clustering run; every GET result endpoint is revalidated against result_version"""
+    state["kmeans_engine"] = kmeans_engine
+    state["cluster_stats"] = cluster_stats
+    state["kmeans_info"] = {"k_info": k_info, "fit_info": fit_info}
+    state["result_version"] = uuid.uuid4().hex
+    # Model mới: nhãn do /dw/refresh gán theo model cũ không còn dùng
+    state["dw_refreshed"] = None
+
+def _result_etag(state, name):
+    """Strong ETag of a result representation; None before the first clustering run"""
+    version = state.get("result_version")
+    return make_etag(version, name) if version else None
+
+def _not_modified(request, etag):
+    """304 for a matching If-None-Match, before any recomputation or serialization"""
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, **CACHE_HEADERS})
+    return None
+
+def _cacheable_response(content, etag):
+    headers = {"ETag": etag, **CACHE_HEADERS} if etag else None
+    return FastJSONResponse(content=content, headers=headers)
+
+def _set_loaded_data(state, df, preprocessor):
+    """Store a freshly loaded DataFrame and reset everything derived from it"""
+    state["df"] = df
+    state["preprocessor"] = preprocessor
+    state["data_fingerprint"] = fingerprint_dataframe(df)
+    state["X_processed"] = None  # Reset processed data
+    state["preprocess_key"] = None
+    state["preprocess_stream"] = False
+    state["dw_refreshed"] = None
+
+def _replace_upload(state, upload):
+    """Swap the session's spooled upload, deleting the previous one from disk"""
+    old_upload = state.get("upload")
+    if old_upload is not None:
+        old_upload.remove()
+    state["upload"] = upload
+
+def _parse_upload(upload, compact):
+    """Parse a spooled upload; returns (preprocessor, df, error)"""
+    preprocessor = DataPreprocessor()
+    df, error = preprocessor.load_upload(upload)
+    if error is None and compact:
+        df = preprocessor.compact(df)
+    return preprocessor, df, error
+
+def _store_upload(state, upload, filename, compact, df, preprocessor):
+    """Make a freshly parsed upload the session's dataset"""
+    _replace_upload(state, upload)
+    state["filename"] = filename
+    state["compact"] = compact
+    state["sheet_name"] = None
+    _set_loaded_data(state, df, preprocessor)
+
+def _preprocess_cache_key(state, selected_columns, precision, stream=False):
+    """Cache key of a preprocessing run: dataset fingerprint + selected columns + precision"""
+    if not state.get("data_fingerprint"):
+        return None
+    return make_cache_key("preprocess", state["data_fingerprint"], selected_columns, precision, stream)
+
+# Thông tin nguồn dữ liệu của từng session, không dùng chung qua result_cache
+_SESSION_PREPROCESSOR_FIELDS = ("filename", "sheet_names", "memory_savings", "original_shape")
+
+def _session_preprocessor(state, fitted):
+    """Copy of a (possibly cached) fitted preprocessor carrying this session's source info"""
+    preprocessor = copy.copy(fitted)
+    own = state.get("preprocessor")
+    if own is not None:
+        for field in _SESSION_PREPROCESSOR_FIELDS:
+            setattr(preprocessor, field, getattr(own, field))
+    return preprocessor
+
+def _raw_chunk_source(state, columns=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Picklable callable returning fresh raw DataFrame chunks of the session's data.
+
+    Uploads are read from their on-disk columnar copy; compacted uploads and
+    other sources (DW views, refits) from the session DataFrame, so values
+    and row order (dw_ids) match what was loaded. Raises 400 for columns the
+    session's data does not have.
+    """
+    if columns:
+        missing = [col for col in columns if col not in state["df"].columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {missing}")
+    upload = state.get("upload")
+    if upload is not None and not state.get("compact"):
+        return functools.partial(upload.iter_chunks, state.get("sheet_name"), columns, chunk_rows)
+    df = state["df"] if not columns else state["df"][list(columns)]
+    return functools.partial(iter_frame_chunks, df, chunk_rows)
+
+def _clustering_input(state, options):
+    """(X, chunk_source) for a clustering run: the scaled matrix, or chunks of a streamed preprocessing"""
+    if state.get("X_processed") is not None:
+        return state["X_processed"], None
+    preprocessor = state.get("preprocessor")
+    if not state.get("preprocess_stream") or preprocessor is None or preprocessor.scaler is None:
+        raise HTTPException(status_code=400, detail="Data not preprocessed")
+    if options["mode"] != "minibatch":
+        raise HTTPException(status_code=400, detail="Streamed preprocessing requires mode=minibatch")
+    raw_chunks = _raw_chunk_source(state, preprocessor.feature_columns, options["chunk_size"])
+    return None, functools.partial(preprocessor.stream, raw_chunks)
+
+def _kmeans_cache_key(state, options):
+    """Cache key of a clustering run: preprocessing key + K / auto-K options"""
+    if not state.get("preprocess_key"):
+        return None
+    # n_jobs không ảnh hưởng kết quả
+    options = {name: value for name, value in options.items() if name != "n_jobs"}
+    return make_cache_key("kmeans", state["preprocess_key"], options)
+
+def _cache_kmeans_result(cache_key, output):
+    """Cache a clustering result unless a time budget cut the K search short"""
+    k_info = output[1]
+    if not k_info.get("search", {}).get("budget_exhausted"):
+        result_cache.put(cache_key, output)
+
+def _get_fitted_model(state):
+    """Return the session's fitted (preprocessor, kmeans_engine) or raise 400"""
+    preprocessor = state.get("preprocessor")
+    kmeans_engine = state.get("kmeans_engine")
+    if preprocessor is None or preprocessor.scaler is None:
+        raise HTTPException(status_code=400, detail="Data not preprocessed")
+    if kmeans_engine is None:
+        raise HTTPException(status_code=400, detail="Clustering not performed")
+    return preprocessor, kmeans_engine
+
+def _predict_frames(preprocessor, kmeans_engine, frames, id_column, chunk_size, handle_unknown):
+    """Score an iterable of DataFrames in chunks with the fitted pipeline"""
+    unknown_counts = {}
+    labels, ids = [], []
+    for frame in frames:
+        if id_column:
+            if id_column not in frame.columns:
+                raise HTTPException(status_code=400, detail=f"ID column not found: {id_column}")
+            ids.extend(frame[id_column].tolist())
+        chunks = preprocessor.transform_chunks(frame, chunk_size, handle_unknown, unknown_counts)
+        labels.append(kmeans_engine.predict_chunks(chunks))
+    labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int32)
+    return labels, ids, unknown_counts
+
+def _predict_upload(upload, preprocessor, kmeans_engine, id_column, chunk_size, handle_unknown):
+    """Parse a spooled CSV/XLSX and score it; raises HTTPException 400 on bad input"""
+    if upload.is_csv:
+        # Đọc CSV theo chunk từ file spool, chỉ lấy các cột model cần
+        header = set(pd.read_csv(upload.source_path, nrows=0).columns)
+        missing = [col for col in preprocessor.feature_columns if col not in header]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {missing}")
+        if id_column and id_column not in header:
+            raise HTTPException(status_code=400, detail=f"ID column not found: {id_column}")
+        usecols = list(preprocessor.feature_columns)
+        if id_column and id_column not in usecols:
+            usecols.append(id_column)
+        frames = pd.read_csv(upload.source_path, usecols=usecols, chunksize=chunk_size)
+    else:
+        df, error = DataPreprocessor().load_upload(upload)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        frames = [df]
+    
+    try:
+        return _predict_frames(preprocessor, kmeans_engine, frames, id_column, chunk_size, handle_unknown)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _prediction_response(labels, ids, unknown_counts, n_clusters, include_labels):
+    """Build the /predict response body"""
+    counts = np.bincount(labels, minlength=n_clusters) if len(labels) else np.zeros(n_clusters, dtype=int)
+    result = {
+        "status": "success",
+        "n_rows": int(len(labels)),
+        "cluster_counts": {int(i): int(c) for i, c in enumerate(counts)},
+        "unknown_categories": unknown_counts
+    }
+    if include_labels:
+        result["labels"] = labels
+        if ids:
+            result["ids"] = ids
+    return result
 
 # ==================== ENDPOINTS ====================
 
@@ -84,31 +387,24 @@ def read_root():
 @app.get("/session")
 def create_session():
     """Create a new session and return session ID"""
-    session_id = str(uuid.uuid4())
-    get_session(session_id)  # Initialize empty session
+    session_id, _ = session_manager.create()
     return {"session_id": session_id}
 
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    compact: bool = Form(False),
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
     """Upload CSV or XLSX file"""
     try:
         # Generate session ID if not provided
         session_id = x_session_id or str(uuid.uuid4())
-        state = get_session(session_id)
+        # Session store có thể là SQLite + file: không chặn event loop
+        state = await run_in_threadpool(get_session, session_id, True)
         
-        content = await file.read()
         filename = file.filename
         
-        # Validate file size
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB"
-            )
-        
         # Validate file extension
         if not filename.lower().endswith(('.csv', '.xlsx', '.xls')):
             raise HTTPException(
@@ -116,24 +412,25 @@ async def upload_file(
                 detail="Invalid file type. Only CSV and Excel files are supported."
             )
         
-        preprocessor = DataPreprocessor()
+        # Ghi file xuống đĩa theo từng chunk (giới hạn MAX_FILE_SIZE)
+        try:
+            upload = await SpooledUpload.receive(file, max_bytes=MAX_FILE_SIZE)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Store file content for reloading with different sheet
-        state["file_content"] = content
-        state["filename"] = filename
-        
-        df, error = preprocessor.load_file(content, filename)
+        # Parse CSV/XLSX chặn CPU: chạy trong threadpool, không chặn event loop
+        preprocessor, df, error = await run_in_threadpool(_parse_upload, upload, compact)
         
         if error:
+            upload.remove()
             raise HTTPException(status_code=400, detail=error)
         
-        state["df"] = df
-        state["preprocessor"] = preprocessor
+        # Giữ bản trên đĩa để đổi sheet
+        await run_in_threadpool(_store_upload, state, upload, filename, compact, df, preprocessor)
         
         # Get column info
-        column_info = preprocessor.get_column_info(df)
+        column_info = await run_in_threadpool(preprocessor.get_column_info, df)
         
-        # Convert to JSON string with custom encoder, then parse back to dict
         result = {
             "status": "success",
             "session_id": session_id,
@@ -141,8 +438,25 @@ async def upload_file(
             "data": column_info,
             "has_sheets": len(preprocessor.get_sheet_names()) > 1
         }
-        result_json = json.loads(json.dumps(result, cls=NumpyEncoder))
-        return JSONResponse(content=result_json)
+        return FastJSONResponse(content=result)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/sheets")
+def get_sheets(x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
+    """List sheets of the uploaded workbook with their dimensions and header names"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        
+        upload = state.get("upload")
+        if upload is None:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        
+        return {"status": "success", "sheets": upload.sheets_info()}
     
     except HTTPException:
         raise
@@ -152,6 +466,7 @@ async def upload_file(
 @app.post("/select-sheet")
 def select_sheet(
     sheet_name: str,
+    compact: Optional[bool] = None,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
     """Select a specific sheet from uploaded Excel file"""
@@ -159,24 +474,27 @@ def select_sheet(
         session_id = x_session_id or "default"
         state = get_session(session_id)
         
-        if not state.get("file_content"):
+        upload = state.get("upload")
+        if upload is None:
             raise HTTPException(status_code=400, detail="No file uploaded")
         
-        content = state["file_content"]
-        filename = state["filename"]
-        
-        if not filename.lower().endswith(('.xlsx', '.xls')):
+        if upload.is_csv:
             raise HTTPException(status_code=400, detail="Sheet selection only available for Excel files")
         
         preprocessor = DataPreprocessor()
-        df, error = preprocessor.load_file(content, filename, sheet_name=sheet_name)
+        df, error = preprocessor.load_upload(upload, sheet_name=sheet_name)
         
         if error:
             raise HTTPException(status_code=400, detail=error)
         
-        state["df"] = df
-        state["preprocessor"] = preprocessor
-        state["X_processed"] = None  # Reset processed data
+        # Mặc định giữ lựa chọn compact của lần upload
+        if compact is None:
+            compact = state.get("compact", False)
+        if compact:
+            df = preprocessor.compact(df)
+        
+        _set_loaded_data(state, df, preprocessor)
+        state["sheet_name"] = sheet_name
         
         column_info = preprocessor.get_column_info(df)
         
@@ -185,8 +503,7 @@ def select_sheet(
             "sheet_name": sheet_name,
             "data": column_info
         }
-        result_json = json.loads(json.dumps(result, cls=NumpyEncoder))
-        return JSONResponse(content=result_json)
+        return FastJSONResponse(content=result)
     
     except HTTPException:
         raise
@@ -206,21 +523,46 @@ def preprocess_data(
         if state["df"] is None:
             raise HTTPException(status_code=400, detail="No data uploaded")
         
-        preprocessor = state["preprocessor"]
         df = state["df"]
+        cache_key = _preprocess_cache_key(
+            state, request.selected_columns, request.precision, request.stream
+        )
+        cached = result_cache.get(cache_key)
         
-        # Get processed data
-        df_work = preprocessor.get_processed_df(df, request.selected_columns)
-        X_processed, result = preprocessor.preprocess(df, request.selected_columns)
-        
-        if X_processed is None:
-            raise HTTPException(status_code=400, detail=result["error"])
+        if cached is not None:
+            preprocessor, X_processed, result = cached
+        else:
+            # Fit trên bản copy: preprocessor trong cache có thể đang được session khác dùng
+            preprocessor = copy.copy(state["preprocessor"])
+            
+            if request.stream:
+                # Fit theo chunk từ nguồn dữ liệu, không tạo ma trận n x p
+                X_processed = None
+                result = preprocessor.preprocess_chunks(
+                    _raw_chunk_source(state, request.selected_columns),
+                    request.selected_columns, request.precision
+                )
+            else:
+                # Fit pipeline một lần: fill, encode, scale
+                X_processed, result = preprocessor.preprocess(
+                    df, request.selected_columns, request.precision
+                )
+            
+            if result["status"] == "failed":
+                raise HTTPException(status_code=400, detail=result["error"])
+            result_cache.put(cache_key, (preprocessor, X_processed, result))
         
         state["X_processed"] = X_processed
         state["selected_columns"] = request.selected_columns or df.columns.tolist()
+        # Cache hit: preprocessor có thể do session khác fit
+        state["preprocessor"] = _session_preprocessor(state, preprocessor)
+        state["preprocess_key"] = cache_key
+        state["preprocess_stream"] = request.stream
+        state["result_version"] = uuid.uuid4().hex  # tên feature trong kết luận đổi theo
         
         return {
             "status": "success",
+            "cached": cached is not None,
             "processed_data": result
         }
     
@@ -232,46 +574,229 @@ def preprocess_data(
 @app.post("/kmeans")
 def run_kmeans(
     request: KMeansRequest,
-    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
+    accept: Optional[str] = Header(None)
 ):
-    """Run K-means clustering"""
+    """
+    Run K-means clustering.
+
+    With "Accept: application/x-kpdl-columnar" the points are returned as a
+    binary columnar payload (see columnar.py) instead of nested JSON lists.
+    """
     try:
         session_id = x_session_id or "default"
         state = get_session(session_id)
         
-        if state["X_processed"] is None:
-            raise HTTPException(status_code=400, detail="Data not preprocessed")
+        options = request.model_dump()
+        X, chunk_source = _clustering_input(state, options)
+        feature_names = state["selected_columns"]
+        
+        cache_key = _kmeans_cache_key(state, options)
+        output = result_cache.get(cache_key)
+        cached = output is not None
+        if not cached:
+            try:
+                output = run_clustering(X, feature_names, chunk_source=chunk_source, **options)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            _cache_kmeans_result(cache_key, output)
+        kmeans_engine, k_info, fit_result, cluster_stats = output
+        
+        _set_clustering(state, kmeans_engine, cluster_stats, k_info, fit_result)
+        
+        if wants_columnar(accept):
+            meta = {
+                "status": "success",
+                "cached": cached,
+                "k_info": k_info,
+                "fit_info": fit_result,
+                "metrics": kmeans_engine.get_metrics(),
+                "statistics": cluster_stats
+            }
+            payload = pack_columnar(kmeans_engine.get_columnar_results(), meta)
+            return Response(content=payload, media_type=COLUMNAR_MEDIA_TYPE)
+        
+        response = _kmeans_response(kmeans_engine, k_info, fit_result, cluster_stats)
+        response["cached"] = cached
+        return FastJSONResponse(content=response)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict")
+def predict(
+    request: PredictRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Assign new rows (JSON array or DW view) to the session's fitted clusters"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        preprocessor, kmeans_engine = _get_fitted_model(state)
         
-        X = state["X_processed"]
-        kmeans_engine = KMeansEngine()
+        if (request.rows is None) == (request.view_name is None):
+            raise HTTPException(status_code=400, detail="Provide exactly one of rows or view_name")
+        if request.chunk_size < 1:
+            raise HTTPException(status_code=400, detail="chunk_size must be positive")
         
-        # Auto-select K or use provided K
-        if request.auto_k:
-            k, scores = kmeans_engine.auto_select_k(X)
-            k_info = {"method": "auto", "selected_k": k, "scores": scores}
+        if request.rows is not None:
+            df = pd.DataFrame.from_records(request.rows)
         else:
-            k = request.k or 3
-            k_info = {"method": "manual", "selected_k": k}
+            if not state.get("dw_connector"):
+                raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server. Gọi /dw/views trước.")
+            # Chỉ lấy các cột model cần từ DW
+            columns = list(preprocessor.feature_columns)
+            if request.id_column and request.id_column not in columns:
+                columns.append(request.id_column)
+            df, error = state["dw_connector"].load_view(request.view_name, columns=columns)
+            if error:
+                raise HTTPException(status_code=400, detail=error)
+        
+        try:
+            labels, ids, unknown_counts = _predict_frames(
+                preprocessor, kmeans_engine, [df], request.id_column,
+                request.chunk_size, request.handle_unknown
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return FastJSONResponse(content=_prediction_response(
+            labels, ids, unknown_counts, len(kmeans_engine.centroids), request.include_labels
+        ))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/upload")
+async def predict_upload(
+    file: UploadFile = File(...),
+    id_column: Optional[str] = Form(None),
+    chunk_size: int = Form(100000),
+    handle_unknown: str = Form("mode"),
+    include_labels: bool = Form(True),
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Assign rows of an uploaded CSV/XLSX file to the session's fitted clusters"""
+    try:
+        session_id = x_session_id or "default"
+        state = await run_in_threadpool(get_session, session_id)
+        preprocessor, kmeans_engine = await run_in_threadpool(_get_fitted_model, state)
         
-        # Fit model
-        fit_result = kmeans_engine.fit(X, k)
+        filename = file.filename
         
-        # Get clustering results
-        clustering_results = kmeans_engine.get_results()
+        if chunk_size < 1:
+            raise HTTPException(status_code=400, detail="chunk_size must be positive")
+        if not filename.lower().endswith(('.csv', '.xlsx', '.xls')):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid file type. Only CSV and Excel files are supported."
+            )
         
-        # Get cluster statistics
-        feature_names = state["selected_columns"]
-        cluster_stats = kmeans_engine.get_cluster_statistics(X, feature_names)
+        try:
+            upload = await SpooledUpload.receive(file, max_bytes=MAX_FILE_SIZE)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        state["kmeans_engine"] = kmeans_engine
-        state["cluster_stats"] = cluster_stats
+        try:
+            labels, ids, unknown_counts = await run_in_threadpool(
+                _predict_upload, upload, preprocessor, kmeans_engine, id_column, chunk_size, handle_unknown
+            )
+        finally:
+            upload.remove()
+        
+        return FastJSONResponse(content=_prediction_response(
+            labels, ids, unknown_counts, len(kmeans_engine.centroids), include_labels
+        ))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/models")
+def save_model(
+    request: SaveModelRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Persist the session's fitted model to the on-disk registry"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        preprocessor, kmeans_engine = _get_fitted_model(state)
+        
+        try:
+            model_id, version = model_registry.save(
+                preprocessor, kmeans_engine, state.get("cluster_stats"),
+                model_id=request.model_id, description=request.description
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        state["model_id"] = model_id
+        state["model_version"] = version
+        return {"status": "success", "model_id": model_id, "version": version}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models")
+def list_models():
+    """List models saved in the registry"""
+    try:
+        return {"status": "success", "models": model_registry.list_models()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models/{model_id}")
+def get_model(model_id: str, version: Optional[int] = None):
+    """Get the manifest of a saved model version"""
+    try:
+        return {"status": "success", "manifest": model_registry.get_manifest(model_id, version)}
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/models/{model_id}/load")
+def load_model(
+    model_id: str,
+    version: Optional[int] = None,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Pin a saved model into the session (no refit)"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id, create=True)
+        
+        try:
+            preprocessor, kmeans_engine, cluster_stats, manifest = model_registry.load(model_id, version)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        
+        state["preprocessor"] = preprocessor
+        _set_clustering(
+            state, kmeans_engine, cluster_stats,
+            {"method": "loaded", "selected_k": manifest["k"]}, None
+        )
+        state["selected_columns"] = manifest["feature_columns"]
+        state["X_processed"] = None
+        state["preprocess_key"] = None
+        state["preprocess_stream"] = False
+        state["model_id"] = model_id
+        state["model_version"] = manifest["version"]
         
         return {
             "status": "success",
-            "k_info": k_info,
-            "fit_info": fit_result,
-            "clustering": clustering_results,
-            "statistics": cluster_stats
+            "model_id": model_id,
+            "version": manifest["version"],
+            "k": manifest["k"],
+            "metrics": manifest["metrics"]
         }
     
     except HTTPException:
@@ -279,8 +804,98 @@ def run_kmeans(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/kmeans/result")
+def get_kmeans_result(
+    request: Request,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Latest clustering result of the session (same body as POST /kmeans), revalidated by ETag"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        
+        if not state.get("kmeans_engine"):
+            raise HTTPException(status_code=400, detail="Clustering not performed")
+        
+        etag = _result_etag(state, "kmeans")
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        info = state.get("kmeans_info") or {}
+        response = _kmeans_response(
+            state["kmeans_engine"], info.get("k_info"), info.get("fit_info"), state["cluster_stats"]
+        )
+        return _cacheable_response(response, etag)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/kmeans/lod")
+def get_kmeans_lod(
+    request: Request,
+    x_min: Optional[float] = None,
+    x_max: Optional[float] = None,
+    y_min: Optional[float] = None,
+    y_max: Optional[float] = None,
+    resolution: int = 256,
+    mode: str = "bins",
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID"),
+    accept: Optional[str] = Header(None)
+):
+    """Level-of-detail PCA scatter: density bins or decimated samples for a viewport"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        
+        if not state.get("kmeans_engine"):
+            raise HTTPException(status_code=400, detail="Clustering not performed")
+        
+        if not 1 <= resolution <= MAX_LOD_RESOLUTION:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Resolution must be between 1 and {MAX_LOD_RESOLUTION}"
+            )
+        
+        bounds = (x_min, x_max, y_min, y_max)
+        if any(v is None for v in bounds) and any(v is not None for v in bounds):
+            raise HTTPException(status_code=400, detail="Viewport requires x_min, x_max, y_min and y_max")
+        viewport = None if bounds[0] is None else bounds
+        
+        columnar = wants_columnar(accept)
+        # Mỗi viewport / resolution / mode / định dạng là một representation riêng
+        view_key = make_cache_key("lod", bounds, resolution, mode, columnar)[:16]
+        etag = _result_etag(state, f"lod-{view_key}")
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        try:
+            lod = state["kmeans_engine"].get_level_of_detail(viewport, resolution, mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        columns = {name: lod.pop(name) for name in ("x", "y", "label", "count")}
+        if columnar:
+            headers = {"ETag": etag, **CACHE_HEADERS} if etag else None
+            return Response(
+                content=pack_columnar(columns, lod), media_type=COLUMNAR_MEDIA_TYPE, headers=headers
+            )
+        
+        lod["status"] = "success"
+        lod["points"] = columns
+        return _cacheable_response(lod, etag)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/conclusion")
 def get_conclusion(
+    request: Request,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
     """Generate automatic conclusions"""
@@ -291,6 +906,16 @@ def get_conclusion(
         if state["cluster_stats"] is None:
             raise HTTPException(status_code=400, detail="Clustering not performed")
         
+        etag = _result_etag(state, "conclusion")
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        # Kết luận chỉ đổi khi result_version đổi: tính một lần cho mỗi version
+        cached = state.get("conclusion_cache")
+        if etag and cached is not None and cached[0] == state["result_version"]:
+            return _cacheable_response({"status": "success", "conclusions": cached[1]}, etag)
+        
         feature_names = state["selected_columns"]
         cluster_stats = state["cluster_stats"]
         
@@ -307,11 +932,13 @@ def get_conclusion(
         # Generate conclusions with metrics
         conclusion_engine = ConclusionEngine(feature_names, cluster_stats, metrics)
         conclusions = conclusion_engine.get_all_conclusions()
+        if etag:
+            state["conclusion_cache"] = (state["result_version"], conclusions)
         
-        return {
+        return _cacheable_response({
             "status": "success",
             "conclusions": conclusions
-        }
+        }, etag)
     
     except HTTPException:
         raise
@@ -320,6 +947,7 @@ def get_conclusion(
 
 @app.get("/export")
 def export_results(
+    request: Request,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
     """Export clustering results as JSON for CSV conversion"""
@@ -330,6 +958,11 @@ def export_results(
         if state["cluster_stats"] is None:
             raise HTTPException(status_code=400, detail="Clustering not performed")
         
+        etag = _result_etag(state, "export")
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
         # Prepare export data
         export_data = {
             "clusters": [],
@@ -354,8 +987,7 @@ def export_results(
                 "n_clusters": len(state["cluster_stats"])
             }
         
-        result_json = json.loads(json.dumps(export_data, cls=NumpyEncoder))
-        return JSONResponse(content=result_json)
+        return _cacheable_response(export_data, etag)
     
     except HTTPException:
         raise
@@ -376,19 +1008,262 @@ def reset_state(
 
 class DWConnectionRequest(BaseModel):
     connection_string: str
+    search: Optional[str] = None
+    prefix: Optional[str] = None
+    refresh: bool = False  # bỏ qua cache metadata, truy vấn lại INFORMATION_SCHEMA
+
+class DWFilter(BaseModel):
+    column: str
+    op: str = "="  # =, !=, <, <=, >, >=, like, in, not in, is null, is not null
+    value: Optional[Any] = None
 
 class DWLoadRequest(BaseModel):
     view_name: str
     id_column: Optional[str] = "respondentID"
+    compact: bool = False  # downcast dtype để giảm bộ nhớ session
+    columns: Optional[List[str]] = None  # chỉ SELECT các cột này
+    filters: Optional[List[DWFilter]] = None
+    chunk_size: int = 10000  # số dòng mỗi lần fetchmany
+    watermark_column: Optional[str] = None  # cột tăng dần cho /dw/refresh (rowversion, ngày sửa, ID)
 
 class DWSaveRequest(BaseModel):
     table_name: Optional[str] = "Fact_Clustering_Result"
+    batch_size: int = 10000  # số dòng mỗi lô fast_executemany
+
+class DWRefreshRequest(BaseModel):
+    view_name: Optional[str] = None  # mặc định: view, cột ID, cột watermark của lần /dw/load trước
+    id_column: Optional[str] = None
+    watermark_column: Optional[str] = None
+    since: Optional[Any] = None  # ghi đè watermark đang lưu (rowversion dạng "0x...")
+    table_name: Optional[str] = "Fact_Clustering_Result"
+    batch_size: int = 10000
+    chunk_size: int = 10000
+    max_inertia_ratio: float = 1.25  # khoảng cách TB tới tâm cụm của dòng mới / lúc fit
+    max_size_shift: float = 0.1  # total variation distance giữa tỉ lệ các cụm
+    auto_refit: bool = True  # vượt ngưỡng -> load toàn bộ view, fit lại, ghi đè bảng kết quả
+    refit_mode: str = "full"  # full | minibatch
+
+def _dw_save_inputs(state):
+    """Connector, IDs and cluster labels for writing a clustering run back to the DW"""
+    if not state.get("dw_connector"):
+        raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server")
+    
+    if not state.get("kmeans_engine"):
+        raise HTTPException(status_code=400, detail="Chưa chạy K-Means clustering")
+    
+    if not state.get("dw_ids"):
+        raise HTTPException(status_code=400, detail="Không có ID column để map kết quả")
+    
+    respondent_ids, cluster_ids = state["dw_ids"], state["kmeans_engine"].labels.tolist()
+    refreshed = state.get("dw_refreshed")
+    if refreshed:
+        # Gộp các dòng /dw/refresh đã upsert (nhãn mới nhất theo ID), nếu không
+        # lần ghi đè bảng kế tiếp sẽ xóa chúng
+        merged = dict(zip(respondent_ids, cluster_ids))
+        merged.update(refreshed)
+        respondent_ids, cluster_ids = list(merged), list(merged.values())
+    return state["dw_connector"], respondent_ids, cluster_ids
+
+# ==================== JOB ENDPOINTS ====================
+
+def _store_in_session(session_id, values):
+    """Write job outputs into the session if it is still alive"""
+    state = session_manager.get(session_id)
+    if state is not None:
+        for key, value in values.items():
+            state[key] = value
+
+@app.post("/jobs/preprocess")
+def submit_preprocess_job(
+    request: PreprocessRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Submit preprocessing as a background job"""
+    session_id = x_session_id or "default"
+    state = get_session(session_id)
+    
+    if state["df"] is None:
+        raise HTTPException(status_code=400, detail="No data uploaded")
+    
+    df = state["df"]
+    selected_columns = request.selected_columns
+    cache_key = _preprocess_cache_key(state, selected_columns, request.precision, request.stream)
+    
+    def on_success(output):
+        preprocessor, X_processed, result = output
+        if result["status"] == "failed":
+            raise ValueError(result["error"])
+        result_cache.put(cache_key, output)
+        _store_in_session(session_id, {
+            "preprocessor": _session_preprocessor(state, preprocessor),
+            "X_processed": X_processed,
+            "selected_columns": selected_columns or df.columns.tolist(),
+            "preprocess_key": cache_key,
+            "preprocess_stream": request.stream,
+            "result_version": uuid.uuid4().hex
+        })
+        return {"status": "success", "processed_data": result}
+    
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        job_id = job_manager.complete("preprocess", session_id, on_success(cached))
+        return {"status": "succeeded", "cached": True, "job_id": job_id}
+    
+    # Chế độ stream: worker đọc chunk từ nguồn thay vì nhận cả DataFrame
+    chunk_source = _raw_chunk_source(state, selected_columns) if request.stream else None
+    job_id = job_manager.submit(
+        "preprocess", session_id, preprocess_task,
+        (state["preprocessor"], None if request.stream else df, selected_columns,
+         request.precision, chunk_source), on_success
+    )
+    return {"status": "queued", "job_id": job_id}
+
+@app.post("/jobs/kmeans")
+def submit_kmeans_job(
+    request: KMeansRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Submit K-means clustering as a background job"""
+    session_id = x_session_id or "default"
+    state = get_session(session_id)
+    
+    options = request.model_dump()
+    X, chunk_source = _clustering_input(state, options)
+    # Job đã chạy trong process pool riêng: mặc định không mở thêm pool con
+    if options["n_jobs"] is None:
+        options["n_jobs"] = 1
+    
+    cache_key = _kmeans_cache_key(state, options)
+    
+    def on_success(output):
+        kmeans_engine, k_info, fit_result, cluster_stats = output
+        _cache_kmeans_result(cache_key, output)
+        # Cùng đường ghi với /kmeans (reset cả nhãn /dw/refresh của model cũ)
+        live_state = session_manager.get(session_id)
+        if live_state is not None:
+            _set_clustering(live_state, kmeans_engine, cluster_stats, k_info, fit_result)
+        return _kmeans_response(kmeans_engine, k_info, fit_result, cluster_stats)
+    
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        job_id = job_manager.complete("kmeans", session_id, on_success(cached))
+        return {"status": "succeeded", "cached": True, "job_id": job_id}
+    
+    job_id = job_manager.submit(
+        "kmeans", session_id, kmeans_task,
+        (X, state["selected_columns"], {**options, "chunk_source": chunk_source}), on_success
+    )
+    return {"status": "queued", "job_id": job_id}
+
+@app.post("/jobs/dw-save")
+def submit_dw_save_job(
+    request: DWSaveRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Submit writing clustering results back to SQL Server as a background job"""
+    session_id = x_session_id or "default"
+    state = get_session(session_id)
+    connector, respondent_ids, cluster_ids = _dw_save_inputs(state)
+    
+    def on_success(output):
+        message, save_stats = output
+        return {
+            "status": "success",
+            "message": message,
+            "table_name": request.table_name,
+            "records_saved": len(respondent_ids),
+            "save_stats": save_stats
+        }
+    
+    job_id = job_manager.submit(
+        "dw_save", session_id, save_clusters_task,
+        (connector, respondent_ids, cluster_ids, request.table_name, request.batch_size),
+        on_success
+    )
+    return {"status": "queued", "job_id": job_id}
+
+@app.get("/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Job status, latest progress and result when finished (only for the job's own session)"""
+    job = job_manager.get(job_id, x_session_id or "default")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(content=job)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Server-Sent Events stream of job progress until the job finishes"""
+    session_id = x_session_id or "default"
+    if await run_in_threadpool(job_manager.get, job_id, session_id, False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        last = None
+        while True:
+            job = await run_in_threadpool(job_manager.get, job_id, session_id, False)
+            if job is None:
+                break
+            snapshot = (job["status"], dump_json(job["progress"]))
+            if snapshot != last:
+                last = snapshot
+                yield f"event: progress\ndata: {dump_json(job).decode('utf-8')}\n\n"
+            if job["status"] in TERMINAL_STATES:
+                yield f"event: done\ndata: {json.dumps({'status': job['status']})}\n\n"
+                break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(
+    job_id: str,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """Cancel a queued or running job of the caller's session"""
+    session_id = x_session_id or "default"
+    if job_manager.get(job_id, session_id, include_result=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    cancelled = job_manager.cancel(job_id, session_id)
+    return {"status": "cancelling" if cancelled else "finished", "job_id": job_id}
+
+
+# ==================== ADMIN ENDPOINTS ====================
+
+@app.get("/admin/sessions")
+def list_sessions():
+    """Report live sessions and their memory footprint"""
+    return {"status": "success", **session_manager.stats()}
+
+
+@app.get("/admin/db-pools")
+def get_db_pool_stats():
+    """Report DW connection pool usage in this worker process"""
+    return {"status": "success", "pools": pool_stats(), "schema_cache": schema_cache_stats()}
+
+
+@app.get("/admin/cache")
+def get_cache_stats():
+    """Report result cache size and hit/miss counters"""
+    return {"status": "success", **result_cache.stats()}
+
+@app.delete("/admin/cache")
+def clear_cache():
+    """Drop every cached preprocessing / clustering result"""
+    result_cache.clear()
+    return {"status": "success"}
+
 
 @app.post("/dw/test-connection")
 def test_dw_connection(request: DWConnectionRequest):
     """Test kết nối SQL Server"""
     try:
-        connector = SQLServerConnector(request.connection_string)
+        connector = create_connector(request.connection_string)
         success, message = connector.test_connection()
         
         if success:
@@ -405,19 +1280,19 @@ def get_dw_views(
     request: DWConnectionRequest,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
-    """Lấy danh sách views và tables từ SQL Server"""
+    """Lấy danh sách views và tables từ DW (SQL Server hoặc file SQLite)"""
     try:
         session_id = x_session_id or str(uuid.uuid4())
-        state = get_session(session_id)
+        state = get_session(session_id, create=True)
         
-        connector = SQLServerConnector(request.connection_string)
+        connector = create_connector(request.connection_string)
         success, msg = connector.connect()
         
         if not success:
             raise HTTPException(status_code=400, detail=msg)
         
-        views, view_error = connector.get_views()
-        tables, table_error = connector.get_tables()
+        views, view_error = connector.get_views(request.search, request.prefix, request.refresh)
+        tables, table_error = connector.get_tables(request.search, request.prefix, request.refresh)
         
         # Lưu connector vào session
         state["dw_connector"] = connector
@@ -426,6 +1301,7 @@ def get_dw_views(
         return {
             "status": "success",
             "session_id": session_id,
+            "backend": connector.backend,
             "views": views,
             "tables": tables,
             "errors": {
@@ -453,8 +1329,16 @@ def load_dw_view(
         
         connector = state["dw_connector"]
         
-        # Load dữ liệu từ view
-        df, error = connector.load_view(request.view_name)
+        # Load dữ liệu từ view, chỉ lấy các cột cần (kèm cột ID)
+        columns = request.columns
+        if columns:
+            for extra in (request.id_column, request.watermark_column):
+                if extra and extra not in columns:
+                    columns = columns + [extra]
+        filters = [f.model_dump() for f in request.filters] if request.filters else None
+        df, error = connector.load_view(
+            request.view_name, columns=columns, filters=filters, chunk_size=request.chunk_size
+        )
         
         if error:
             raise HTTPException(status_code=400, detail=error)
@@ -464,23 +1348,35 @@ def load_dw_view(
             state["dw_id_column"] = request.id_column
             state["dw_ids"] = df[request.id_column].tolist()
         
+        # Watermark cho lần refresh tăng dần tiếp theo
+        if request.watermark_column and request.watermark_column not in df.columns:
+            raise HTTPException(status_code=400, detail=f"Không tìm thấy cột watermark: {request.watermark_column}")
+        state["dw_watermark_column"] = request.watermark_column
+        state["dw_watermark"] = (
+            max_watermark(df[request.watermark_column]) if request.watermark_column else None
+        )
+        
         # Tạo preprocessor và lưu vào session
         preprocessor = DataPreprocessor()
         preprocessor.original_shape = df.shape
+        if request.compact:
+            df = preprocessor.compact(df)
         
-        state["df"] = df
-        state["preprocessor"] = preprocessor
+        _replace_upload(state, None)
+        _set_loaded_data(state, df, preprocessor)
         state["dw_view_name"] = request.view_name
         
         # Get column info
         column_info = preprocessor.get_column_info(df)
         
-        return {
+        return FastJSONResponse(content={
             "status": "success",
             "session_id": session_id,
             "view_name": request.view_name,
+            "load_stats": connector.last_load_stats,
+            "watermark": watermark_to_json(state.get("dw_watermark")) if request.watermark_column else None,
             "data": column_info
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -496,25 +1392,14 @@ def save_clusters_to_dw(
         session_id = x_session_id or "default"
         state = get_session(session_id)
         
-        if not state.get("dw_connector"):
-            raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server")
-        
-        if not state.get("kmeans_engine"):
-            raise HTTPException(status_code=400, detail="Chưa chạy K-Means clustering")
-        
-        if not state.get("dw_ids"):
-            raise HTTPException(status_code=400, detail="Không có ID column để map kết quả")
-        
-        connector = state["dw_connector"]
-        kmeans_engine = state["kmeans_engine"]
-        respondent_ids = state["dw_ids"]
-        cluster_ids = kmeans_engine.labels.tolist()
+        connector, respondent_ids, cluster_ids = _dw_save_inputs(state)
         
         # Lưu vào SQL Server
         success, message = connector.save_clustering_result(
             respondent_ids,
             cluster_ids,
-            request.table_name
+            request.table_name,
+            batch_size=request.batch_size
         )
         
         if success:
@@ -522,7 +1407,8 @@ def save_clusters_to_dw(
                 "status": "success",
                 "message": message,
                 "table_name": request.table_name,
-                "records_saved": len(respondent_ids)
+                "records_saved": len(respondent_ids),
+                "save_stats": connector.last_save_stats
             }
         else:
             raise HTTPException(status_code=400, detail=message)
@@ -531,9 +1417,160 @@ def save_clusters_to_dw(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _refit_from_view(state, connector, request, view_name, id_column, watermark_column):
+    """Full reload + refit with the current feature columns and K; returns (df, labels, fit_info)"""
+    preprocessor = state["preprocessor"]
+    features = list(preprocessor.feature_columns)
+    columns = features + [c for c in (id_column, watermark_column) if c not in features]
+    df, error = connector.load_view(view_name, columns=columns, chunk_size=request.chunk_size)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    refit_preprocessor = DataPreprocessor()
+    refit_preprocessor.original_shape = df.shape
+    X_processed, result = refit_preprocessor.preprocess(df, features, preprocessor.precision)
+    if X_processed is None:
+        raise HTTPException(status_code=400, detail=result["error"])
+    try:
+        kmeans_engine, k_info, fit_result, cluster_stats = run_clustering(
+            X_processed, features, k=len(state["kmeans_engine"].centroids),
+            mode=request.refit_mode, chunk_size=request.chunk_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Session chuyển sang dữ liệu đầy đủ và model mới
+    _replace_upload(state, None)
+    _set_loaded_data(state, df, refit_preprocessor)
+    state["X_processed"] = X_processed
+    state["selected_columns"] = features
+    _set_clustering(state, kmeans_engine, cluster_stats, k_info, fit_result)
+    state["dw_view_name"] = view_name
+    state["dw_id_column"] = id_column
+    state["dw_ids"] = df[id_column].tolist()
+    return df, kmeans_engine.labels, fit_result
+
+@app.post("/dw/refresh")
+def refresh_dw_clusters(
+    request: DWRefreshRequest,
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """
+    Refresh tăng dần: chỉ load các dòng có watermark lớn hơn lần trước, gán
+    vào tâm cụm hiện có và upsert đúng các dòng đó. Khi độ lệch (inertia hoặc
+    tỉ lệ cụm) vượt ngưỡng và auto_refit, load toàn bộ view và fit lại.
+    """
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        
+        if not state.get("dw_connector"):
+            raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server. Gọi /dw/views trước.")
+        preprocessor, kmeans_engine = _get_fitted_model(state)
+        connector = state["dw_connector"]
+        
+        view_name = request.view_name or state.get("dw_view_name")
+        id_column = request.id_column or state.get("dw_id_column")
+        watermark_column = request.watermark_column or state.get("dw_watermark_column")
+        if not view_name or not id_column or not watermark_column:
+            raise HTTPException(status_code=400, detail="Thiếu view_name, id_column hoặc watermark_column")
+        if request.refit_mode not in ("full", "minibatch"):
+            raise HTTPException(status_code=400, detail=f"Unknown mode: {request.refit_mode}")
+        since = watermark_from_json(request.since) if request.since is not None else state.get("dw_watermark")
+        if since is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Chưa có watermark. Gọi /dw/load với watermark_column hoặc truyền since."
+            )
+        
+        # Delta: chỉ các cột model cần + ID + watermark, lọc phía server
+        features = list(preprocessor.feature_columns)
+        columns = features + [c for c in (id_column, watermark_column) if c not in features]
+        df, error = connector.load_view(
+            view_name, columns=columns,
+            filters=[{"column": watermark_column, "op": ">", "value": since}],
+            chunk_size=request.chunk_size
+        )
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        load_stats = connector.last_load_stats
+        
+        response = {
+            "status": "success",
+            "view_name": view_name,
+            "mode": "incremental",
+            "n_rows": int(len(df)),
+            "previous_watermark": watermark_to_json(since),
+            "watermark": watermark_to_json(since),
+            "drift": None,
+            "refit_required": False,
+            "load_stats": load_stats,
+            "save_stats": None
+        }
+        if df.empty:
+            state["dw_watermark"] = since
+            return response
+        
+        try:
+            chunks = preprocessor.transform_chunks(df, request.chunk_size)
+            labels, sq_distances = kmeans_engine.predict_chunks(chunks, return_distances=True)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        drift = kmeans_engine.assignment_drift(labels, sq_distances)
+        drift["max_inertia_ratio"] = request.max_inertia_ratio
+        drift["max_size_shift"] = request.max_size_shift
+        refit_required = bool(
+            (drift["inertia_ratio"] is not None and drift["inertia_ratio"] > request.max_inertia_ratio)
+            or (drift["size_shift"] is not None and drift["size_shift"] > request.max_size_shift)
+        )
+        response["drift"] = drift
+        response["refit_required"] = refit_required
+        
+        if refit_required and request.auto_refit:
+            df, labels, fit_info = _refit_from_view(
+                state, connector, request, view_name, id_column, watermark_column
+            )
+            response["mode"] = "refit"
+            response["fit_info"] = fit_info
+            response["refit_load_stats"] = connector.last_load_stats
+            delete_missing = True
+        else:
+            delete_missing = False
+        
+        success, message = connector.save_clustering_result(
+            df[id_column].tolist(), labels.tolist(), request.table_name,
+            batch_size=request.batch_size, delete_missing=delete_missing
+        )
+        if not success:
+            raise HTTPException(status_code=400, detail=message)
+        
+        # Chỉ tiến watermark sau khi ghi thành công (delta đã lọc > since phía server)
+        watermark = max_watermark(df[watermark_column])
+        state["dw_watermark"] = watermark if watermark is not None else since
+        state["dw_watermark_column"] = watermark_column
+        if not delete_missing:
+            # Ghi lại nhãn của delta để /dw/save-clusters sau đó giữ các dòng này
+            refreshed = dict(state.get("dw_refreshed") or {})
+            refreshed.update(zip(df[id_column].tolist(), labels.tolist()))
+            state["dw_refreshed"] = refreshed
+        
+        response["watermark"] = watermark_to_json(state["dw_watermark"])
+        response["records_saved"] = int(len(df))
+        response["save_stats"] = connector.last_save_stats
+        response["cluster_counts"] = {
+            int(i): int(c) for i, c in enumerate(np.bincount(labels, minlength=len(state["kmeans_engine"].centroids)))
+        }
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/dw/columns/{view_name:path}")
 def get_view_columns(
     view_name: str,
+    refresh: bool = False,
     x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
 ):
     """Lấy thông tin các cột của view"""
@@ -545,7 +1582,7 @@ def get_view_columns(
             raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server")
         
         connector = state["dw_connector"]
-        columns, error = connector.get_view_columns(view_name)
+        columns, error = connector.get_view_columns(view_name, refresh=refresh)
         
         if error:
             raise HTTPException(status_code=400, detail=error)
@@ -560,8 +1597,30 @@ def get_view_columns(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/dw/schema/refresh")
+def refresh_dw_schema(x_session_id: Optional[str] = Header(None, alias="X-Session-ID")):
+    """Xóa cache metadata (views, tables, cột) của connection string hiện tại"""
+    try:
+        session_id = x_session_id or "default"
+        state = get_session(session_id)
+        
+        if not state.get("dw_connector"):
+            raise HTTPException(status_code=400, detail="Chưa kết nối SQL Server")
+        
+        state["dw_connector"].refresh_schema()
+        return {"status": "success", "message": "Đã làm mới metadata"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.environ.get("KPDL_WORKERS", 1))
+    if workers > 1:
+        # Nhiều worker cần session backend dùng chung (KPDL_SESSION_BACKEND=shared)
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -0,0 +1,172 @@
+"""
+Benchmark DW I/O: load (fetchmany -> DataFrame) and bulk save (staging + upsert).
+
+    python bench_dw.py                                   # SQLite tạm: 10k / 100k / 1M dòng
+    python bench_dw.py --rows 50000 200000 --features 20 --repeat 3
+    python bench_dw.py --json bench.json                 # lưu kết quả để so sánh giữa các lần chạy
+    python bench_dw.py --connection-string "DRIVER=...;SERVER=...;" \\
+        --view dbo.vw_Survey --id-column respondentID    # đo trên SQL Server thật
+
+Với SQLite, dữ liệu tổng hợp được sinh sẵn (không tính giờ). Với SQL Server,
+load đọc view có sẵn và save ghi vào bảng --table (mặc định KPDL_Bench_Result).
+Bảng --table bị xóa trước mỗi lượt (--repeat) để lượt nào cũng đo insert từ đầu.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+
+from db_connector import SQLITE_PREFIX, create_connector
+
+DEFAULT_ROWS = (10000, 100000, 1000000)
+SEED_BATCH = 50000
+
+
+def seed_sqlite(path, n_rows, n_features, seed=42):
+    """Bảng survey (ID, n_features cột số, 1 cột chuỗi) + view vw_survey"""
+    rng = np.random.RandomState(seed)
+    feature_cols = [f"f{i}" for i in range(n_features)]
+    connection = sqlite3.connect(path)
+    try:
+        cursor = connection.cursor()
+        columns_sql = ", ".join(f"{col} REAL" for col in feature_cols)
+        cursor.execute(f"CREATE TABLE survey (respondentID INTEGER PRIMARY KEY, {columns_sql}, segment TEXT)")
+        placeholders = ", ".join("?" * (n_features + 2))
+        segments = np.array(["A", "B", "C", "D"], dtype=object)
+        for offset in range(0, n_rows, SEED_BATCH):
+            n = min(SEED_BATCH, n_rows - offset)
+            ids = np.arange(offset + 1, offset + n + 1)
+            values = rng.randn(n, n_features).round(4)
+            labels = segments[rng.randint(0, len(segments), n)]
+            cursor.executemany(
+                f"INSERT INTO survey VALUES ({placeholders})",
+                [(int(i), *row, label) for i, row, label in zip(ids, values.tolist(), labels)]
+            )
+        cursor.execute("CREATE VIEW vw_survey AS SELECT * FROM survey")
+        connection.commit()
+    finally:
+        connection.close()
+    return "main.vw_survey"
+
+
+def reset_table(connector, table_name):
+    """Xóa bảng kết quả để mỗi lượt đo save_insert bắt đầu từ bảng rỗng"""
+    if not connector._validate_object_name(table_name):
+        raise ValueError(f"Tên bảng không hợp lệ: {table_name}")
+    with connector._borrow() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        cursor.close()
+        connection.commit()
+
+
+def run_once(connector, view_name, id_column, table_name, chunk_size, batch_size):
+    """Một lượt load + save (insert) + save (update); trả về thống kê của connector"""
+    reset_table(connector, table_name)
+    df, error = connector.load_view(view_name, chunk_size=chunk_size)
+    if error:
+        raise RuntimeError(error)
+    load_stats = connector.last_load_stats
+
+    ids = df[id_column].tolist()
+    labels = np.random.RandomState(0).randint(0, 5, len(ids)).tolist()
+    # Lần ghi thứ hai đi vào nhánh UPDATE của upsert
+    results = {"load": load_stats}
+    for name in ("save_insert", "save_update"):
+        success, message = connector.save_clustering_result(
+            ids, labels, table_name, batch_size=batch_size
+        )
+        if not success:
+            raise RuntimeError(message)
+        results[name] = connector.last_save_stats
+    return results
+
+
+def best_of(runs):
+    """Với mỗi thao tác, giữ lượt nhanh nhất"""
+    return {
+        name: min((run[name] for run in runs), key=lambda stats: stats["seconds"])
+        for name in runs[0]
+    }
+
+
+def print_row(n_rows, result):
+    cells = [f"{n_rows:>10,}"]
+    for name in ("load", "save_insert", "save_update"):
+        stats = result[name]
+        rate = stats["rows_per_second"] or 0
+        cells.append(f"{stats['seconds']:>9.3f}s {rate:>12,.0f}/s")
+    print(" | ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DW load / bulk save throughput")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS),
+                        help="Số dòng sinh cho SQLite (bỏ qua khi dùng --view)")
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--connection-string", help="Mặc định: file SQLite tạm")
+    parser.add_argument("--view", help="View có sẵn để đo (bắt buộc với SQL Server)")
+    parser.add_argument("--id-column", default="respondentID")
+    parser.add_argument("--table", default="KPDL_Bench_Result")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.connection_string and not args.view:
+        parser.error("--view là bắt buộc khi truyền --connection-string")
+
+    header = " | ".join(
+        [f"{'rows':>10}"] + [f"{name:>23}" for name in ("load", "save (insert)", "save (update)")]
+    )
+    print(header)
+    print("-" * len(header))
+
+    results = []
+    if args.connection_string:
+        connector = create_connector(args.connection_string)
+        runs = [
+            run_once(connector, args.view, args.id_column, args.table, args.chunk_size, args.batch_size)
+            for _ in range(args.repeat)
+        ]
+        result = best_of(runs)
+        print_row(result["load"]["rows"], result)
+        results.append({"backend": connector.backend, "rows": result["load"]["rows"], **result})
+    else:
+        work_dir = tempfile.mkdtemp(prefix="kpdl_bench_")
+        try:
+            for n_rows in args.rows:
+                path = os.path.join(work_dir, f"bench_{n_rows}.db")
+                view_name = seed_sqlite(path, n_rows, args.features)
+                connector = create_connector(SQLITE_PREFIX + path)
+                runs = []
+                for _ in range(args.repeat):
+                    runs.append(run_once(
+                        connector, view_name, args.id_column, args.table,
+                        args.chunk_size, args.batch_size
+                    ))
+                result = best_of(runs)
+                print_row(n_rows, result)
+                results.append({"backend": connector.backend, "rows": n_rows, **result})
+                os.remove(path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "features": args.features,
+                "chunk_size": args.chunk_size,
+                "batch_size": args.batch_size,
+                "results": results
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
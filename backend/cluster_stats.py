@@ -0,0 +1,136 @@
+import numpy as np
+
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75)
+
+
+def _quantile_key(q):
+    """0.25 -> 'p25'"""
+    return f"p{round(q * 100):g}"
+
+
+def _format_cluster(size, total, centroid, mean, std, minimum, maximum, quantiles, feature_names):
+    """Build one cluster entry in the /kmeans statistics format"""
+    return {
+        "size": int(size),
+        "percentage": float(size / total * 100) if total else 0.0,
+        "centroid": centroid.tolist(),
+        "mean": mean.tolist(),
+        "std": std.tolist(),
+        "min": minimum.tolist(),
+        "max": maximum.tolist(),
+        "quantiles": {key: values.tolist() for key, values in quantiles.items()},
+        "features": feature_names
+    }
+
+
+def compute_cluster_statistics(X, labels, centroids, feature_names, quantiles=DEFAULT_QUANTILES):
+    """
+    Exact per-cluster statistics in a single pass over X.
+
+    Rows are sorted by label once, so every cluster becomes a contiguous
+    view of the sorted matrix instead of a separate X[mask] copy. The sorted
+    copy is feature-major so per-feature reductions read contiguous memory.
+    """
+    k = len(centroids)
+    order = np.argsort(labels, kind="stable")
+    columns = np.take(X.T, order, axis=1)
+    bounds = np.searchsorted(labels[order], np.arange(k + 1))
+    n_features = X.shape[1]
+
+    stats = {}
+    for cluster_id in range(k):
+        block = columns[:, bounds[cluster_id]:bounds[cluster_id + 1]]
+        if block.shape[1]:
+            mean = block.mean(axis=1)
+            std = block.std(axis=1)
+            minimum = block.min(axis=1)
+            maximum = block.max(axis=1)
+            q_values = np.quantile(block, quantiles, axis=1)
+        else:
+            mean = std = minimum = maximum = np.full(n_features, np.nan)
+            q_values = np.full((len(quantiles), n_features), np.nan)
+        stats[cluster_id] = _format_cluster(
+            block.shape[1], len(labels), centroids[cluster_id], mean, std, minimum, maximum,
+            {_quantile_key(q): q_values[i] for i, q in enumerate(quantiles)},
+            feature_names
+        )
+    return stats
+
+
+class ClusterStatsAccumulator:
+    """
+    Streaming per-cluster statistics.
+
+    Size, mean, std, min and max are merged chunk by chunk (Chan et al.
+    parallel variance), so they are exact. Quantiles come from a per-cluster
+    reservoir sample and are exact while a cluster fits in the reservoir.
+    """
+
+    def __init__(self, k, n_features, quantiles=DEFAULT_QUANTILES,
+                 reservoir_size=10000, random_state=42):
+        self.k = k
+        self.quantiles = quantiles
+        self.reservoir_size = reservoir_size
+        self.counts = np.zeros(k, dtype=np.int64)
+        self.means = np.zeros((k, n_features))
+        self.m2 = np.zeros((k, n_features))
+        self.mins = np.full((k, n_features), np.inf)
+        self.maxs = np.full((k, n_features), -np.inf)
+        self._rng = np.random.RandomState(random_state)
+        self._reservoirs = [None] * k
+        self._reservoir_keys = [None] * k
+
+    def update(self, X_chunk, labels_chunk):
+        """Merge one chunk of rows and their cluster labels"""
+        order = np.argsort(labels_chunk, kind="stable")
+        X_sorted = X_chunk[order]
+        bounds = np.searchsorted(labels_chunk[order], np.arange(self.k + 1))
+        for cluster_id in range(self.k):
+            block = X_sorted[bounds[cluster_id]:bounds[cluster_id + 1]]
+            if not len(block):
+                continue
+            n_a, n_b = self.counts[cluster_id], len(block)
+            mean_b = block.mean(axis=0, dtype=np.float64)
+            m2_b = ((block - mean_b) ** 2).sum(axis=0)
+            delta = mean_b - self.means[cluster_id]
+            n = n_a + n_b
+            self.means[cluster_id] += delta * n_b / n
+            self.m2[cluster_id] += m2_b + delta ** 2 * n_a * n_b / n
+            self.counts[cluster_id] = n
+            np.minimum(self.mins[cluster_id], block.min(axis=0), out=self.mins[cluster_id])
+            np.maximum(self.maxs[cluster_id], block.max(axis=0), out=self.maxs[cluster_id])
+            self._sample(cluster_id, block)
+
+    def _sample(self, cluster_id, block):
+        """Keep the reservoir_size rows with the smallest random keys"""
+        keys = self._rng.random_sample(len(block))
+        if self._reservoirs[cluster_id] is not None:
+            block = np.concatenate([self._reservoirs[cluster_id], block])
+            keys = np.concatenate([self._reservoir_keys[cluster_id], keys])
+        if len(keys) > self.reservoir_size:
+            keep = np.argpartition(keys, self.reservoir_size)[:self.reservoir_size]
+            block, keys = block[keep], keys[keep]
+        self._reservoirs[cluster_id] = block
+        self._reservoir_keys[cluster_id] = keys
+
+    def finalize(self, centroids, feature_names):
+        """Return statistics in the same format as compute_cluster_statistics"""
+        total = int(self.counts.sum())
+        n_features = self.means.shape[1]
+        stats = {}
+        for cluster_id in range(self.k):
+            size = self.counts[cluster_id]
+            if size:
+                mean = self.means[cluster_id]
+                std = np.sqrt(self.m2[cluster_id] / size)
+                minimum, maximum = self.mins[cluster_id], self.maxs[cluster_id]
+                q_values = np.quantile(self._reservoirs[cluster_id], self.quantiles, axis=0)
+            else:
+                mean = std = minimum = maximum = np.full(n_features, np.nan)
+                q_values = np.full((len(self.quantiles), n_features), np.nan)
+            stats[cluster_id] = _format_cluster(
+                size, total, centroids[cluster_id], mean, std, minimum, maximum,
+                {_quantile_key(q): q_values[i] for i, q in enumerate(self.quantiles)},
+                feature_names
+            )
+        return stats
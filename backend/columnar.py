@@ -0,0 +1,75 @@
+import json
+import struct
+import numpy as np
+
+from fast_json import dumps
+
+# Binary columnar payload:
+#   b"KPDL" | uint32 LE header length | JSON header | padding | column buffers
+# Header mô tả từng cột (name, dtype, shape, offset, nbytes) để client đọc
+# trực tiếp bằng TypedArray mà không phải parse JSON cho từng điểm.
+COLUMNAR_MEDIA_TYPE = "application/x-kpdl-columnar"
+MAGIC = b"KPDL"
+ALIGNMENT = 8
+
+
+def wants_columnar(accept_header):
+    """Check whether the Accept header asks for the binary columnar payload"""
+    return bool(accept_header) and COLUMNAR_MEDIA_TYPE in accept_header
+
+
+def pack_columnar(columns, meta=None):
+    """
+    Pack named numpy arrays into a single little-endian binary payload.
+
+    columns: dict name -> ndarray (float64 is stored as float32, int64 as int32)
+    meta: JSON-serializable dict stored in the header
+    """
+    specs = []
+    buffers = []
+    offset = 0
+    for name, array in columns.items():
+        array = np.asarray(array)
+        if array.dtype.kind == "f":
+            array = array.astype("<f4", copy=False)
+        elif array.dtype.kind in "iub":
+            array = array.astype("<i4", copy=False)
+        else:
+            raise TypeError(f"Column {name} has unsupported dtype {array.dtype}")
+        data = np.ascontiguousarray(array).tobytes()
+        specs.append({
+            "name": name,
+            "dtype": "float32" if array.dtype.kind == "f" else "int32",
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": len(data)
+        })
+        buffers.append(data)
+        offset += len(data)
+        padding = -offset % ALIGNMENT
+        if padding:
+            buffers.append(b"\0" * padding)
+            offset += padding
+
+    # meta có thể chứa giá trị numpy / NaN
+    header = dumps({"columns": specs, "meta": meta or {}})
+    # Căn lề để buffer đầu tiên bắt đầu ở offset chia hết cho ALIGNMENT
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header] + buffers)
+
+
+def unpack_columnar(payload):
+    """Decode a payload produced by pack_columnar (used by clients and tools)"""
+    if payload[:4] != MAGIC:
+        raise ValueError("Not a KPDL columnar payload")
+    (header_len,) = struct.unpack("<I", payload[4:8])
+    header = json.loads(payload[8:8 + header_len])
+    base = 8 + header_len
+    columns = {}
+    for spec in header["columns"]:
+        dtype = "<f4" if spec["dtype"] == "float32" else "<i4"
+        start = base + spec["offset"]
+        columns[spec["name"]] = np.frombuffer(
+            payload, dtype=dtype, count=spec["nbytes"] // 4, offset=start
+        ).reshape(spec["shape"])
+    return columns, header["meta"]
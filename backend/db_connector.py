@@ -1,176 +1,491 @@
-import pyodbc
+import abc
+import datetime
+import decimal
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
 import pandas as pd
-from typing import Optional, List, Tuple
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, List, Tuple
 
+from db_pool import get_pool
 
-class SQLServerConnector:
-    """Kết nối SQL Server Data Warehouse cho K-Means clustering"""
+DEFAULT_FETCH_SIZE = 10000
+DEFAULT_WRITE_BATCH = 10000
+SQLITE_PREFIX = "sqlite:///"  # connection string của backend SQLite: sqlite:///đường/dẫn/file.db
+SCHEMA_CACHE_TTL = float(os.environ.get("KPDL_DW_SCHEMA_TTL", 300))  # giây
+
+# Toán tử filter được phép; giá trị luôn truyền qua tham số (?)
+FILTER_OPERATORS = {
+    "=": "=", "!=": "<>", "<>": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">=",
+    "like": "LIKE", "in": "IN", "not in": "NOT IN",
+    "is null": "IS NULL", "is not null": "IS NOT NULL"
+}
+
+
+# ==================== WATERMARK ====================
+# Watermark = giá trị lớn nhất của cột tăng dần (rowversion, ngày sửa, ID)
+# đã xử lý; lần refresh sau chỉ lấy các dòng có giá trị lớn hơn.
+
+_HEX_PATTERN = re.compile(r'^0x([0-9A-Fa-f]{2})+$')
+
+
+def max_watermark(values: pd.Series):
+    """Largest non-null value of a watermark column as a plain Python value (None if empty)"""
+    values = values.dropna()
+    if values.empty:
+        return None
+    value = values.max()
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def watermark_to_json(value):
+    """JSON form of a watermark: rowversion bytes as '0x...' hex, dates as ISO strings"""
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex().upper()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def watermark_from_json(value):
+    """Inverse of watermark_to_json; ISO strings are left to SQL Server to convert"""
+    if isinstance(value, str) and _HEX_PATTERN.match(value):
+        return bytes.fromhex(value[2:])
+    return value
+
+
+class SchemaCache:
+    """
+    TTL cache of INFORMATION_SCHEMA listings, shared by every connector with
+    the same connection string in this process.
+
+    Concurrent misses on one key run a single query; the others wait for it.
+    """
+
+    def __init__(self, ttl=SCHEMA_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # (connection_string, kind, name) -> (loaded_at, value)
+        self._loading = {}  # key -> [Lock, số request đang dùng lock]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader, refresh=False):
+        """Cached value for key, calling loader() when missing, expired or refresh=True"""
+        requested_at = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not refresh and entry and requested_at - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            loading = self._loading.setdefault(key, [threading.Lock(), 0])
+            loading[1] += 1
+
+        try:
+            with loading[0]:
+                # Request khác có thể vừa nạp xong trong lúc chờ lock
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry and entry[0] >= requested_at:
+                        self.hits += 1
+                        return entry[1]
+                    self.misses += 1
+                value = loader()  # lỗi không được cache
+                with self._lock:
+                    self._purge_expired(time.time())
+                    self._entries[key] = (time.time(), value)
+                return value
+        finally:
+            # Lock của key chỉ sống khi còn request dùng nó
+            with self._lock:
+                loading[1] -= 1
+                if not loading[1]:
+                    del self._loading[key]
+
+    def _purge_expired(self, now):
+        # Gọi khi đang giữ self._lock
+        for key in [k for k, (loaded_at, _) in self._entries.items() if now - loaded_at >= self.ttl]:
+            del self._entries[key]
+
+    def invalidate(self, connection_string=None):
+        """Drop entries of one connection string, or everything"""
+        with self._lock:
+            if connection_string is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == connection_string]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+_schema_cache = SchemaCache()
+
+
+def schema_cache_stats():
+    return _schema_cache.stats()
+
+
+def filter_object_names(names, search=None, prefix=None):
+    """
+    Case-insensitive filtering of 'schema.name' strings: prefix matches either
+    the full name or the bare object name, search matches anywhere.
+    """
+    if prefix:
+        prefix = prefix.lower()
+        names = [
+            n for n in names
+            if n.lower().startswith(prefix) or n.split('.', 1)[-1].lower().startswith(prefix)
+        ]
+    if search:
+        search = search.lower()
+        names = [n for n in names if search in n.lower()]
+    return list(names)
+
+
+class WarehouseConnector(abc.ABC):
+    """
+    Thao tác DW chung (liệt kê / load / lưu kết quả) trên connection DB-API.
+
+    Lớp con cung cấp connection (_borrow) và phần SQL riêng của từng hệ
+    quản trị: truy vấn metadata, phiên bản server, bảng staging và upsert.
+    """
+    
+    backend = None
+    DEFAULT_SCHEMA = None
+    STAGE_TABLE = None
     
     def __init__(self, connection_string: str = None):
         self.connection_string = connection_string
-        self.connection = None
+        self.last_load_stats = None
+        self.last_save_stats = None
     
     def set_connection_string(self, connection_string: str):
         """Set connection string"""
         self.connection_string = connection_string
     
+    @abc.abstractmethod
+    def _borrow(self):
+        """Context manager mượn một connection, trả lại khi ra khỏi khối with"""
+    
     def connect(self) -> Tuple[bool, str]:
-        """Kết nối tới SQL Server"""
+        """Kết nối tới DW (mượn thử một connection)"""
         try:
             if not self.connection_string:
                 return False, "Connection string chưa được cấu hình"
             
-            self.connection = pyodbc.connect(self.connection_string)
+            with self._borrow():
+                pass
             return True, "Kết nối thành công"
         except Exception as e:
             return False, f"Lỗi kết nối: {str(e)}"
     
     def disconnect(self):
-        """Đóng kết nối"""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        """Connector không giữ connection riêng giữa các lần gọi"""
     
     def test_connection(self) -> Tuple[bool, str]:
-        """Test kết nối SQL Server"""
+        """Test kết nối DW"""
         try:
             if not self.connection_string:
                 return False, "Connection string chưa được cấu hình"
             
-            conn = pyodbc.connect(self.connection_string, timeout=5)
-            cursor = conn.cursor()
-            cursor.execute("SELECT @@VERSION")
-            version = cursor.fetchone()[0]
-            conn.close()
+            with self._borrow() as conn:
+                cursor = conn.cursor()
+                version = self._server_version(cursor)
             
-            version_short = version.split('\n')[0]
-            return True, f"Kết nối thành công! SQL Server version: {version_short}"
+            return True, f"Kết nối thành công! {version}"
         except Exception as e:
             return False, f"Lỗi kết nối: {str(e)}"
     
-    def get_views(self) -> Tuple[List[str], Optional[str]]:
-        """Lấy danh sách views trong database"""
+    @abc.abstractmethod
+    def _server_version(self, cursor) -> str:
+        """Chuỗi phiên bản của server"""
+    
+    def _cached_schema(self, kind, name, loader, refresh=False):
+        return _schema_cache.get((self.connection_string, kind, name), loader, refresh)
+
+    def refresh_schema(self):
+        """Forget cached metadata for this connection string"""
+        _schema_cache.invalidate(self.connection_string)
+
+    def get_views(
+        self, search: Optional[str] = None, prefix: Optional[str] = None, refresh: bool = False
+    ) -> Tuple[List[str], Optional[str]]:
+        """Lấy danh sách views trong database (cache theo TTL, lọc trong bộ nhớ)"""
         try:
-            if not self.connection:
-                success, msg = self.connect()
-                if not success:
-                    return [], msg
-            
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                SELECT TABLE_SCHEMA + '.' + TABLE_NAME as view_name
-                FROM INFORMATION_SCHEMA.VIEWS
-                ORDER BY TABLE_SCHEMA, TABLE_NAME
-            """)
-            views = [row[0] for row in cursor.fetchall()]
-            
-            return views, None
+            views = self._cached_schema("views", None, self._query_views, refresh)
+            return filter_object_names(views, search, prefix), None
         except Exception as e:
             return [], f"Lỗi lấy danh sách views: {str(e)}"
-    
-    def get_tables(self) -> Tuple[List[str], Optional[str]]:
-        """Lấy danh sách tables trong database"""
+
+    def get_tables(
+        self, search: Optional[str] = None, prefix: Optional[str] = None, refresh: bool = False
+    ) -> Tuple[List[str], Optional[str]]:
+        """Lấy danh sách tables trong database (cache theo TTL, lọc trong bộ nhớ)"""
         try:
-            if not self.connection:
-                success, msg = self.connect()
-                if not success:
-                    return [], msg
-            
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                SELECT TABLE_SCHEMA + '.' + TABLE_NAME as table_name
-                FROM INFORMATION_SCHEMA.TABLES
-                WHERE TABLE_TYPE = 'BASE TABLE'
-                ORDER BY TABLE_SCHEMA, TABLE_NAME
-            """)
-            tables = [row[0] for row in cursor.fetchall()]
-            
-            return tables, None
+            tables = self._cached_schema("tables", None, self._query_tables, refresh)
+            return filter_object_names(tables, search, prefix), None
         except Exception as e:
             return [], f"Lỗi lấy danh sách tables: {str(e)}"
+
+    @abc.abstractmethod
+    def _query_views(self) -> List[str]:
+        """Danh sách view dạng 'schema.name' (không qua cache)"""
     
-    def load_view(self, view_name: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
-        """Load dữ liệu từ view vào DataFrame"""
+    @abc.abstractmethod
+    def _query_tables(self) -> List[str]:
+        """Danh sách table dạng 'schema.name' (không qua cache)"""
+    
+    def load_view(
+        self,
+        view_name: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        chunk_size: int = DEFAULT_FETCH_SIZE
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        Load dữ liệu từ view vào DataFrame.
+
+        columns: chỉ SELECT các cột này (mặc định tất cả).
+        filters: danh sách {"column", "op", "value"} ghép bằng AND, giá trị
+        truyền qua tham số. Dữ liệu được fetchmany theo chunk_size dòng và
+        ghi thẳng vào mảng numpy theo kiểu của từng cột; thống kê tốc độ
+        nằm trong self.last_load_stats.
+        """
         try:
-            if not self.connection:
-                success, msg = self.connect()
-                if not success:
-                    return None, msg
-            
             # Sanitize view name để tránh SQL injection
             # View name format: schema.view_name
             if not self._validate_object_name(view_name):
                 return None, "Tên view không hợp lệ"
+            if chunk_size < 1:
+                return None, "chunk_size phải lớn hơn 0"
+            
+            try:
+                query, params = self._build_select(view_name, columns, filters)
+            except ValueError as e:
+                return None, str(e)
             
-            query = f"SELECT * FROM {view_name}"
-            df = pd.read_sql(query, self.connection)
+            start = time.perf_counter()
+            with self._borrow() as connection:
+                cursor = connection.cursor()
+                cursor.arraysize = chunk_size
+                cursor.execute(query, params)
+                df, n_chunks = self._fetch_frame(cursor, chunk_size)
+            elapsed = time.perf_counter() - start
             
+            self.last_load_stats = {
+                "rows": len(df),
+                "columns": df.shape[1],
+                "chunks": n_chunks,
+                "chunk_size": chunk_size,
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(len(df) / elapsed, 1) if elapsed > 0 else None
+            }
             return df, None
         except Exception as e:
             return None, f"Lỗi load view: {str(e)}"
     
+    @staticmethod
+    def _quote_identifier(name: str) -> str:
+        """Quote tên cột kiểu [name], escape dấu ] (SQL Server; SQLite cũng hiểu)"""
+        return "[" + str(name).replace("]", "]]") + "]"
+    
+    def _build_select(self, view_name, columns=None, filters=None):
+        """Build SELECT with column pushdown and a parameterized WHERE; returns (sql, params)"""
+        if columns:
+            select_list = ", ".join(self._quote_identifier(col) for col in columns)
+        else:
+            select_list = "*"
+        
+        clauses, params = [], []
+        for condition in filters or []:
+            column = condition.get("column")
+            op = str(condition.get("op", "=")).strip().lower()
+            if not column:
+                raise ValueError("Filter thiếu tên cột")
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"Toán tử filter không hợp lệ: {op}")
+            sql_op = FILTER_OPERATORS[op]
+            target = self._quote_identifier(column)
+            value = condition.get("value")
+            if sql_op in ("IS NULL", "IS NOT NULL"):
+                clauses.append(f"{target} {sql_op}")
+            elif sql_op in ("IN", "NOT IN"):
+                if not isinstance(value, (list, tuple)) or not value:
+                    raise ValueError(f"Filter {op} cần danh sách giá trị")
+                clauses.append(f"{target} {sql_op} ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{target} {sql_op} ?")
+                params.append(value)
+        
+        query = f"SELECT {select_list} FROM {view_name}"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        return query, params
+    
+    def _fetch_frame(self, cursor, chunk_size):
+        """fetchmany theo chunk, chuyển từng cột của chunk thành mảng numpy có kiểu"""
+        description = cursor.description
+        names = [col[0] for col in description]
+        type_codes = [col[1] for col in description]
+        parts = [[] for _ in names]
+        n_chunks = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            n_chunks += 1
+            for j, values in enumerate(zip(*rows)):
+                parts[j].append(self._column_array(values, type_codes[j]))
+        
+        data = {}
+        for j, type_code in enumerate(type_codes):
+            if parts[j]:
+                data[j] = parts[j][0] if len(parts[j]) == 1 else np.concatenate(parts[j])
+            else:
+                data[j] = self._column_array((), type_code)
+        df = pd.DataFrame(data)
+        df.columns = names
+        return df, n_chunks
+    
+    @staticmethod
+    def _column_array(values, type_code):
+        """Mảng numpy cho một cột của chunk theo kiểu driver báo trong cursor.description"""
+        n = len(values)
+        has_null = None in values
+        if type_code is bool:
+            return np.array(values, dtype=object if has_null else bool)
+        if type_code is int:
+            if not has_null:
+                return np.fromiter(values, dtype=np.int64, count=n)
+            # Cột int có NULL -> float64 với NaN (giống pd.read_sql)
+            return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=n)
+        if type_code in (float, decimal.Decimal):
+            return np.fromiter((np.nan if v is None else float(v) for v in values), dtype=np.float64, count=n)
+        if type_code in (datetime.datetime, datetime.date):
+            return np.array(values, dtype="datetime64[ns]")
+        return np.array(values, dtype=object)
+    
     def save_clustering_result(
         self, 
         respondent_ids: List[int], 
         cluster_ids: List[int],
-        table_name: str = "Fact_Clustering_Result"
+        table_name: str = "Fact_Clustering_Result",
+        batch_size: int = DEFAULT_WRITE_BATCH,
+        progress_callback=None,
+        delete_missing: bool = True
     ) -> Tuple[bool, str]:
-        """Lưu kết quả clustering vào SQL Server"""
+        """
+        Lưu kết quả clustering vào DW.
+
+        Ghi theo lô (executemany) vào bảng staging tạm, sau đó một lệnh
+        set-based duy nhất thay thế nội dung bảng đích, nên bảng đích chỉ bị
+        khóa trong lúc upsert. delete_missing=False chỉ upsert các ID được
+        truyền vào (refresh tăng dần), giữ nguyên các dòng khác.
+        progress_callback(info) được gọi sau mỗi lô; thống kê nằm trong
+        self.last_save_stats.
+        """
         try:
-            if not self.connection:
-                success, msg = self.connect()
-                if not success:
-                    return False, msg
+            if not self._validate_object_name(table_name):
+                return False, "Tên bảng không hợp lệ"
+            if batch_size < 1:
+                return False, "batch_size phải lớn hơn 0"
+            if len(respondent_ids) != len(cluster_ids):
+                return False, "Số ID và số nhãn cụm không khớp"
             
-            cursor = self.connection.cursor()
+            start = time.perf_counter()
+            with self._borrow() as connection:
+                cursor = connection.cursor()
+                try:
+                    self._ensure_result_table(cursor, table_name)
+                    self._create_stage(cursor)
+                
+                    # Insert theo lô: tham số bind dạng mảng thay vì một round-trip mỗi dòng
+                    total = len(respondent_ids)
+                    n_batches = 0
+                    for offset in range(0, total, batch_size):
+                        batch = [
+                            (int(resp_id), int(cluster_id))
+                            for resp_id, cluster_id in zip(
+                                respondent_ids[offset:offset + batch_size],
+                                cluster_ids[offset:offset + batch_size]
+                            )
+                        ]
+                        cursor.executemany(
+                            f"INSERT INTO {self.STAGE_TABLE} (respondentID, cluster_id) VALUES (?, ?)",
+                            batch
+                        )
+                        n_batches += 1
+                        if progress_callback is not None:
+                            progress_callback({
+                                "stage": "write",
+                                "rows_written": offset + len(batch),
+                                "total_rows": total,
+                                "batches": n_batches
+                            })
+                
+                    # Thay thế / upsert dữ liệu cũ bằng lệnh set-based
+                    self._merge_stage(cursor, table_name, delete_missing)
+                    cursor.execute(f"DROP TABLE {self.STAGE_TABLE}")
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
             
-            # Kiểm tra và tạo bảng nếu chưa tồn tại
-            cursor.execute(f"""
-                IF NOT EXISTS (
-                    SELECT * FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_NAME = '{table_name}'
-                )
-                BEGIN
-                    CREATE TABLE {table_name} (
-                        respondentID INT PRIMARY KEY,
-                        cluster_id INT NOT NULL,
-                        created_at DATETIME DEFAULT GETDATE()
-                    )
-                END
-            """)
-            
-            # Xóa dữ liệu cũ
-            cursor.execute(f"DELETE FROM {table_name}")
-            
-            # Insert dữ liệu mới
-            for resp_id, cluster_id in zip(respondent_ids, cluster_ids):
-                cursor.execute(
-                    f"INSERT INTO {table_name} (respondentID, cluster_id) VALUES (?, ?)",
-                    (resp_id, cluster_id)
-                )
+            elapsed = time.perf_counter() - start
+            self.last_save_stats = {
+                "rows": total,
+                "batches": n_batches,
+                "batch_size": batch_size,
+                "mode": "replace" if delete_missing else "upsert",
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(total / elapsed, 1) if elapsed > 0 else None
+            }
             
-            self.connection.commit()
-            
-            return True, f"Đã lưu {len(respondent_ids)} kết quả clustering vào {table_name}"
+            return True, f"Đã lưu {total} kết quả clustering vào {table_name}"
         except Exception as e:
             return False, f"Lỗi lưu kết quả: {str(e)}"
     
+    @abc.abstractmethod
+    def _ensure_result_table(self, cursor, table_name):
+        """Tạo bảng kết quả (respondentID, cluster_id, created_at) nếu chưa có"""
+    
+    @abc.abstractmethod
+    def _create_stage(self, cursor):
+        """Tạo (lại) bảng staging tạm STAGE_TABLE"""
+    
+    @abc.abstractmethod
+    def _merge_stage(self, cursor, table_name, delete_missing):
+        """Upsert staging vào bảng đích; delete_missing xóa các ID không có trong staging"""
+    
     def _validate_object_name(self, name: str) -> bool:
         """Validate tên object (table/view) để tránh SQL injection"""
-        import re
         # Chấp nhận format: schema.name hoặc name
         # Chỉ cho phép chữ cái, số, underscore
         pattern = r'^[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)?$'
         return bool(re.match(pattern, name))
     
-    def get_view_columns(self, view_name: str) -> Tuple[List[dict], Optional[str]]:
-        """Lấy thông tin các cột của view"""
+    def get_view_columns(self, view_name: str, refresh: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """Lấy thông tin các cột của view (cache theo TTL)"""
         try:
-            if not self.connection:
-                success, msg = self.connect()
-                if not success:
-                    return [], msg
-            
             if not self._validate_object_name(view_name):
                 return [], "Tên view không hợp lệ"
             
@@ -179,9 +494,68 @@ class SQLServerConnector:
             if len(parts) == 2:
                 schema, vname = parts
             else:
-                schema, vname = 'dbo', parts[0]
+                schema, vname = self.DEFAULT_SCHEMA, parts[0]
             
-            cursor = self.connection.cursor()
+            # Tên object không phân biệt hoa thường (collation mặc định / SQLite)
+            columns = self._cached_schema(
+                "columns", f"{schema}.{vname}".lower(),
+                lambda: self._query_view_columns(schema, vname), refresh
+            )
+            # Bản sao: giá trị trong cache dùng chung giữa các session
+            return [dict(column) for column in columns], None
+        except Exception as e:
+            return [], f"Lỗi lấy thông tin cột: {str(e)}"
+
+
+    @abc.abstractmethod
+    def _query_view_columns(self, schema: str, vname: str) -> List[dict]:
+        """Cột của một view: [{name, type, nullable}] (không qua cache)"""
+
+
+class SQLServerConnector(WarehouseConnector):
+    """Kết nối SQL Server Data Warehouse cho K-Means clustering"""
+    
+    backend = "sqlserver"
+    DEFAULT_SCHEMA = "dbo"
+    STAGE_TABLE = "#kpdl_cluster_stage"
+    
+    @contextmanager
+    def _borrow(self):
+        """Mượn một connection từ pool dùng chung của connection string này"""
+        if not self.connection_string:
+            raise ValueError("Connection string chưa được cấu hình")
+        with get_pool(self.connection_string).connection() as connection:
+            yield connection
+    
+    def _server_version(self, cursor) -> str:
+        cursor.execute("SELECT @@VERSION")
+        version_short = cursor.fetchone()[0].split('\n')[0]
+        return f"SQL Server version: {version_short}"
+    
+    def _query_views(self) -> List[str]:
+        with self._borrow() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT TABLE_SCHEMA + '.' + TABLE_NAME as view_name
+                FROM INFORMATION_SCHEMA.VIEWS
+                ORDER BY TABLE_SCHEMA, TABLE_NAME
+            """)
+            return [row[0] for row in cursor.fetchall()]
+    
+    def _query_tables(self) -> List[str]:
+        with self._borrow() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT TABLE_SCHEMA + '.' + TABLE_NAME as table_name
+                FROM INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_TYPE = 'BASE TABLE'
+                ORDER BY TABLE_SCHEMA, TABLE_NAME
+            """)
+            return [row[0] for row in cursor.fetchall()]
+    
+    def _query_view_columns(self, schema: str, vname: str) -> List[dict]:
+        with self._borrow() as connection:
+            cursor = connection.cursor()
             cursor.execute("""
                 SELECT 
                     COLUMN_NAME,
@@ -191,15 +565,162 @@ class SQLServerConnector:
                 WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
                 ORDER BY ORDINAL_POSITION
             """, (schema, vname))
-            
-            columns = []
-            for row in cursor.fetchall():
-                columns.append({
-                    "name": row[0],
-                    "type": row[1],
-                    "nullable": row[2] == 'YES'
-                })
-            
-            return columns, None
-        except Exception as e:
-            return [], f"Lỗi lấy thông tin cột: {str(e)}"
+            rows = cursor.fetchall()
+        
+        columns = []
+        for row in rows:
+            columns.append({
+                "name": row[0],
+                "type": row[1],
+                "nullable": row[2] == 'YES'
+            })
+        return columns
+    
+    def _ensure_result_table(self, cursor, table_name):
+        cursor.execute("SELECT OBJECT_ID(?, 'U')", (table_name,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"""
+                CREATE TABLE {table_name} (
+                    respondentID INT PRIMARY KEY,
+                    cluster_id INT NOT NULL,
+                    created_at DATETIME DEFAULT GETDATE()
+                )
+            """)
+    
+    def _create_stage(self, cursor):
+        cursor.execute("""
+            IF OBJECT_ID('tempdb..#kpdl_cluster_stage') IS NOT NULL
+                DROP TABLE #kpdl_cluster_stage
+        """)
+        cursor.execute("""
+            CREATE TABLE #kpdl_cluster_stage (
+                respondentID INT NOT NULL PRIMARY KEY,
+                cluster_id INT NOT NULL
+            )
+        """)
+        cursor.fast_executemany = True
+    
+    def _merge_stage(self, cursor, table_name, delete_missing):
+        delete_clause = """
+            WHEN NOT MATCHED BY SOURCE THEN
+                DELETE""" if delete_missing else ""
+        cursor.execute(f"""
+            MERGE {table_name} WITH (HOLDLOCK) AS target
+            USING #kpdl_cluster_stage AS source
+                ON target.respondentID = source.respondentID
+            WHEN MATCHED THEN
+                UPDATE SET cluster_id = source.cluster_id, created_at = GETDATE()
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (respondentID, cluster_id) VALUES (source.respondentID, source.cluster_id){delete_clause};
+        """)
+
+
+class SQLiteConnector(WarehouseConnector):
+    """
+    DW cục bộ trên một file SQLite (connection string: sqlite:///path.db).
+
+    Dùng để chạy thử và benchmark các luồng load / lưu kết quả mà không cần
+    SQL Server. Mỗi lần mượn mở một connection mới (mở file SQLite rất rẻ).
+    """
+    
+    backend = "sqlite"
+    DEFAULT_SCHEMA = "main"
+    STAGE_TABLE = "temp.kpdl_cluster_stage"
+    
+    @property
+    def path(self) -> str:
+        return self.connection_string[len(SQLITE_PREFIX):]
+    
+    @contextmanager
+    def _borrow(self):
+        if not self.connection_string:
+            raise ValueError("Connection string chưa được cấu hình")
+        # Không tự tạo file rỗng khi đường dẫn sai
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Không tìm thấy file SQLite: {self.path}")
+        connection = sqlite3.connect(self.path)
+        try:
+            yield connection
+        finally:
+            connection.close()
+    
+    def _server_version(self, cursor) -> str:
+        cursor.execute("SELECT sqlite_version()")
+        return f"SQLite version: {cursor.fetchone()[0]}"
+    
+    def _query_objects(self, object_type: str) -> List[str]:
+        with self._borrow() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT 'main.' || name FROM sqlite_master
+                WHERE type = ? AND name NOT LIKE 'sqlite_%'
+                ORDER BY name
+            """, (object_type,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def _query_views(self) -> List[str]:
+        return self._query_objects("view")
+    
+    def _query_tables(self) -> List[str]:
+        return self._query_objects("table")
+    
+    def _query_view_columns(self, schema: str, vname: str) -> List[dict]:
+        with self._borrow() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT name, type, [notnull] FROM pragma_table_info(?, ?) ORDER BY cid",
+                (vname, schema)
+            )
+            rows = cursor.fetchall()
+        return [{"name": row[0], "type": row[1], "nullable": not row[2]} for row in rows]
+    
+    @staticmethod
+    def _column_array(values, type_code):
+        # sqlite3 không báo kiểu cột: suy ra từ giá trị của chunk
+        kinds = {type(v) for v in values if v is not None}
+        if values and not kinds:
+            type_code = float  # cả chunk NULL -> NaN
+        elif kinds == {int}:
+            type_code = int
+        elif kinds and kinds <= {int, float}:
+            type_code = float
+        return WarehouseConnector._column_array(values, type_code)
+    
+    def _ensure_result_table(self, cursor, table_name):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                respondentID INTEGER PRIMARY KEY,
+                cluster_id INTEGER NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+    def _create_stage(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS temp.kpdl_cluster_stage")
+        cursor.execute("""
+            CREATE TEMP TABLE kpdl_cluster_stage (
+                respondentID INTEGER NOT NULL PRIMARY KEY,
+                cluster_id INTEGER NOT NULL
+            )
+        """)
+    
+    def _merge_stage(self, cursor, table_name, delete_missing):
+        # WHERE true: bắt buộc để SQLite phân biệt ON CONFLICT với JOIN ... ON
+        cursor.execute(f"""
+            INSERT INTO {table_name} (respondentID, cluster_id)
+            SELECT respondentID, cluster_id FROM temp.kpdl_cluster_stage WHERE true
+            ON CONFLICT(respondentID) DO UPDATE
+                SET cluster_id = excluded.cluster_id, created_at = CURRENT_TIMESTAMP
+        """)
+        if delete_missing:
+            cursor.execute(f"""
+                DELETE FROM {table_name}
+                WHERE respondentID NOT IN (SELECT respondentID FROM temp.kpdl_cluster_stage)
+            """)
+
+
+def create_connector(connection_string: str) -> WarehouseConnector:
+    """Connector theo connection string: sqlite:///... -> SQLite, còn lại -> SQL Server"""
+    if connection_string and connection_string.startswith(SQLITE_PREFIX):
+        return SQLiteConnector(connection_string)
+    return SQLServerConnector(connection_string)
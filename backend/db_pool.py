@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_POOL_SIZE = int(os.environ.get("KPDL_DB_POOL_SIZE", 5))
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get("KPDL_DB_POOL_IDLE_TIMEOUT", 300))  # giây
+DEFAULT_ACQUIRE_TIMEOUT = float(os.environ.get("KPDL_DB_POOL_TIMEOUT", 30))
+PING_AFTER_SECONDS = 30  # connection rảnh lâu hơn mức này được ping trước khi cho mượn
+CONNECT_TIMEOUT = 5
+
+
+class PoolExhausted(TimeoutError):
+    """No connection became available within the acquire timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of pyodbc connections for one connection string.
+
+    Idle connections are reused LIFO, closed after idle_timeout, and pinged
+    before reuse once they have been idle for a while; a failed ping replaces
+    the handle with a fresh connection.
+    """
+
+    def __init__(self, connection_string, max_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle = []  # [(connection, last_used)]
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.created = 0
+        self.reconnects = 0
+        self.waits = 0
+
+    def _connect(self):
+        # Import khi cần: backend SQLite chạy được trên máy không có driver ODBC
+        import pyodbc
+        connection = pyodbc.connect(self.connection_string, timeout=CONNECT_TIMEOUT)
+        self.created += 1
+        return connection
+
+    @staticmethod
+    def _ping(connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _expire_idle(self, now):
+        # Gọi khi đang giữ lock
+        alive = []
+        for connection, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                self._close(connection)
+            else:
+                alive.append((connection, last_used))
+        self._idle = alive
+
+    def acquire(self):
+        """Borrow a live connection, opening one if the pool is below max_size"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._expire_idle(time.time())
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    connection, last_used = None, None
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(
+                        f"Hết connection trong pool (tối đa {self.max_size}), thử lại sau"
+                    )
+                self.waits += 1
+                self._cond.wait(remaining)
+
+        # Mở / ping connection ngoài lock
+        try:
+            if connection is None:
+                return self._connect()
+            if time.time() - last_used > PING_AFTER_SECONDS and not self._ping(connection):
+                self._close(connection)
+                self.reconnects += 1
+                return self._connect()
+            return connection
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection, check=False):
+        """Return a borrowed connection; with check=True it is pinged and dropped if dead"""
+        healthy = True
+        try:
+            connection.rollback()  # không để transaction dở dang cho lần mượn sau
+        except Exception:
+            healthy = False
+        if healthy and check:
+            healthy = self._ping(connection)
+        with self._cond:
+            self._in_use -= 1
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append((connection, time.time()))
+            self._cond.notify()
+        if not keep:
+            self._close(connection)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... -- released (and checked on error) afterwards"""
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, check=True)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "waits": self.waits
+            }
+
+
+# ==================== PROCESS-WIDE REGISTRY ====================
+# Một pool cho mỗi connection string trong mỗi process. Process con
+# (fork từ job pool) không dùng lại socket của process cha.
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(connection_string):
+    """Process-wide pool for a connection string, created on first use"""
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools, _pools_pid = {}, os.getpid()
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = _pools[connection_string] = ConnectionPool(connection_string)
+        return pool
+
+
+def pool_stats():
+    """Stats of every pool in this process (connection strings are not exposed)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [{"pool": i, **pool.stats()} for i, pool in enumerate(pools)]
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,79 @@
+import datetime
+import decimal
+import json
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn: không có thì dùng json chuẩn (chậm hơn)
+    orjson = None
+
+
+def _default(obj):
+    """Types orjson does not serialize natively"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind in "biu" or obj.dtype in (np.float32, np.float64):
+            # Mảng không liên tục (cột cắt từ ma trận), memmap... -> ndarray C-contiguous
+            return np.ascontiguousarray(obj)
+        if obj.dtype.kind == "f":
+            return obj.astype(np.float64)  # float16 / longdouble
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if pd.api.types.is_scalar(obj) and pd.isna(obj):
+        return None  # pd.NA, pd.NaT
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()  # lớp con như pd.Timestamp
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _to_builtin(obj):
+    """Recursive conversion to plain Python values for the json fallback (NaN/Inf -> null)"""
+    if isinstance(obj, dict):
+        return {str(k) if not isinstance(k, str) else k: _to_builtin(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_builtin(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _to_builtin(obj.tolist())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float):
+        return obj if np.isfinite(obj) else None
+    if obj is None or isinstance(obj, (str, int, bool)):
+        return obj
+    return _to_builtin(_default(obj))
+
+
+def dumps(content) -> bytes:
+    """
+    Serialize to UTF-8 JSON bytes in one pass.
+
+    numpy arrays and scalars are written directly, NaN/Inf become null and
+    non-string dict keys (e.g. cluster ids) become strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(
+        _to_builtin(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with dumps().
+
+    Return an instance directly from endpoints with large or numpy-heavy
+    bodies: FastAPI then skips jsonable_encoder on the content.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,86 @@
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:  # zstd là tùy chọn: không có thì chỉ dùng gzip
+    zstandard = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("KPDL_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESSIBLE_TYPES = ("application/json", "application/x-kpdl-columnar")
+
+# Kết quả thay đổi theo session; trình duyệt luôn hỏi lại bằng If-None-Match
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "X-Session-ID, Accept-Encoding"}
+
+
+def available_encodings():
+    """Encodings this server can produce, in order of preference"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick a content coding from an Accept-Encoding header (None = identity)"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_body(body, encoding):
+    """Compress a response body with gzip or zstd"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def should_compress(content_type, headers):
+    """Buffered JSON / columnar bodies only; streams (SSE) and encoded bodies pass through"""
+    if "content-encoding" in headers:
+        return False
+    return (content_type or "").split(";")[0].strip() in COMPRESSIBLE_TYPES
+
+
+def encoded_etag(etag, encoding):
+    """Strong ETag of the compressed representation: "tag" -> "tag-gzip" """
+    return etag[:-1] + f"-{encoding}\"" if etag.endswith('"') else etag
+
+
+def make_etag(version, name):
+    """Strong ETag for a result version and endpoint name"""
+    return f'"{version}-{name}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match (weak comparison): any listed tag of this result in any encoding"""
+    if not if_none_match or not etag:
+        return False
+    base = etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == base or any(tag == f"{base}-{encoding}" for encoding in ("gzip", "zstd")):
+            return True
+    return False
@@ -0,0 +1,376 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+from kmeans_engine import run_clustering
+
+DEFAULT_JOB_WORKERS = int(os.environ.get("KPDL_JOB_WORKERS", 2))
+MAX_FINISHED_JOBS = 200
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+TERMINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job has been cancelled"""
+
+
+# ==================== WORKER TASKS ====================
+# Chạy trong process của pool: tiến độ và cờ hủy đi qua Manager dict.
+
+def _cancel_checker(job_id, cancel_flags):
+    def check():
+        if cancel_flags.get(job_id):
+            raise JobCancelled()
+
+    return check
+
+
+def _progress_reporter(job_id, progress, cancel_flags):
+    start = time.time()
+    check = _cancel_checker(job_id, cancel_flags)
+
+    def report(info):
+        check()
+        progress[job_id] = {**info, "elapsed_seconds": round(time.time() - start, 3)}
+
+    return report
+
+
+def kmeans_task(job_id, progress, cancel_flags, X, feature_names, options):
+    """Clustering job: same pipeline as POST /kmeans"""
+    report = _progress_reporter(job_id, progress, cancel_flags)
+    report({"stage": "started"})
+    # Cờ hủy được kiểm tra cả khi đang chờ sweep K song song (pool bị terminate)
+    return run_clustering(X, feature_names, progress_callback=report,
+                          cancel_check=_cancel_checker(job_id, cancel_flags), **options)
+
+
+def preprocess_task(job_id, progress, cancel_flags, preprocessor, df, selected_columns,
+                    precision="float64", chunk_source=None):
+    """Preprocessing job: same pipeline as POST /preprocess (streamed when chunk_source is given)"""
+    report = _progress_reporter(job_id, progress, cancel_flags)
+    report({"stage": "preprocess"})
+    if chunk_source is not None:
+        X_processed = None
+        result = preprocessor.preprocess_chunks(chunk_source, selected_columns, precision)
+    else:
+        X_processed, result = preprocessor.preprocess(df, selected_columns, precision)
+    report({"stage": "done"})
+    return preprocessor, X_processed, result
+
+
+def save_clusters_task(job_id, progress, cancel_flags, connector, respondent_ids, cluster_ids,
+                       table_name, batch_size):
+    """DW write-back job: same bulk path as POST /dw/save-clusters"""
+    report = _progress_reporter(job_id, progress, cancel_flags)
+    report({"stage": "connect"})
+    success, message = connector.save_clustering_result(
+        respondent_ids, cluster_ids, table_name,
+        batch_size=batch_size, progress_callback=report
+    )
+    if not success:
+        # Lỗi do hủy job được connector gói thành message
+        if cancel_flags.get(job_id):
+            raise JobCancelled()
+        raise ValueError(message)
+    return message, connector.last_save_stats
+
+
+# ==================== SHARED JOB STATUS ====================
+# Với nhiều uvicorn worker, request /jobs/{id} có thể tới worker khác worker
+# chạy job: trạng thái, tiến độ và cờ hủy được lưu trong SQLite dùng chung.
+
+class _SharedJobField:
+    """Dict-like view of one column of the jobs table; picklable into pool processes"""
+
+    def __init__(self, db_path, column):
+        self.db_path = db_path
+        self.column = column
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, job_id, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {self.column} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None or row[0] is None:
+            return default
+        return pickle.loads(row[0])
+
+    def __setitem__(self, job_id, value):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT INTO jobs (job_id, {self.column}) VALUES (?, ?) "
+                    f"ON CONFLICT(job_id) DO UPDATE SET {self.column} = excluded.{self.column}",
+                    (job_id, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                )
+        finally:
+            conn.close()
+
+    def pop(self, job_id, default=None):
+        value = self.get(job_id, default)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"UPDATE jobs SET {self.column} = NULL WHERE job_id = ?", (job_id,))
+        finally:
+            conn.close()
+        return value
+
+
+class SharedJobStore:
+    """
+    Job status shared by all worker processes on one host.
+
+    The worker that accepted a job still runs it and its on_success callback;
+    it publishes the job view here so any worker can answer /jobs/{id}, and
+    polls the cancel flag any worker may set.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, view BLOB, progress BLOB, cancel BLOB, finished_at REAL)"
+            )
+        finally:
+            conn.close()
+        self.views = _SharedJobField(db_path, "view")
+        self.progress = _SharedJobField(db_path, "progress")
+        self.cancel_flags = _SharedJobField(db_path, "cancel")
+
+    def publish(self, view):
+        self.views[view["job_id"]] = view
+        if view["finished_at"] is not None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                with conn:
+                    conn.execute(
+                        "UPDATE jobs SET finished_at = ? WHERE job_id = ?",
+                        (view["finished_at"], view["job_id"])
+                    )
+            finally:
+                conn.close()
+
+    def prune(self, keep=MAX_FINISHED_JOBS):
+        """Drop finished jobs beyond the newest keep"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN ("
+                    "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL "
+                    "ORDER BY finished_at DESC LIMIT ?)",
+                    (keep,)
+                )
+        finally:
+            conn.close()
+
+
+# ==================== JOB MANAGER ====================
+
+class JobManager:
+    """
+    Background jobs on a bounded process pool, separate from the request loop.
+
+    on_success callbacks run in the parent process when a job finishes, so
+    they can store results into the session. With a SharedJobStore, jobs
+    started by this process are visible to (and cancellable from) the others.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, store=None):
+        self.max_workers = max_workers
+        self.store = store
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._cancel_flags = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        # Khởi tạo lười: chỉ tạo process khi có job đầu tiên
+        if self._executor is None:
+            if self.store is not None:
+                self._progress = self.store.progress
+                self._cancel_flags = self.store.cancel_flags
+            else:
+                self._manager = Manager()
+                self._progress = self._manager.dict()
+                self._cancel_flags = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, job_type, session_id, task, args, on_success=None):
+        """Queue task(job_id, progress, cancel_flags, *args); returns the job id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._ensure_pool()
+            self._prune()
+            job = {
+                "job_id": job_id,
+                "type": job_type,
+                "session_id": session_id,
+                "status": JOB_QUEUED,
+                "created_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+                "future": None
+            }
+            self._jobs[job_id] = job
+            self._publish(job)
+            future = self._executor.submit(task, job_id, self._progress, self._cancel_flags, *args)
+            job["future"] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f, on_success))
+        return job_id
+
+    def complete(self, job_type, session_id, result):
+        """Record a job satisfied without running (e.g. a result cache hit)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = job = {
+                "job_id": job_id,
+                "type": job_type,
+                "session_id": session_id,
+                "status": JOB_SUCCEEDED,
+                "created_at": now,
+                "finished_at": now,
+                "result": result,
+                "error": None,
+                "future": None
+            }
+            self._publish(job)
+        return job_id
+
+    def _finish(self, job_id, future, on_success):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        try:
+            if future.cancelled():
+                job["status"] = JOB_CANCELLED
+            else:
+                error = future.exception()
+                if isinstance(error, JobCancelled):
+                    job["status"] = JOB_CANCELLED
+                elif error is not None:
+                    job["status"] = JOB_FAILED
+                    job["error"] = str(error)
+                else:
+                    job["result"] = on_success(future.result()) if on_success else None
+                    job["status"] = JOB_SUCCEEDED
+        except Exception as e:
+            job["status"] = JOB_FAILED
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            self._cancel_flags.pop(job_id, None)
+            self._publish(job)
+
+    @staticmethod
+    def _view(job):
+        return {
+            "job_id": job["job_id"],
+            "type": job["type"],
+            "session_id": job["session_id"],
+            "status": job["status"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "result": job["result"]
+        }
+
+    def _publish(self, job):
+        if self.store is not None:
+            self.store.publish(self._view(job))
+
+    def _find(self, job_id, session_id):
+        """(local job or None, internal view) of a job owned by session_id; None if not visible"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            view = self._view(job)
+        elif self.store is not None:
+            # Job của worker khác
+            view = self.store.views.get(job_id)
+        else:
+            view = None
+        # Session ID là credential: job của session khác coi như không tồn tại
+        if view is None or view["session_id"] != session_id:
+            return None
+        return job, view
+
+    def get(self, job_id, session_id, include_result=True):
+        """Public view of a session's job: status, latest progress and (when done) result"""
+        found = self._find(job_id, session_id)
+        if found is None:
+            return None
+        job, view = found
+        del view["session_id"]
+        running = job is not None and job["future"] is not None and job["future"].running()
+        progress = self._progress.get(job_id) if self._progress is not None else None
+        if progress is None and job is None:
+            progress = self.store.progress.get(job_id)
+        if view["status"] == JOB_QUEUED and (progress or running):
+            view["status"] = JOB_RUNNING
+        view["progress"] = progress
+        if not (include_result and view["status"] == JOB_SUCCEEDED):
+            view.pop("result")
+        return view
+
+    def cancel(self, job_id, session_id):
+        """Cancel a session's queued job, or ask a running one to stop at its next progress report"""
+        found = self._find(job_id, session_id)
+        if found is None:
+            return False
+        job, view = found
+        if job is None:
+            if view["status"] in TERMINAL_STATES:
+                return False
+            # Worker chạy job sẽ thấy cờ ở lần báo tiến độ kế tiếp
+            self.store.cancel_flags[job_id] = True
+            return True
+        if job["status"] in TERMINAL_STATES:
+            return False
+        if not job["future"].cancel():
+            self._cancel_flags[job_id] = True
+        return True
+
+    def _prune(self):
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job["status"] in TERMINAL_STATES
+        ]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self._jobs.pop(job_id, None)
+            if self._progress is not None:
+                self._progress.pop(job_id, None)
+        if self.store is not None:
+            self.store.prune()
+
+    def shutdown(self):
+        """Stop the worker pool (called on application shutdown)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self._manager is not None:
+                self._manager.shutdown()
+            self._executor = None
@@ -1,44 +1,370 @@
+import multiprocessing
+import os
+import queue
+import time
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
-from sklearn.metrics import silhouette_score, davies_bouldin_score
+from multiprocessing import shared_memory
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.metrics import silhouette_score, silhouette_samples, davies_bouldin_score
+from threadpoolctl import threadpool_limits
+
+from cluster_stats import ClusterStatsAccumulator, compute_cluster_statistics
+
+SILHOUETTE_MODES = ("auto", "full", "sampled", "simplified")
+DEFAULT_SILHOUETTE_SAMPLE = 10000
+
+
+DEFAULT_CHUNK_SIZE = 10000
+AUTO_K_MAX_ROWS = 50000  # auto-K ở chế độ minibatch chạy trên mẫu con
+SWEEP_POLL_SECONDS = 0.25  # chu kỳ kiểm tra budget / hủy khi chờ worker
+LOD_MIN_SPAN = 1e-9  # độ rộng tối thiểu (tương đối) của viewport LOD
+
+
+def iter_array_chunks(X, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield row chunks of an in-memory matrix (views, no copy)"""
+    for start in range(0, len(X), chunk_size):
+        yield X[start:start + chunk_size]
+
+
+def sample_chunks(chunk_source, n_rows, random_state=42):
+    """Uniform sample of at most n_rows rows from a stream of row chunks"""
+    rng = np.random.RandomState(random_state)
+    sample, keys = None, None
+    for chunk in chunk_source():
+        chunk_keys = rng.random_sample(len(chunk))
+        if sample is None:
+            sample, keys = chunk, chunk_keys
+        else:
+            sample = np.concatenate([sample, chunk])
+            keys = np.concatenate([keys, chunk_keys])
+        if len(keys) > n_rows:
+            keep = np.argpartition(keys, n_rows)[:n_rows]
+            sample, keys = sample[keep], keys[keep]
+    if sample is None:
+        raise ValueError("No rows to cluster")
+    return sample
+
+
+def _widen_range(low, high):
+    """Zero-width (or sub-epsilon) range -> a small interval around its centre"""
+    pad = max(abs(low), abs(high), 1.0) * LOD_MIN_SPAN
+    if high - low >= 2 * pad:
+        return low, high
+    centre = (low + high) / 2
+    return centre - pad, centre + pad
+
+
+def _squared_distances(X, centroids):
+    """Squared euclidean distances between rows of X and centroids"""
+    return np.maximum(
+        (X ** 2).sum(axis=1)[:, None]
+        - 2 * X @ centroids.T
+        + (centroids ** 2).sum(axis=1)[None, :],
+        0
+    )
+
+
+# ==================== SILHOUETTE ====================
+def compute_silhouette(X, labels, centroids=None, mode="auto",
+                       sample_size=DEFAULT_SILHOUETTE_SAMPLE, random_state=42):
+    """
+    Silhouette score with a bounded-cost option for large datasets.
+
+    - full: exact sklearn silhouette, O(n^2)
+    - sampled: stratified per-cluster sample, reports a 95% confidence interval
+    - simplified: centroid-based silhouette, O(n * k)
+    - auto: full if n <= sample_size, otherwise sampled
+    """
+    if mode not in SILHOUETTE_MODES:
+        raise ValueError(f"Unknown silhouette mode: {mode}")
+    n = len(labels)
+    if mode == "auto":
+        mode = "full" if n <= sample_size else "sampled"
+
+    if mode == "full":
+        return {
+            "score": float(silhouette_score(X, labels)),
+            "mode": "full",
+            "sample_size": n,
+            "confidence_interval": None
+        }
+    if mode == "simplified":
+        if centroids is None:
+            raise ValueError("Simplified silhouette requires centroids")
+        return {
+            "score": float(_simplified_silhouette(X, labels, centroids)),
+            "mode": "simplified",
+            "sample_size": n,
+            "confidence_interval": None
+        }
+    return _sampled_silhouette(X, labels, sample_size, random_state)
+
+
+def _sampled_silhouette(X, labels, sample_size, random_state, population_counts=None):
+    """
+    Stratified-sample silhouette estimate with a normal-approximation CI.
+
+    population_counts (indexed by cluster id) gives the true cluster sizes
+    when X is itself a sample of a larger stream.
+    """
+    rng = np.random.RandomState(random_state)
+    cluster_ids, available = np.unique(labels, return_counts=True)
+    if len(cluster_ids) < 2:
+        raise ValueError("Silhouette requires at least 2 clusters")
+    sizes = available if population_counts is None else population_counts[cluster_ids]
+    n = sizes.sum()
+
+    # Phân bổ mẫu theo tỷ lệ kích thước cụm, mỗi cụm ít nhất 2 điểm
+    alloc = np.maximum(2, np.round(sample_size * sizes / n).astype(int))
+    alloc = np.minimum(alloc, available)
+    sample_idx = np.concatenate([
+        rng.choice(np.flatnonzero(labels == c), size=m, replace=False)
+        for c, m in zip(cluster_ids, alloc)
+    ])
+    sample_labels = labels[sample_idx]
+    values = silhouette_samples(X[sample_idx], sample_labels)
+
+    # Ước lượng phân tầng: trọng số theo tỷ lệ thật của từng cụm
+    weights = sizes / n
+    estimate = 0.0
+    variance = 0.0
+    for c, w, m, size in zip(cluster_ids, weights, alloc, sizes):
+        v = values[sample_labels == c]
+        estimate += w * v.mean()
+        if m > 1:
+            fpc = (size - m) / (size - 1) if size > 1 else 0.0
+            variance += w ** 2 * v.var(ddof=1) / m * fpc
+    margin = 1.96 * np.sqrt(variance)
+    return {
+        "score": float(estimate),
+        "mode": "sampled",
+        "sample_size": int(len(sample_idx)),
+        "confidence_interval": [float(estimate - margin), float(estimate + margin)]
+    }
+
+
+def _simplified_silhouette(X, labels, centroids, chunk_size=65536):
+    """Centroid-based silhouette: a = dist to own centroid, b = nearest other centroid"""
+    total = 0.0
+    k = len(centroids)
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        chunk_labels = labels[start:start + chunk_size]
+        dist = np.sqrt(_squared_distances(chunk, centroids))
+        rows = np.arange(len(chunk))
+        a = dist[rows, chunk_labels]
+        dist[rows, chunk_labels] = np.inf
+        b = dist.min(axis=1) if k > 1 else np.zeros_like(a)
+        denom = np.maximum(a, b)
+        s = np.where(denom > 0, (b - a) / np.where(denom > 0, denom, 1), 0.0)
+        total += s.sum()
+    return total / len(X)
+
+
+# ==================== PARALLEL K SWEEP ====================
+# Mỗi worker process attach vào cùng một shared memory block chứa X,
+# nên ma trận chỉ được copy một lần thay vì pickle cho từng K.
+_shared_X = None
+_shared_block = None
+
+
+def _init_k_worker(shm_name, shape, dtype):
+    """Attach worker process to the shared X matrix"""
+    global _shared_X, _shared_block
+    _shared_block = shared_memory.SharedMemory(name=shm_name)
+    _shared_X = np.ndarray(shape, dtype=dtype, buffer=_shared_block.buf)
+
+
+def _score_k(X, k, silhouette_mode, sample_size):
+    """Fit one candidate K and return its silhouette score"""
+    kmeans = KMeans(n_clusters=k, n_init=10, random_state=42)
+    labels = kmeans.fit_predict(X)
+    return compute_silhouette(
+        X, labels, kmeans.cluster_centers_, silhouette_mode, sample_size
+    )["score"]
+
+
+def _score_k_shared(k, silhouette_mode, sample_size):
+    """Score K against the shared matrix (runs inside a worker)"""
+    # Tránh oversubscription: mỗi process chỉ dùng 1 BLAS/OpenMP thread
+    with threadpool_limits(limits=1):
+        return _score_k(_shared_X, k, silhouette_mode, sample_size)
+
 
 class KMeansEngine:
-    def __init__(self):
+    def __init__(self, silhouette_mode="auto", silhouette_sample_size=DEFAULT_SILHOUETTE_SAMPLE):
+        if silhouette_mode not in SILHOUETTE_MODES:
+            raise ValueError(f"Unknown silhouette mode: {silhouette_mode}")
+        self.silhouette_mode = silhouette_mode
+        self.silhouette_sample_size = silhouette_sample_size
         self.model = None
         self.labels = None
         self.centroids = None
+        self.inertia = None
         self.silhouette = None
+        self.silhouette_info = None
         self.db_index = None
         self.pca_model = None
         self.pca_points = None
+        self.k_search = None
+        self.stream_stats = None
+        # callback(dict) nhận tiến độ: stage, k, restart, inertia...
+        self.progress_callback = None
+        # cancel_check() ném exception khi job bị hủy; được gọi cả lúc chờ sweep K
+        self.cancel_check = None
+
+    def _report(self, **info):
+        """Send a progress update to the callback, if any"""
+        if self.progress_callback is not None:
+            self.progress_callback(info)
+
+    def auto_select_k(self, X, k_range=(2, 5), n_jobs=None, time_budget=None):
+        """
+        Auto-select K using Silhouette Score.
+
+        Candidate Ks are fitted in parallel on a process pool sharing X.
+        If time_budget (seconds, wall-clock) runs out, the best K among
+        the finished candidates is returned; if none finished, k_min.
+        """
+        k_min, k_max = k_range
+        candidates = list(range(k_min, min(k_max, len(X) - 1) + 1))
+        if not candidates:
+            raise ValueError(f"Not enough samples for K range {k_range}")
 
-    def auto_select_k(self, X, k_range=(2, 5)):
-        """Auto-select K using Silhouette Score"""
-        best_k = 2
-        best_score = -1
+        if n_jobs is None:
+            n_jobs = os.cpu_count() or 1
+        n_jobs = max(1, min(n_jobs, len(candidates)))
+
+        start = time.perf_counter()
+        if n_jobs == 1:
+            scores, pending = self._sweep_sequential(X, candidates, start, time_budget)
+        else:
+            scores, pending = self._sweep_parallel(X, candidates, n_jobs, start, time_budget)
+
+        if scores:
+            best_k = max(scores, key=lambda k: scores[k])
+        else:
+            # Hết budget trước khi K nào xong: vẫn trả về một K dùng được
+            best_k = candidates[0]
+        self.k_search = {
+            "k_range": [k_min, k_max],
+            "evaluated": sorted(scores),
+            "skipped": sorted(pending),
+            "budget_exhausted": bool(pending),
+            "fallback": not scores,
+            "n_jobs": n_jobs,
+            "elapsed_seconds": round(time.perf_counter() - start, 3)
+        }
+        return best_k, {k: scores[k] for k in sorted(scores)}
+
+    def _sweep_sequential(self, X, candidates, start, time_budget):
+        """
+        Evaluate Ks in-process, stopping when the budget runs out.
+
+        The budget is checked between the n_init restarts of each K, so a
+        slow fit overruns it by at most one restart; a K whose restarts did
+        not all finish counts as skipped.
+        """
+        deadline = start + time_budget if time_budget is not None else None
         scores = {}
+        for i, k in enumerate(candidates):
+            model = self._fit_restarts(X, k, deadline=deadline, report=False)
+            if model is None:
+                return scores, candidates[i:]
+            scores[k] = compute_silhouette(
+                X, model.labels_, model.cluster_centers_, self.silhouette_mode, self.silhouette_sample_size
+            )["score"]
+            self._report(stage="auto_k", k=k, score=scores[k],
+                         evaluated=len(scores), candidates=len(candidates))
+        return scores, []
+
+    def _sweep_parallel(self, X, candidates, n_jobs, start, time_budget):
+        """
+        Evaluate Ks on a process pool, returning whatever finished in budget.
 
-        for k in range(k_range[0], k_range[1] + 1):
-            kmeans = KMeans(n_clusters=k, n_init=10, random_state=42)
-            labels = kmeans.fit_predict(X)
-            score = silhouette_score(X, labels)
-            scores[k] = score
+        The pool is terminated on exit, so fits still running when the
+        budget runs out do not keep worker processes alive.
+        """
+        X = np.ascontiguousarray(X)
+        shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+            finished = queue.Queue()
+            with multiprocessing.Pool(
+                n_jobs, initializer=_init_k_worker, initargs=(shm.name, X.shape, X.dtype.str)
+            ) as pool:
+                # K nhỏ chạy nhanh nên submit trước: hết budget vẫn có nhiều K được đánh giá
+                for k in candidates:
+                    pool.apply_async(
+                        _score_k_shared, (k, self.silhouette_mode, self.silhouette_sample_size),
+                        callback=lambda score, k=k: finished.put((k, score, None)),
+                        error_callback=lambda error, k=k: finished.put((k, None, error))
+                    )
+                scores = {}
+                pending = list(candidates)
+                while pending:
+                    # Exception (vd. job bị hủy) thoát khỏi with -> pool.terminate()
+                    if self.cancel_check is not None:
+                        self.cancel_check()
+                    timeout = SWEEP_POLL_SECONDS
+                    if time_budget is not None:
+                        remaining = time_budget - (time.perf_counter() - start)
+                        if remaining <= 0:
+                            break
+                        timeout = min(timeout, remaining)
+                    try:
+                        k, score, error = finished.get(timeout=timeout)
+                    except queue.Empty:
+                        continue
+                    if error is not None:
+                        raise error
+                    pending.remove(k)
+                    scores[k] = score
+                    self._report(stage="auto_k", k=k, score=score,
+                                 evaluated=len(scores), candidates=len(candidates))
+            return scores, pending
+        finally:
+            shm.close()
+            shm.unlink()
 
-            if score > best_score:
-                best_score = score
-                best_k = k
+    def _fit_restarts(self, X, k, n_init=10, deadline=None, report=True):
+        """
+        Run the n_init restarts one by one so progress can be reported and
+        cancellation / the deadline (time.perf_counter() value) checked
+        between them. Returns None if the deadline passes first.
 
-        return best_k, scores
+        Sharing one RandomState across single-init fits reproduces
+        KMeans(n_init=10, random_state=42) exactly.
+        """
+        random_state = np.random.RandomState(42)
+        best = None
+        for restart in range(n_init):
+            if self.cancel_check is not None:
+                self.cancel_check()
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            model = KMeans(n_clusters=k, n_init=1, random_state=random_state).fit(X)
+            if best is None or model.inertia_ < best.inertia_:
+                best = model
+            if report:
+                self._report(stage="fit", k=k, restart=restart + 1, n_init=n_init,
+                             inertia=float(model.inertia_), best_inertia=float(best.inertia_))
+        return best
 
     def fit(self, X, k):
         """Fit K-means model"""
-        self.model = KMeans(n_clusters=k, n_init=10, random_state=42)
-        self.labels = self.model.fit_predict(X)
+        self.model = self._fit_restarts(X, k)
+        self.labels = self.model.labels_
         self.centroids = self.model.cluster_centers_
+        self.inertia = float(self.model.inertia_)
         
         # Calculate metrics
-        self.silhouette = float(silhouette_score(X, self.labels))
+        self.silhouette_info = compute_silhouette(
+            X, self.labels, self.centroids,
+            self.silhouette_mode, self.silhouette_sample_size
+        )
+        self.silhouette = self.silhouette_info["score"]
         self.db_index = float(davies_bouldin_score(X, self.labels))
         
         # PCA for visualization
@@ -48,62 +374,392 @@ class KMeansEngine:
 
         return {
             "k": k,
+            "inertia": float(self.model.inertia_),
             "silhouette_score": self.silhouette,
+            "silhouette_info": self.silhouette_info,
             "davies_bouldin_index": self.db_index,
             "status": "success"
         }
 
+    def fit_stream(self, chunk_source, k, batch_size=4096, n_epochs=3):
+        """
+        Fit Mini-Batch K-means from a stream of preprocessed row chunks.
+
+        chunk_source is a callable returning a fresh iterator of 2D arrays
+        (e.g. slices of X, a chunked CSV reader or a DW cursor after
+        preprocessing). Centroids and the PCA projection are updated
+        incrementally; labels, PCA points and metrics come from a final
+        chunked assignment pass, so the full matrix is never materialized.
+        """
+        self.model = MiniBatchKMeans(
+            n_clusters=k, batch_size=batch_size, n_init=3, random_state=42
+        )
+        pca = IncrementalPCA(n_components=2)
+
+        for epoch in range(n_epochs):
+            for chunk in chunk_source():
+                if len(chunk) < k:
+                    continue
+                self.model.partial_fit(chunk)
+                # PCA chỉ cần một lượt dữ liệu
+                if epoch == 0 and len(chunk) >= 2:
+                    pca.partial_fit(chunk)
+            if hasattr(self.model, "inertia_"):
+                self._report(stage="fit", k=k, epoch=epoch + 1, n_epochs=n_epochs,
+                             inertia=float(self.model.inertia_))
+        if not hasattr(self.model, "cluster_centers_"):
+            raise ValueError("Not enough rows to fit the model")
+        self.centroids = self.model.cluster_centers_
+        self.pca_model = pca
+
+        # Lượt gán nhãn: labels, PCA points, Davies-Bouldin và mẫu cho silhouette
+        rng = np.random.RandomState(42)
+        labels, points = [], []
+        dist_sum = np.zeros(k)
+        inertia = 0.0
+        counts = np.zeros(k, dtype=np.int64)
+        reservoir, reservoir_labels, reservoir_keys = None, None, None
+        self.stream_stats = None
+        for chunk in chunk_source():
+            sq_dist = _squared_distances(chunk, self.centroids)
+            chunk_labels = sq_dist.argmin(axis=1)
+            own_sq = sq_dist[np.arange(len(chunk)), chunk_labels]
+            inertia += float(own_sq.sum())
+            own = np.sqrt(own_sq)
+            dist_sum += np.bincount(chunk_labels, weights=own, minlength=k)
+            counts += np.bincount(chunk_labels, minlength=k)
+            labels.append(chunk_labels)
+            points.append(pca.transform(chunk).astype(chunk.dtype, copy=False))
+            if self.stream_stats is None:
+                self.stream_stats = ClusterStatsAccumulator(k, chunk.shape[1])
+            self.stream_stats.update(chunk, chunk_labels)
+
+            # Reservoir sampling theo khóa ngẫu nhiên: giữ sample_size khóa nhỏ nhất
+            keys = rng.random_sample(len(chunk))
+            if reservoir is None:
+                reservoir, reservoir_labels, reservoir_keys = chunk, chunk_labels, keys
+            else:
+                reservoir = np.concatenate([reservoir, chunk])
+                reservoir_labels = np.concatenate([reservoir_labels, chunk_labels])
+                reservoir_keys = np.concatenate([reservoir_keys, keys])
+            if len(reservoir_keys) > self.silhouette_sample_size:
+                keep = np.argpartition(reservoir_keys, self.silhouette_sample_size)
+                keep = keep[:self.silhouette_sample_size]
+                reservoir = reservoir[keep]
+                reservoir_labels = reservoir_labels[keep]
+                reservoir_keys = reservoir_keys[keep]
+
+        self.labels = np.concatenate(labels)
+        self.pca_points = np.concatenate(points)
+        self.inertia = inertia
+
+        # Davies-Bouldin từ khoảng cách trung bình tới tâm cụm
+        scatter = np.divide(dist_sum, counts, out=np.zeros(k), where=counts > 0)
+        centroid_dist = np.sqrt(_squared_distances(self.centroids, self.centroids))
+        np.fill_diagonal(centroid_dist, np.inf)
+        ratios = (scatter[:, None] + scatter[None, :]) / centroid_dist
+        self.db_index = float(ratios.max(axis=1).mean())
+
+        if self.silhouette_mode == "simplified":
+            self.silhouette_info = compute_silhouette(
+                reservoir, reservoir_labels, self.centroids,
+                "simplified", self.silhouette_sample_size
+            )
+        else:
+            self.silhouette_info = _sampled_silhouette(
+                reservoir, reservoir_labels, self.silhouette_sample_size, 42,
+                population_counts=counts
+            )
+        self.silhouette = self.silhouette_info["score"]
+
+        return {
+            "k": k,
+            "mode": "minibatch",
+            "n_samples": int(len(self.labels)),
+            "inertia": inertia,
+            "silhouette_score": self.silhouette,
+            "silhouette_info": self.silhouette_info,
+            "davies_bouldin_index": self.db_index,
+            "status": "success"
+        }
+
+    def precision_drift(self, X, inertia, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Compare a reduced-precision fit against float64 arithmetic.
+
+        Recomputes the assignment and inertia in float64 from the fitted
+        centroids, chunk by chunk, and reports how many labels flip.
+        """
+        centroids = self.centroids.astype(np.float64)
+        rows_changed = 0
+        inertia_ref = 0.0
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size].astype(np.float64)
+            chunk_labels = self.labels[start:start + len(chunk)]
+            sq_dist = _squared_distances(chunk, centroids)
+            rows_changed += int((sq_dist.argmin(axis=1) != chunk_labels).sum())
+            inertia_ref += float(sq_dist[np.arange(len(chunk)), chunk_labels].sum())
+        return {
+            "reference": "float64",
+            "label_changes": rows_changed,
+            "label_agreement": 1.0 - rows_changed / len(X) if len(X) else 1.0,
+            "inertia_float64": inertia_ref,
+            "inertia_relative_error": abs(inertia - inertia_ref) / inertia_ref if inertia_ref else 0.0
+        }
+
+    def predict(self, X, chunk_size=DEFAULT_CHUNK_SIZE, return_distances=False):
+        """
+        Assign rows to the nearest fitted centroid, chunk by chunk.
+
+        With return_distances=True also returns each row's squared distance
+        to its centroid.
+        """
+        if self.centroids is None:
+            raise ValueError("Model is not fitted")
+        labels = np.empty(len(X), dtype=np.int32)
+        distances = np.empty(len(X), dtype=np.float64) if return_distances else None
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size]
+            sq_dist = _squared_distances(chunk, self.centroids)
+            chunk_labels = sq_dist.argmin(axis=1)
+            labels[start:start + len(chunk)] = chunk_labels
+            if return_distances:
+                distances[start:start + len(chunk)] = sq_dist[np.arange(len(chunk)), chunk_labels]
+        if return_distances:
+            return labels, distances
+        return labels
+
+    def predict_chunks(self, chunks, return_distances=False):
+        """Assign an iterable of preprocessed chunks; returns concatenated labels (and distances)"""
+        results = [self.predict(chunk, return_distances=return_distances) for chunk in chunks]
+        if not return_distances:
+            if not results:
+                return np.empty(0, dtype=np.int32)
+            return np.concatenate(results)
+        if not results:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        return (np.concatenate([labels for labels, _ in results]),
+                np.concatenate([distances for _, distances in results]))
+
+    def assignment_drift(self, labels, sq_distances):
+        """
+        Compare newly assigned rows with the fitted data.
+
+        inertia_ratio: mean squared distance to the centroid, new rows vs fit
+        (None when the fit inertia is unknown). size_shift: total variation
+        distance between the cluster size distributions (0 = same, 1 = disjoint).
+        """
+        k = len(self.centroids)
+        n = len(labels)
+        fitted_counts = np.bincount(np.asarray(self.labels), minlength=k) if self.labels is not None else None
+        new_counts = np.bincount(labels, minlength=k)
+        new_shares = new_counts / n if n else np.zeros(k)
+
+        mean_sq = float(sq_distances.mean()) if n else 0.0
+        baseline_sq = None
+        if self.inertia is not None and fitted_counts is not None and fitted_counts.sum():
+            baseline_sq = self.inertia / float(fitted_counts.sum())
+
+        size_shift = None
+        fitted_shares = None
+        if fitted_counts is not None and fitted_counts.sum():
+            fitted_shares = fitted_counts / fitted_counts.sum()
+            size_shift = float(0.5 * np.abs(new_shares - fitted_shares).sum()) if n else 0.0
+
+        return {
+            "n_rows": int(n),
+            "mean_sq_distance": mean_sq,
+            "fitted_mean_sq_distance": baseline_sq,
+            "inertia_ratio": mean_sq / baseline_sq if baseline_sq else None,
+            "cluster_shares": new_shares.tolist(),
+            "fitted_cluster_shares": fitted_shares.tolist() if fitted_shares is not None else None,
+            "size_shift": size_shift
+        }
+
     def get_results(self):
         """Get clustering results"""
         if self.labels is None:
             return None
 
         pca_data = [
-            {
-                "x": float(self.pca_points[i, 0]),
-                "y": float(self.pca_points[i, 1]),
-                "label": int(self.labels[i])
-            }
-            for i in range(len(self.labels))
+            {"x": x, "y": y, "label": label}
+            for x, y, label in zip(
+                self.pca_points[:, 0].tolist(), self.pca_points[:, 1].tolist(), self.labels.tolist()
+            )
         ]
 
+        # Chiếu tất cả centroid trong một lần transform
+        centroid_points = self.pca_model.transform(self.centroids)
         centroids_data = [
-            {
-                "id": int(i),
-                "x": float(self.pca_model.transform([self.centroids[i]])[0, 0]),
-                "y": float(self.pca_model.transform([self.centroids[i]])[0, 1])
-            }
-            for i in range(len(self.centroids))
+            {"id": i, "x": x, "y": y}
+            for i, (x, y) in enumerate(centroid_points.tolist())
         ]
 
+        # Mảng numpy được response JSON ghi thẳng (fast_json)
         return {
-            "labels": self.labels.tolist(),
-            "centroids": self.centroids.tolist(),
+            "labels": self.labels,
+            "centroids": self.centroids,
             "pca_points": pca_data,
             "centroid_positions": centroids_data,
-            "metrics": {
-                "silhouette": self.silhouette,
-                "davies_bouldin": self.db_index
-            }
+            "metrics": self.get_metrics()
+        }
+
+    def get_metrics(self):
+        """Get clustering quality metrics"""
+        return {
+            "silhouette": self.silhouette,
+            "silhouette_info": self.silhouette_info,
+            "davies_bouldin": self.db_index
+        }
+
+    def get_columnar_results(self):
+        """Get clustering results as typed column arrays (x, y, label, centroids)"""
+        if self.labels is None:
+            return None
+
+        centroid_points = self.pca_model.transform(self.centroids)
+        return {
+            "x": self.pca_points[:, 0],
+            "y": self.pca_points[:, 1],
+            "label": self.labels,
+            "centroid_x": centroid_points[:, 0],
+            "centroid_y": centroid_points[:, 1],
+            "centroids": self.centroids
+        }
+
+    def get_level_of_detail(self, viewport=None, resolution=256, mode="bins"):
+        """
+        Aggregate PCA points for a viewport at a fixed grid resolution.
+
+        - bins: one entry per (cluster, grid cell) at the cell centre with its count
+        - sample: one real point per (cluster, grid cell), weighted by the count
+        Output size is bounded by k * resolution^2 regardless of dataset size.
+        """
+        if self.pca_points is None:
+            return None
+        if mode not in ("bins", "sample"):
+            raise ValueError(f"Unknown level-of-detail mode: {mode}")
+
+        x, y = self.pca_points[:, 0], self.pca_points[:, 1]
+        if viewport is None:
+            viewport = (float(x.min()), float(x.max()), float(y.min()), float(y.max()))
+        x_min, x_max, y_min, y_max = viewport
+        if not (x_max >= x_min and y_max >= y_min):
+            raise ValueError("Invalid viewport")
+        # Zoom vào một điểm / mọi điểm cùng tọa độ: nới viewport thay vì báo lỗi
+        x_min, x_max = _widen_range(x_min, x_max)
+        y_min, y_max = _widen_range(y_min, y_max)
+
+        visible = np.flatnonzero((x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max))
+        cell_w = (x_max - x_min) / resolution
+        cell_h = (y_max - y_min) / resolution
+        bx = np.minimum(((x[visible] - x_min) / cell_w).astype(np.int64), resolution - 1)
+        by = np.minimum(((y[visible] - y_min) / cell_h).astype(np.int64), resolution - 1)
+        labels = self.labels[visible].astype(np.int64)
+
+        # Một khóa duy nhất cho (cluster, ô lưới) rồi gom nhóm bằng np.unique
+        keys = (labels * resolution + by) * resolution + bx
+        unique_keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+        cell_labels = unique_keys // (resolution * resolution)
+        if mode == "bins":
+            cells = unique_keys % (resolution * resolution)
+            out_x = x_min + (cells % resolution + 0.5) * cell_w
+            out_y = y_min + (cells // resolution + 0.5) * cell_h
+        else:
+            picked = visible[first_index]
+            out_x, out_y = x[picked], y[picked]
+
+        return {
+            "mode": mode,
+            "viewport": [x_min, x_max, y_min, y_max],
+            "resolution": resolution,
+            "total_points": int(len(x)),
+            "visible_points": int(len(visible)),
+            "x": out_x,
+            "y": out_y,
+            "label": cell_labels,
+            "count": counts
         }
 
     def get_cluster_statistics(self, X, feature_names):
-        """Get statistics per cluster"""
+        """
+        Get statistics per cluster (size, mean, std, min/max, quantiles).
+
+        Pass X=None after fit_stream to use the statistics accumulated
+        during the streaming assignment pass.
+        """
         if self.labels is None:
             return None
+        if X is None:
+            if self.stream_stats is None:
+                return None
+            return self.stream_stats.finalize(self.centroids, feature_names)
+        return compute_cluster_statistics(X, self.labels, self.centroids, feature_names)
+
+
+def run_clustering(X, feature_names, k=None, auto_k=False, k_min=2, k_max=5,
+                   time_budget=None, n_jobs=None, silhouette_mode="auto",
+                   silhouette_sample_size=DEFAULT_SILHOUETTE_SAMPLE, mode="full",
+                   chunk_size=DEFAULT_CHUNK_SIZE, batch_size=4096, progress_callback=None,
+                   chunk_source=None, cancel_check=None):
+    """
+    Full /kmeans pipeline: choose K, fit, cluster statistics.
+
+    Shared by the synchronous endpoint and background jobs. In minibatch
+    mode chunk_source (a callable returning fresh preprocessed row chunks)
+    can replace X, so the matrix is never materialized.
+    Returns (engine, k_info, fit_result, cluster_stats); raises ValueError
+    for invalid options.
+    """
+    if mode not in ("full", "minibatch"):
+        raise ValueError(f"Unknown mode: {mode}")
+    if chunk_source is not None and mode != "minibatch":
+        raise ValueError("Streamed input requires mode=minibatch")
+    kmeans_engine = KMeansEngine(silhouette_mode, silhouette_sample_size)
+    kmeans_engine.progress_callback = progress_callback
+    kmeans_engine.cancel_check = cancel_check
+
+    # Auto-select K or use provided K
+    if auto_k:
+        if k_min < 2 or k_max < k_min:
+            raise ValueError("Invalid K range")
+        X_search = X
+        if chunk_source is not None:
+            X_search = sample_chunks(chunk_source, AUTO_K_MAX_ROWS)
+        elif mode == "minibatch" and len(X) > AUTO_K_MAX_ROWS:
+            rng = np.random.RandomState(42)
+            X_search = X[np.sort(rng.choice(len(X), AUTO_K_MAX_ROWS, replace=False))]
+        k, scores = kmeans_engine.auto_select_k(
+            X_search, k_range=(k_min, k_max), n_jobs=n_jobs, time_budget=time_budget
+        )
+        k_info = {
+            "method": "auto",
+            "selected_k": k,
+            "scores": scores,
+            "search": kmeans_engine.k_search
+        }
+    else:
+        k = k or 3
+        k_info = {"method": "manual", "selected_k": k}
+
+    # Fit model
+    if mode == "minibatch":
+        if chunk_source is None:
+            chunk_source = lambda: iter_array_chunks(X, chunk_size)
+        fit_result = kmeans_engine.fit_stream(chunk_source, k, batch_size=batch_size)
+    else:
+        fit_result = kmeans_engine.fit(X, k)
+
+    # Độ lệch số học khi chạy float32 so với float64 (cần X trong bộ nhớ)
+    fit_result["precision"] = kmeans_engine.pca_points.dtype.name if X is None else X.dtype.name
+    if X is not None and X.dtype != np.float64:
+        fit_result["drift"] = kmeans_engine.precision_drift(X, fit_result["inertia"], chunk_size)
+
+    # Minibatch đã tích lũy thống kê trong lượt gán nhãn, không cần quét lại X
+    kmeans_engine._report(stage="statistics", k=k)
+    stats_source = None if mode == "minibatch" else X
+    cluster_stats = kmeans_engine.get_cluster_statistics(stats_source, feature_names)
 
-        stats = {}
-        for cluster_id in range(len(self.centroids)):
-            mask = self.labels == cluster_id
-            cluster_data = X[mask]
-
-            stats[cluster_id] = {
-                "size": int(np.sum(mask)),
-                "percentage": float(np.sum(mask) / len(self.labels) * 100),
-                "centroid": self.centroids[cluster_id].tolist(),
-                "mean": cluster_data.mean(axis=0).tolist(),
-                "std": cluster_data.std(axis=0).tolist(),
-                "features": feature_names
-            }
-
-        return stats
+    kmeans_engine.progress_callback = None
+    kmeans_engine.cancel_check = None
+    return kmeans_engine, k_info, fit_result, cluster_stats
@@ -0,0 +1,224 @@
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+
+from preprocessing import DataPreprocessor
+from kmeans_engine import KMeansEngine
+
+FORMAT_VERSION = 1
+DEFAULT_MODEL_DIR = os.environ.get(
+    "KPDL_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+MODEL_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Mảng lớn (theo số dòng) được load bằng memory-map, mảng nhỏ load vào RAM
+_MMAP_ARRAYS = ("labels", "pca_points")
+
+
+def _json_safe(value):
+    """Convert numpy scalars / NaN to plain JSON values"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+class ModelRegistry:
+    """
+    Lưu model đã fit (preprocessor + K-means) xuống đĩa theo id và version.
+
+    Layout: <root>/<model_id>/v<version>/{manifest.json, cluster_stats.json, *.npy}
+    """
+
+    def __init__(self, root_dir=DEFAULT_MODEL_DIR):
+        self.root_dir = root_dir
+
+    def _model_dir(self, model_id):
+        if not MODEL_ID_PATTERN.match(model_id):
+            raise ValueError("Invalid model id")
+        return os.path.join(self.root_dir, model_id)
+
+    def _versions(self, model_id):
+        model_dir = self._model_dir(model_id)
+        if not os.path.isdir(model_dir):
+            return []
+        return sorted(
+            int(name[1:]) for name in os.listdir(model_dir)
+            if name.startswith("v") and name[1:].isdigit()
+        )
+
+    def save(self, preprocessor, kmeans_engine, cluster_stats=None, model_id=None, description=None):
+        """Persist a fitted model as a new version; returns (model_id, version)"""
+        if preprocessor.scaler is None or kmeans_engine.centroids is None:
+            raise ValueError("Model is not fitted")
+
+        model_id = model_id or uuid.uuid4().hex[:12]
+        model_dir = self._model_dir(model_id)
+        os.makedirs(model_dir, exist_ok=True)
+        versions = self._versions(model_id)
+        version = versions[-1] + 1 if versions else 1
+
+        # Ghi vào thư mục tạm rồi rename để không bao giờ có version ghi dở
+        tmp_dir = os.path.join(model_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            pca = kmeans_engine.pca_model
+            scaler = preprocessor.scaler
+            arrays = {
+                "centroids": kmeans_engine.centroids,
+                "labels": kmeans_engine.labels,
+                "pca_points": kmeans_engine.pca_points,
+                "pca_components": pca.components_,
+                "pca_mean": pca.mean_,
+                "pca_explained_variance": pca.explained_variance_,
+                "scaler_mean": scaler.mean_,
+                "scaler_scale": scaler.scale_,
+                "scaler_var": scaler.var_
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+            manifest = {
+                "format_version": FORMAT_VERSION,
+                "model_id": model_id,
+                "version": version,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "description": description,
+                "k": int(len(kmeans_engine.centroids)),
+                "n_samples": int(len(kmeans_engine.labels)),
+                "feature_columns": list(preprocessor.feature_columns),
+                "categorical_columns": list(preprocessor.categorical_columns),
+                "fill_values": {
+                    col: _json_safe(value) for col, value in preprocessor.fill_values.items()
+                },
+                "encoders": {
+                    col: [str(c) for c in le.classes_] for col, le in preprocessor.encoders.items()
+                },
+                "scaler_n_samples_seen": int(np.max(scaler.n_samples_seen_)),
+                "precision": preprocessor.precision,
+                "metrics": {
+                    "inertia": kmeans_engine.inertia,
+                    "silhouette": kmeans_engine.silhouette,
+                    "silhouette_info": kmeans_engine.silhouette_info,
+                    "davies_bouldin": kmeans_engine.db_index
+                }
+            }
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            if cluster_stats is not None:
+                with open(os.path.join(tmp_dir, "cluster_stats.json"), "w", encoding="utf-8") as f:
+                    json.dump(cluster_stats, f, ensure_ascii=False, default=_json_safe)
+
+            os.rename(tmp_dir, os.path.join(model_dir, f"v{version}"))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return model_id, version
+
+    def list_models(self):
+        """List saved models with the manifest of their latest version"""
+        if not os.path.isdir(self.root_dir):
+            return []
+        models = []
+        for model_id in sorted(os.listdir(self.root_dir)):
+            if not MODEL_ID_PATTERN.match(model_id):
+                continue
+            versions = self._versions(model_id)
+            if not versions:
+                continue
+            manifest = self.get_manifest(model_id, versions[-1])
+            models.append({
+                "model_id": model_id,
+                "versions": versions,
+                "latest": {
+                    key: manifest.get(key)
+                    for key in ("version", "created_at", "description", "k", "n_samples",
+                                "feature_columns", "metrics")
+                }
+            })
+        return models
+
+    def _version_dir(self, model_id, version=None):
+        versions = self._versions(model_id)
+        if not versions:
+            raise KeyError(f"Model not found: {model_id}")
+        if version is None:
+            version = versions[-1]
+        if version not in versions:
+            raise KeyError(f"Version {version} not found for model {model_id}")
+        return os.path.join(self._model_dir(model_id), f"v{version}")
+
+    def get_manifest(self, model_id, version=None):
+        """Read the manifest of a model version (latest by default)"""
+        with open(os.path.join(self._version_dir(model_id, version), "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, model_id, version=None):
+        """
+        Rebuild (preprocessor, kmeans_engine, cluster_stats, manifest) without refitting.
+
+        Per-row arrays (labels, PCA points) are memory-mapped read-only.
+        """
+        version_dir = self._version_dir(model_id, version)
+        with open(os.path.join(version_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        def load_array(name):
+            mmap_mode = "r" if name in _MMAP_ARRAYS else None
+            return np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        features = manifest["feature_columns"]
+
+        scaler = StandardScaler(copy=False)
+        scaler.mean_ = load_array("scaler_mean")
+        scaler.scale_ = load_array("scaler_scale")
+        scaler.var_ = load_array("scaler_var")
+        scaler.n_features_in_ = len(features)
+        scaler.n_samples_seen_ = manifest["scaler_n_samples_seen"]
+
+        preprocessor = DataPreprocessor()
+        preprocessor.scaler = scaler
+        preprocessor.feature_columns = features
+        preprocessor.numeric_columns = features
+        preprocessor.processed_columns = features
+        preprocessor.categorical_columns = manifest["categorical_columns"]
+        preprocessor.fill_values = manifest["fill_values"]
+        preprocessor.precision = manifest.get("precision", "float64")
+        for col, classes in manifest["encoders"].items():
+            le = LabelEncoder()
+            le.classes_ = np.array(classes, dtype=object)
+            preprocessor.encoders[col] = le
+
+        pca = PCA(n_components=2)
+        pca.components_ = load_array("pca_components")
+        pca.mean_ = load_array("pca_mean")
+        pca.explained_variance_ = load_array("pca_explained_variance")
+        pca.n_components_ = len(pca.components_)
+        pca.n_features_in_ = len(features)
+
+        metrics = manifest["metrics"]
+        kmeans_engine = KMeansEngine()
+        kmeans_engine.centroids = load_array("centroids")
+        kmeans_engine.labels = load_array("labels")
+        kmeans_engine.pca_points = load_array("pca_points")
+        kmeans_engine.pca_model = pca
+        kmeans_engine.inertia = metrics.get("inertia")
+        kmeans_engine.silhouette = metrics["silhouette"]
+        kmeans_engine.silhouette_info = metrics["silhouette_info"]
+        kmeans_engine.db_index = metrics["davies_bouldin"]
+
+        cluster_stats = None
+        stats_path = os.path.join(version_dir, "cluster_stats.json")
+        if os.path.exists(stats_path):
+            with open(stats_path, encoding="utf-8") as f:
+                cluster_stats = {int(k): v for k, v in json.load(f).items()}
+
+        return preprocessor, kmeans_engine, cluster_stats, manifest
@@ -2,70 +2,149 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 import io
-import json
+from openpyxl import load_workbook
+
+def is_categorical(series):
+    """Columns treated as categorical: object, string or category dtype"""
+    return (
+        series.dtype == 'object'
+        or isinstance(series.dtype, pd.CategoricalDtype)
+        or pd.api.types.is_string_dtype(series.dtype)
+    )
+
+# Độ chính xác của ma trận đã tiền xử lý (và toàn bộ pipeline phía sau)
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+DRIFT_SAMPLE_ROWS = 10000
+STREAM_CHUNK_ROWS = 100000
+STREAM_MEDIAN_SAMPLE = 20000  # số giá trị / cột giữ lại để ước lượng median khi fit theo chunk
+
+
+def iter_frame_chunks(df, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield consecutive row slices of an in-memory DataFrame"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _most_frequent(counts):
+    """Mode from value counts; ties go to the smallest value, like Series.mode()"""
+    if not counts:
+        return None
+    top = max(counts.values())
+    candidates = [value for value, count in counts.items() if count == top]
+    try:
+        return sorted(candidates)[0]
+    except TypeError:
+        return candidates[0]
+
+
+def compact_dataframe(df, max_category_ratio=0.5):
+    """
+    Downcast columns to smaller dtypes.
+
+    Text columns with at most max_category_ratio distinct values per row
+    become category, integers the smallest signed int that holds them and
+    float64 becomes float32. Returns (compacted_df, savings) where savings
+    maps each changed column to its dtype and byte size before / after.
+    """
+    columns = []
+    savings = {}
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        dtype = series.dtype
+        if is_categorical(series):
+            if (not isinstance(dtype, pd.CategoricalDtype) and len(series)
+                    and series.nunique() <= max_category_ratio * len(series)):
+                series = series.astype("category")
+        elif isinstance(dtype, np.dtype) and dtype.kind in "iu":
+            series = pd.to_numeric(series, downcast="integer")
+        elif isinstance(dtype, np.dtype) and dtype.kind == "f" and dtype.itemsize > 4:
+            series = series.astype(np.float32)
+
+        if series.dtype != dtype:
+            before = int(df.iloc[:, i].memory_usage(deep=True, index=False))
+            after = int(series.memory_usage(deep=True, index=False))
+            savings[df.columns[i]] = {
+                "dtype_before": str(dtype),
+                "dtype_after": str(series.dtype),
+                "bytes_before": before,
+                "bytes_after": after,
+                "bytes_saved": before - after
+            }
+        columns.append(series)
+    if not columns:
+        return df, savings
+    return pd.concat(columns, axis=1), savings
+
+
+def inspect_workbook(source):
+    """
+    Sheet names, dimensions and header names of an .xlsx workbook.
+
+    Reads the workbook in read-only streaming mode: row/column counts come
+    from each sheet's dimension record and only the header row is read, so
+    no sheet is parsed into a DataFrame.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheets_info = []
+        for sheet_name in workbook.sheetnames:
+            ws = workbook[sheet_name]
+            if not hasattr(ws, "iter_rows"):  # chartsheet
+                continue
+            if ws.max_row is None:
+                # File không ghi dimension: phải quét các dòng một lần
+                ws.calculate_dimension(force=True)
+            header = next(ws.iter_rows(min_row=ws.min_row, max_row=ws.min_row, values_only=True), ())
+            column_names = [name for name in header if name is not None]
+            sheets_info.append({
+                "name": sheet_name,
+                "rows": max((ws.max_row or 0) - (ws.min_row or 1), 0),
+                "columns": len(column_names),
+                "column_names": column_names[:5]  # First 5 columns
+            })
+        return sheets_info
+    finally:
+        workbook.close()
+
 
 class DataPreprocessor:
     def __init__(self):
         self.scaler = None
         self.encoders = {}
+        self.fill_values = {}
+        self.feature_columns = []
+        self.categorical_columns = []
         self.numeric_columns = []
         self.original_shape = None
         self.processed_columns = []
-        self.file_content = None
         self.filename = None
         self.sheet_names = []
+        self.memory_savings = {}
+        self.precision = "float64"
 
-    def load_file(self, file_content, filename, sheet_name=None):
-        """Load CSV or XLSX file, optionally selecting a specific sheet"""
+    def load_upload(self, upload, sheet_name=None):
+        """Load a SpooledUpload (CSV or a sheet of an XLSX) from its on-disk copy"""
         try:
-            self.file_content = file_content
-            self.filename = filename
-            
-            if filename.endswith('.csv'):
-                df = pd.read_csv(io.BytesIO(file_content))
-                self.sheet_names = []
-            else:  # .xlsx
-                # Get sheet names
-                xlsx = pd.ExcelFile(io.BytesIO(file_content))
-                self.sheet_names = xlsx.sheet_names
-                
-                # Load specific sheet or first sheet
-                if sheet_name and sheet_name in self.sheet_names:
-                    df = pd.read_excel(io.BytesIO(file_content), sheet_name=sheet_name)
-                else:
-                    df = pd.read_excel(io.BytesIO(file_content), sheet_name=0)
-            
+            self.filename = upload.filename
+            df, self.sheet_names = upload.load(sheet_name)
             self.original_shape = df.shape
             return df, None
         except Exception as e:
             return None, str(e)
 
+    def compact(self, df):
+        """Downcast df's dtypes (see compact_dataframe) and remember the savings"""
+        df, self.memory_savings = compact_dataframe(df)
+        return df
+
     def get_sheet_names(self):
         """Get list of sheet names for Excel files"""
         return self.sheet_names
 
-    def get_sheets_info(self, file_content, filename):
-        """Get info about all sheets in an Excel file"""
-        if not filename.endswith(('.xlsx', '.xls')):
-            return []
-        
-        try:
-            xlsx = pd.ExcelFile(io.BytesIO(file_content))
-            sheets_info = []
-            for sheet_name in xlsx.sheet_names:
-                df = xlsx.parse(sheet_name)
-                sheets_info.append({
-                    "name": sheet_name,
-                    "rows": df.shape[0],
-                    "columns": df.shape[1],
-                    "column_names": df.columns.tolist()[:5]  # First 5 columns
-                })
-            return sheets_info
-        except Exception as e:
-            return []
-
     def get_column_info(self, df):
-        """Get column names, types, and preview"""
+        """Get column names, types, memory footprint and preview"""
         columns = []
         for col in df.columns:
             col_info = {
@@ -73,22 +152,248 @@ class DataPreprocessor:
                 "type": str(df[col].dtype),
                 "non_null_count": int(df[col].notna().sum()),
                 "null_count": int(df[col].isna().sum()),
-                "unique_values": int(df[col].nunique())
+                "unique_values": int(df[col].nunique()),
+                "memory_bytes": int(df[col].memory_usage(deep=True, index=False))
             }
+            if col in self.memory_savings:
+                col_info["compaction"] = self.memory_savings[col]
             columns.append(col_info)
         
         # Clean preview: replace NaN with None for JSON serialization
-        preview_df = df.head(5).fillna("N/A")
+        preview_df = df.head(5)
+        for i, dtype in enumerate(preview_df.dtypes):
+            if isinstance(dtype, pd.CategoricalDtype):
+                # category không nhận giá trị "N/A" ngoài danh mục
+                preview_df = preview_df.astype({preview_df.columns[i]: object})
+            elif dtype == np.float32:
+                # Hiển thị 3.2 thay vì 3.200000047683716
+                preview_df = preview_df.astype({preview_df.columns[i]: str}).astype(
+                    {preview_df.columns[i]: np.float64}
+                )
+        preview_df = preview_df.fillna("N/A")
         preview = preview_df.to_dict('records')
         
+        memory_bytes = int(df.memory_usage(deep=True, index=False).sum())
+        saved_bytes = sum(info["bytes_saved"] for info in self.memory_savings.values())
         return {
             "shape": list(self.original_shape),
             "columns": columns,
             "preview": preview,
-            "sheets": self.sheet_names
+            "sheets": self.sheet_names,
+            "memory": {
+                "bytes": memory_bytes,
+                "saved_bytes": saved_bytes,
+                "compaction_ratio": (memory_bytes + saved_bytes) / memory_bytes if memory_bytes else 1.0
+            }
+        }
+
+    def fit_transform(self, df, selected_columns=None, precision=None):
+        """
+        Fit the pipeline and return the scaled matrix.
+
+        Mỗi bước chạy đúng một lần: fill -> encode ghi thẳng vào một ma trận
+        float64 (hoặc float32 nếu precision="float32"), sau đó scale in-place
+        trên chính ma trận đó.
+        """
+        if precision is not None:
+            if precision not in PRECISIONS:
+                raise ValueError(f"Unknown precision: {precision}")
+            self.precision = precision
+        columns = list(selected_columns) if selected_columns else df.columns.tolist()
+        self.feature_columns = columns
+        self.categorical_columns = []
+        self.fill_values = {}
+        self.encoders = {}
+
+        X = np.empty((len(df), len(columns)), dtype=PRECISIONS[self.precision])
+        for j, col in enumerate(columns):
+            series = df[col]
+            if is_categorical(series):
+                # Categorical: fill với mode
+                mode_val = series.mode()
+                fill = mode_val[0] if len(mode_val) > 0 else None
+                values = series.fillna(fill) if fill is not None else series
+                le = LabelEncoder()
+                le.fit(values.astype(str))
+                self.encoders[col] = le
+                self.categorical_columns.append(col)
+                self.fill_values[col] = fill
+                X[:, j] = self._encode(values, le)
+            else:
+                # Numeric: fill với median
+                fill = series.median()
+                self.fill_values[col] = fill
+                X[:, j] = series.fillna(fill).to_numpy(dtype=X.dtype)
+
+        self.scaler = StandardScaler(copy=False)
+        X = self.scaler.fit_transform(X)
+
+        self.numeric_columns = columns
+        self.processed_columns = columns
+        return X
+
+    def transform(self, df, handle_unknown="mode", unknown_counts=None):
+        """
+        Apply the fitted fill values, encoders and scaler to new rows.
+
+        handle_unknown: "mode" maps unseen categories to the fitted mode,
+        "error" raises ValueError. Counts of unseen values per column are
+        added to unknown_counts when a dict is given.
+        """
+        if self.scaler is None:
+            raise ValueError("Preprocessor is not fitted")
+        X = self._encode_frame(df, handle_unknown, unknown_counts, PRECISIONS[self.precision])
+        return self.scaler.transform(X, copy=False)
+
+    def transform_chunks(self, source, chunk_size=STREAM_CHUNK_ROWS, handle_unknown="mode",
+                         unknown_counts=None):
+        """Yield scaled matrices for row chunks of a DataFrame or an iterable of DataFrames"""
+        if isinstance(source, pd.DataFrame):
+            source = iter_frame_chunks(source, chunk_size)
+        for chunk in source:
+            yield self.transform(chunk, handle_unknown, unknown_counts)
+
+    def stream(self, chunk_source, handle_unknown="mode"):
+        """
+        Scaled matrices for the raw chunks of chunk_source().
+
+        functools.partial(preprocessor.stream, chunk_source) is a re-iterable
+        (and picklable) chunk source for KMeansEngine.fit_stream.
+        """
+        return self.transform_chunks(chunk_source(), handle_unknown=handle_unknown)
+
+    def fit_chunks(self, chunk_source, selected_columns=None, precision=None):
+        """
+        Fit the pipeline from raw DataFrame chunks without building the matrix.
+
+        chunk_source() must return a fresh iterator of chunks; it is read
+        twice: fill values and encoder classes first, then the scaler
+        (partial_fit on encoded chunks). Modes are exact; numeric medians come
+        from a sample of STREAM_MEDIAN_SAMPLE values per column, so they equal
+        fit()'s whenever a column has no more values than that.
+        Returns the number of rows.
+        """
+        if precision is not None:
+            if precision not in PRECISIONS:
+                raise ValueError(f"Unknown precision: {precision}")
+            self.precision = precision
+        columns = list(selected_columns) if selected_columns else None
+        categorical = None
+        counts, samples = {}, {}
+        rng = np.random.RandomState(42)
+        n_rows = 0
+        for chunk in chunk_source():
+            if categorical is None:
+                columns = columns or chunk.columns.tolist()
+                missing = [col for col in columns if col not in chunk.columns]
+                if missing:
+                    raise ValueError(f"Missing columns: {missing}")
+                categorical = [col for col in columns if is_categorical(chunk[col])]
+                counts = {col: {} for col in categorical}
+                samples = {col: (np.empty(0), np.empty(0)) for col in columns if col not in counts}
+            n_rows += len(chunk)
+            for col in counts:
+                col_counts = counts[col]
+                for value, count in chunk[col].value_counts().items():
+                    if count:
+                        col_counts[value] = col_counts.get(value, 0) + int(count)
+            for col, (values, keys) in samples.items():
+                # Reservoir theo khóa ngẫu nhiên: giữ STREAM_MEDIAN_SAMPLE khóa nhỏ nhất
+                new_values = chunk[col].dropna().to_numpy(dtype=np.float64)
+                values = np.concatenate([values, new_values])
+                keys = np.concatenate([keys, rng.random_sample(len(new_values))])
+                if len(keys) > STREAM_MEDIAN_SAMPLE:
+                    keep = np.argpartition(keys, STREAM_MEDIAN_SAMPLE)[:STREAM_MEDIAN_SAMPLE]
+                    values, keys = values[keep], keys[keep]
+                samples[col] = (values, keys)
+        if not n_rows:
+            raise ValueError("No rows to preprocess")
+
+        self.feature_columns = columns
+        self.categorical_columns = categorical
+        self.fill_values = {}
+        self.encoders = {}
+        for col in columns:
+            if col in counts:
+                fill = _most_frequent(counts[col])
+                le = LabelEncoder()
+                # Giống fit(): cột toàn NaN có đúng một lớp "nan"
+                le.fit(np.array([str(value) for value in counts[col]] or ["nan"], dtype=object))
+                self.encoders[col] = le
+                self.fill_values[col] = fill
+            else:
+                values = samples[col][0]
+                self.fill_values[col] = float(np.median(values)) if len(values) else np.nan
+
+        self.scaler = StandardScaler(copy=False)
+        dtype = PRECISIONS[self.precision]
+        for chunk in chunk_source():
+            if len(chunk):
+                self.scaler.partial_fit(self._encode_frame(chunk, dtype=dtype))
+
+        self.numeric_columns = columns
+        self.processed_columns = columns
+        return n_rows
+
+    def _encode_frame(self, df, handle_unknown="mode", unknown_counts=None, dtype=np.float64):
+        """Fill and encode df with the fitted parameters (unscaled matrix)"""
+        if handle_unknown not in ("mode", "error"):
+            raise ValueError(f"Unknown handle_unknown option: {handle_unknown}")
+        missing = [col for col in self.feature_columns if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+
+        X = np.empty((len(df), len(self.feature_columns)), dtype=dtype)
+        for j, col in enumerate(self.feature_columns):
+            fill = self.fill_values.get(col)
+            series = df[col]
+            if fill is not None:
+                series = series.fillna(fill)
+            if col in self.encoders:
+                codes = self._encode(series, self.encoders[col])
+                unseen = codes < 0
+                n_unseen = int(unseen.sum())
+                if n_unseen:
+                    if handle_unknown == "error":
+                        raise ValueError(f"Unseen categories in column {col}")
+                    codes = np.where(unseen, self._fill_code(col), codes)
+                    if unknown_counts is not None:
+                        unknown_counts[col] = unknown_counts.get(col, 0) + n_unseen
+                X[:, j] = codes
+            else:
+                X[:, j] = series.to_numpy(dtype=dtype)
+        return X
+
+    def _fill_code(self, col):
+        """Encoded value of the fill (mode) category, or 0 if there is none"""
+        fill = self.fill_values.get(col)
+        classes = self.encoders[col].classes_
+        if fill is None:
+            return 0
+        return int(np.searchsorted(classes, str(fill)))
+
+    @staticmethod
+    def _encode(values, encoder):
+        """Vectorized LabelEncoder.transform; unseen categories map to -1"""
+        return pd.Categorical(values.astype(str), categories=encoder.classes_).codes
+
+    def precision_drift(self, df, X, sample_rows=DRIFT_SAMPLE_ROWS, random_state=42):
+        """Error of a reduced-precision X against float64 on a row sample"""
+        n = len(df)
+        rows = np.arange(n)
+        if n > sample_rows:
+            rows = np.sort(np.random.RandomState(random_state).choice(n, sample_rows, replace=False))
+        reference = self._encode_frame(df.iloc[rows])
+        reference = (reference - self.scaler.mean_) / self.scaler.scale_
+        error = np.abs(X[rows].astype(np.float64) - reference)
+        return {
+            "reference": "float64",
+            "sample_rows": int(len(rows)),
+            "max_abs_error": float(error.max()) if error.size else 0.0,
+            "mean_abs_error": float(error.mean()) if error.size else 0.0
         }
 
-    def preprocess(self, df, selected_columns=None):
+    def preprocess(self, df, selected_columns=None, precision=None):
         """
         Tiền xử lý dữ liệu:
         1. Chọn cột
@@ -97,71 +402,36 @@ class DataPreprocessor:
         4. Scale
         """
         try:
-            # Chọn cột cần dùng
-            if selected_columns:
-                df_work = df[selected_columns].copy()
-            else:
-                df_work = df.copy()
-
-            # Xử lý missing values
-            for col in df_work.columns:
-                if df_work[col].dtype == 'object':
-                    # Categorical: fill với mode
-                    mode_val = df_work[col].mode()
-                    if len(mode_val) > 0:
-                        df_work[col] = df_work[col].fillna(mode_val[0])
-                else:
-                    # Numeric: fill với median
-                    median_val = df_work[col].median()
-                    df_work[col] = df_work[col].fillna(median_val)
-
-            # Separate numeric and categorical
-            numeric_cols = df_work.select_dtypes(include=['number']).columns.tolist()
-            categorical_cols = df_work.select_dtypes(include=['object']).columns.tolist()
-
-            # Encode categorical columns
-            for col in categorical_cols:
-                if col in df_work.columns:
-                    le = LabelEncoder()
-                    df_work[col] = le.fit_transform(df_work[col].astype(str))
-                    self.encoders[col] = le
-
-            # Scale all features
-            self.scaler = StandardScaler()
-            X_scaled = self.scaler.fit_transform(df_work)
-            
-            self.numeric_columns = df_work.columns.tolist()
-            self.processed_columns = self.numeric_columns
-
-            return X_scaled, {
+            X_scaled = self.fit_transform(df, selected_columns, precision)
+
+            result = {
                 "processed_shape": list(X_scaled.shape),
                 "columns": self.numeric_columns,
+                "precision": self.precision,
+                "memory_bytes": int(X_scaled.nbytes),
                 "status": "success"
             }
+            if self.precision != "float64":
+                result["drift"] = self.precision_drift(df, X_scaled)
+            return X_scaled, result
 
         except Exception as e:
             return None, {"error": str(e), "status": "failed"}
 
-    def get_processed_df(self, df, selected_columns=None):
-        """Get processed dataframe for visualization"""
-        if selected_columns:
-            df_work = df[selected_columns].copy()
-        else:
-            df_work = df.copy()
-
-        # Fill missing
-        for col in df_work.columns:
-            if df_work[col].dtype == 'object':
-                mode_val = df_work[col].mode()
-                if len(mode_val) > 0:
-                    df_work[col] = df_work[col].fillna(mode_val[0])
-            else:
-                median_val = df_work[col].median()
-                df_work[col] = df_work[col].fillna(median_val)
-
-        # Encode categorical
-        for col in df_work.select_dtypes(include=['object']).columns:
-            le = LabelEncoder()
-            df_work[col] = le.fit_transform(df_work[col].astype(str))
-
-        return df_work
+    def preprocess_chunks(self, chunk_source, selected_columns=None, precision=None):
+        """
+        Streaming variant of preprocess(): fit from raw chunks (see fit_chunks)
+        without keeping the scaled matrix. Returns the result dict only.
+        """
+        try:
+            n_rows = self.fit_chunks(chunk_source, selected_columns, precision)
+            return {
+                "processed_shape": [n_rows, len(self.feature_columns)],
+                "columns": self.numeric_columns,
+                "precision": self.precision,
+                "memory_bytes": 0,
+                "stream": True,
+                "status": "success"
+            }
+        except Exception as e:
+            return {"error": str(e), "status": "failed"}
@@ -0,0 +1,735 @@
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from upload_store import write_columnar, read_columnar
+
+DEFAULT_SESSION_TTL = int(os.environ.get("KPDL_SESSION_TTL", 3600))  # giây
+DEFAULT_SESSION_MAX_BYTES = int(os.environ.get("KPDL_SESSION_MAX_BYTES", 2 * 1024 ** 3))
+SESSION_BACKEND = os.environ.get("KPDL_SESSION_BACKEND", "memory")  # memory | shared
+RETIRED_FILE_GRACE = 60  # giây giữ file của version cũ cho worker đang đọc dở
+OOB_MIN_BYTES = 64 * 1024  # buffer lớn hơn được ghi ngoài pickle và memory-map khi đọc
+DEFAULT_SESSION_DIR = os.environ.get(
+    "KPDL_SESSION_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_data")
+)
+
+# Các key mặc định của một session mới
+SESSION_DEFAULTS = {
+    "df": None,
+    "X_processed": None,
+    "preprocessor": None,
+    "kmeans_engine": None,
+    "cluster_stats": None,
+    "selected_columns": None
+}
+
+
+def session_label(session_id):
+    """Short non-reversible label for admin listings (the session ID itself is the credential)"""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16]
+
+
+def _is_memory_mapped(array):
+    """Arrays backed by a file mapping do not count against the RAM budget"""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+
+def estimate_size(obj, _seen=None, _depth=0):
+    """
+    Approximate resident size in bytes of a session value.
+
+    Counts numpy buffers, DataFrames (deep), bytes and strings, and recurses
+    into containers and plain objects (engines, preprocessors, sklearn
+    estimators). Shared objects are counted once; live connections are skipped.
+    """
+    if _seen is None:
+        _seen = set()
+    if obj is None or id(obj) in _seen or _depth > 6:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        if _is_memory_mapped(obj):
+            return 0
+        # View: chỉ tính buffer gốc một lần
+        base = obj.base if isinstance(obj.base, np.ndarray) else None
+        if base is not None:
+            return estimate_size(base, _seen, _depth + 1)
+        return obj.nbytes
+    if isinstance(obj, pd.DataFrame):
+        # Cột memory-map (dữ liệu upload dạng columnar) nằm trên đĩa
+        usage = obj.memory_usage(deep=True, index=False)
+        resident = sum(
+            int(usage.iloc[i]) for i, dtype in enumerate(obj.dtypes)
+            if not (isinstance(dtype, np.dtype) and dtype.kind != "O"
+                    and _is_memory_mapped(obj.iloc[:, i].to_numpy()))
+        )
+        return resident + int(obj.index.memory_usage(deep=True))
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, (bytes, bytearray, str)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            estimate_size(v, _seen, _depth + 1) for v in obj.values()
+        )
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(v, _seen, _depth + 1) for v in obj)
+    if hasattr(obj, "__dict__"):
+        if hasattr(obj, "connection_string"):
+            # DW connector: kết nối live, không tính vào footprint dữ liệu
+            return sys.getsizeof(obj)
+        return sys.getsizeof(obj) + estimate_size(vars(obj), _seen, _depth + 1)
+    return sys.getsizeof(obj)
+
+
+class Session(dict):
+    """Session state dict that tracks when its contents change"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.size_bytes = 0
+        self.dirty = True
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty = True
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty = True
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.dirty = True
+
+    def close(self):
+        """Release external resources held by the session"""
+        _close_connector(self.get("dw_connector"))
+        _remove_upload(self.get("upload"))
+
+
+def _close_connector(connector):
+    """Close a DW connector, ignoring errors from already-dead connections"""
+    if connector is not None:
+        try:
+            connector.disconnect()
+        except Exception:
+            pass
+
+
+def _remove_upload(upload):
+    """Delete a session's spooled upload files"""
+    if upload is not None:
+        upload.remove()
+
+
+class SessionManager:
+    """
+    In-memory session store with idle TTL and LRU eviction under a global
+    byte budget. Sizes are recomputed lazily for sessions that changed.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_SESSION_TTL, max_bytes=DEFAULT_SESSION_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._pins = {}  # session_id -> số request đang dùng
+        self._lock = threading.RLock()
+        self.evictions = {"ttl": 0, "memory": 0}
+
+    def create(self, session_id=None):
+        """Create (or reset) a session and return (session_id, state)"""
+        session_id = session_id or str(uuid.uuid4())
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old is not None:
+                old.close()
+            state = Session(SESSION_DEFAULTS)
+            self._sessions[session_id] = state
+        return session_id, state
+
+    def get(self, session_id, create=False):
+        """Get a live session, marking it most recently used; None if missing"""
+        with self._lock:
+            self._reap_expired()
+            state = self._sessions.get(session_id)
+            if state is None:
+                if not create:
+                    return None
+                return self.create(session_id)[1]
+            state.last_access = time.time()
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def delete(self, session_id):
+        """Remove a session and close its resources"""
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+        if state is not None:
+            state.close()
+        return state is not None
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def pin(self, session_id):
+        """Protect a session from eviction while a request is using it"""
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def unpin(self, session_id):
+        with self._lock:
+            count = self._pins.pop(session_id, 0) - 1
+            if count > 0:
+                self._pins[session_id] = count
+
+    def _reap_expired(self):
+        now = time.time()
+        expired = [
+            sid for sid, state in self._sessions.items()
+            if now - state.last_access > self.ttl_seconds and sid not in self._pins
+        ]
+        for sid in expired:
+            self._sessions.pop(sid).close()
+            self.evictions["ttl"] += 1
+
+    def _refresh_sizes(self):
+        for state in self._sessions.values():
+            if state.dirty:
+                state.dirty = False
+                state.size_bytes = estimate_size(dict(state))
+        return sum(state.size_bytes for state in self._sessions.values())
+
+    def enforce_budget(self):
+        """Expire idle sessions, then evict least recently used ones over budget"""
+        with self._lock:
+            self._reap_expired()
+            total = self._refresh_sizes()
+            # Luôn giữ lại session dùng gần nhất, kể cả khi một mình nó vượt budget;
+            # session đang có request dùng (pin) không bị xóa
+            for sid in list(self._sessions)[:-1]:
+                if total <= self.max_bytes:
+                    break
+                if sid in self._pins:
+                    continue
+                state = self._sessions.pop(sid)
+                total -= state.size_bytes
+                state.close()
+                self.evictions["memory"] += 1
+            return total
+
+    def stats(self):
+        """Report live sessions and their memory footprint"""
+        with self._lock:
+            total = self.enforce_budget()
+            now = time.time()
+            sessions = [
+                {
+                    "session": session_label(sid),
+                    "size_bytes": state.size_bytes,
+                    "idle_seconds": round(now - state.last_access, 1),
+                    "age_seconds": round(now - state.created_at, 1),
+                    "keys": sorted(k for k, v in state.items() if v is not None)
+                }
+                for sid, state in reversed(self._sessions.items())
+            ]
+            return {
+                "backend": "memory",
+                "count": len(sessions),
+                "total_bytes": total,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": dict(self.evictions),
+                "sessions": sessions
+            }
+
+
+# ==================== SHARED BACKEND ====================
+# Metadata trong SQLite, giá trị trong file dùng chung giữa các worker:
+# ndarray -> .npy, DataFrame -> thư mục columnar, các giá trị khác -> pickle
+# protocol 5 với các buffer lớn (mảng numpy, block DataFrame) nằm ngoài
+# pickle. Mọi dữ liệu lớn đều được memory-map khi đọc nên các worker dùng
+# chung page cache thay vì mỗi worker một bản.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    active INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_values (
+    session_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT,
+    nbytes INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (session_id, key)
+);
+CREATE TABLE IF NOT EXISTS retired_files (
+    path TEXT PRIMARY KEY,
+    retired_at REAL NOT NULL
+);
+"""
+
+
+def _columnar_compatible(df):
+    """
+    DataFrames the columnar format round-trips exactly: default index, unique
+    string column names, numeric / datetime / str columns. Object and category
+    columns (None vs NaN, unused categories) go through pickle instead.
+    """
+    index = df.index
+    if not (isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1):
+        return False
+    if len(df.columns) == 0 or not df.columns.is_unique:
+        return False
+    if not all(isinstance(name, str) for name in df.columns):
+        return False
+    return all(
+        (isinstance(dtype, np.dtype) and dtype.kind in "biufcmM") or isinstance(dtype, pd.StringDtype)
+        for dtype in df.dtypes
+    )
+
+
+def _dump_pickle(value, path):
+    """Pickle value to path, writing large buffers out-of-band to path + '.buf'"""
+    buffers = []
+
+    def out_of_band(buffer):
+        raw = buffer.raw()
+        if raw.nbytes < OOB_MIN_BYTES:
+            return True  # giữ trong pickle
+        buffers.append(raw)
+        return False
+
+    payload = pickle.dumps(value, protocol=5, buffer_callback=out_of_band)
+    layout = []
+    if buffers:
+        with open(path + ".buf", "wb") as f:
+            for raw in buffers:
+                f.write(b"\0" * (-f.tell() % 64))  # căn lề 64 byte cho numpy
+                layout.append((f.tell(), raw.nbytes))
+                f.write(raw)
+    with open(path, "wb") as f:
+        pickle.dump(layout, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(payload)
+
+
+def _load_pickle(path):
+    """Inverse of _dump_pickle; out-of-band buffers are mapped copy-on-write"""
+    with open(path, "rb") as f:
+        layout = pickle.load(f)
+        payload = f.read()
+    buffers = []
+    if layout:
+        with open(path + ".buf", "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(mapped)
+        buffers = [view[offset:offset + size] for offset, size in layout]
+    return pickle.loads(payload, buffers=buffers)
+
+
+def _stored_size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    size = os.path.getsize(path)
+    if os.path.exists(path + ".buf"):
+        size += os.path.getsize(path + ".buf")
+    return size
+
+
+class SharedSession(MutableMapping):
+    """Session state whose values live in the shared store, read lazily"""
+
+    def __init__(self, manager, session_id):
+        self._manager = manager
+        self.session_id = session_id
+
+    def __getitem__(self, key):
+        return self._manager._read_value(self.session_id, key)
+
+    def __setitem__(self, key, value):
+        self._manager._write_value(self.session_id, key, value)
+
+    def __delitem__(self, key):
+        if not self._manager._delete_value(self.session_id, key):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._manager._keys(self.session_id))
+
+    def __len__(self):
+        return len(self._manager._keys(self.session_id))
+
+
+class SharedSessionManager:
+    """
+    Session store shared by all worker processes on one host.
+
+    Any worker can serve any session: metadata and the LRU clock are kept in
+    SQLite, arrays and DataFrame columns are memory-mapped from files so workers
+    share pages instead of copying the data. Replaced files are kept for
+    RETIRED_FILE_GRACE seconds so readers of the old version can finish. Same
+    TTL / byte budget policy as SessionManager, with sizes measured from the
+    stored files.
+    """
+
+    def __init__(self, root_dir=DEFAULT_SESSION_DIR, ttl_seconds=DEFAULT_SESSION_TTL,
+                 max_bytes=DEFAULT_SESSION_MAX_BYTES):
+        self.root_dir = root_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evictions = {"ttl": 0, "memory": 0}
+        os.makedirs(root_dir, exist_ok=True)
+        self._db_path = os.path.join(root_dir, "sessions.db")
+        # Cache theo process: (session_id, key) -> (version, value)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if "active" not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN active INTEGER NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---------- session lifecycle ----------
+
+    def create(self, session_id=None):
+        """Create (or reset) a session and return (session_id, state)"""
+        session_id = session_id or str(uuid.uuid4())
+        self.delete(session_id)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, last_access) VALUES (?, ?, ?)",
+                (session_id, now, now)
+            )
+        state = SharedSession(self, session_id)
+        for key, value in SESSION_DEFAULTS.items():
+            state[key] = value
+        return session_id, state
+
+    def get(self, session_id, create=False):
+        """Get a live session, marking it most recently used; None if missing"""
+        self._reap_expired()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?",
+                (time.time(), session_id)
+            ).rowcount
+        if not updated:
+            return self.create(session_id)[1] if create else None
+        return SharedSession(self, session_id)
+
+    def delete(self, session_id):
+        """Remove a session, its files and this process's cached values"""
+        try:
+            upload = self._read_value(session_id, "upload")
+        except KeyError:
+            upload = None
+        with self._connect() as conn:
+            paths = [row[0] for row in conn.execute(
+                "SELECT path FROM session_values WHERE session_id = ? AND path IS NOT NULL",
+                (session_id,)
+            )]
+            conn.execute("DELETE FROM session_values WHERE session_id = ?", (session_id,))
+            existed = conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            ).rowcount
+        # Worker khác có thể đang đọc: file chỉ bị xóa sau RETIRED_FILE_GRACE giây
+        self._retire_files(paths)
+        _remove_upload(upload)
+        with self._cache_lock:
+            for cache_key in [k for k in self._cache if k[0] == session_id]:
+                _, value = self._cache.pop(cache_key)
+                if cache_key[1] == "dw_connector":
+                    _close_connector(value)
+        return bool(existed)
+
+    def __contains__(self, session_id):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+
+    def pin(self, session_id):
+        """Protect a session from eviction (by any worker) while a request is using it"""
+        with self._connect() as conn:
+            conn.execute("UPDATE sessions SET active = active + 1 WHERE session_id = ?", (session_id,))
+
+    def unpin(self, session_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sessions SET active = MAX(active - 1, 0) WHERE session_id = ?", (session_id,)
+            )
+
+    def _reap_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._connect() as conn:
+            # Pin của worker đã chết không được giữ session mãi: quá 2 lần TTL thì vẫn xóa
+            expired = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ? AND (active = 0 OR last_access < ?)",
+                (cutoff, cutoff - self.ttl_seconds)
+            )]
+        for session_id in expired:
+            if self.delete(session_id):
+                self.evictions["ttl"] += 1
+
+    def enforce_budget(self):
+        """Expire idle sessions, then evict least recently used ones over budget"""
+        self._reap_expired()
+        self._collect_retired()
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT s.session_id, COALESCE(SUM(v.nbytes), 0), s.active
+                FROM sessions s LEFT JOIN session_values v ON v.session_id = s.session_id
+                GROUP BY s.session_id
+                ORDER BY s.last_access
+            """).fetchall()
+        self._prune_cache({session_id for session_id, _, _ in rows})
+        total = sum(size for _, size, _ in rows)
+        for session_id, size, active in rows[:-1]:
+            if total <= self.max_bytes:
+                break
+            if active:
+                continue
+            if self.delete(session_id):
+                self.evictions["memory"] += 1
+            total -= size
+        return total
+
+    def _prune_cache(self, live_ids):
+        """Drop values cached in this process for sessions removed by other workers"""
+        with self._cache_lock:
+            stale = [k for k in self._cache if k[0] not in live_ids]
+            for cache_key in stale:
+                _, value = self._cache.pop(cache_key)
+                if cache_key[1] == "dw_connector":
+                    _close_connector(value)
+
+    def stats(self):
+        """Report live sessions and their stored footprint"""
+        total = self.enforce_budget()
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT s.session_id, s.created_at, s.last_access, COALESCE(SUM(v.nbytes), 0),
+                       GROUP_CONCAT(CASE WHEN v.kind != 'none' THEN v.key END)
+                FROM sessions s LEFT JOIN session_values v ON v.session_id = s.session_id
+                GROUP BY s.session_id
+                ORDER BY s.last_access DESC
+            """).fetchall()
+        sessions = [
+            {
+                "session": session_label(session_id),
+                "size_bytes": size,
+                "idle_seconds": round(now - last_access, 1),
+                "age_seconds": round(now - created_at, 1),
+                "keys": sorted(keys.split(",")) if keys else []
+            }
+            for session_id, created_at, last_access, size, keys in rows
+        ]
+        return {
+            "backend": "shared",
+            "count": len(sessions),
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": dict(self.evictions),
+            "sessions": sessions
+        }
+
+    # ---------- value storage ----------
+
+    def _session_dir(self, session_id):
+        # Session ID đến từ header: băm để không thể thoát ra ngoài root_dir
+        return os.path.join(self.root_dir, hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32])
+
+    def _keys(self, session_id):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT key FROM session_values WHERE session_id = ?", (session_id,)
+            )]
+
+    def _read_value(self, session_id, key):
+        # File của version vừa bị thay có thể biến mất giữa lúc đọc metadata và
+        # lúc mở file (worker khác ghi + dọn file cũ): đọc lại metadata một lần
+        for attempt in range(2):
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT kind, path, version FROM session_values WHERE session_id = ? AND key = ?",
+                    (session_id, key)
+                ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            kind, path, version = row
+            if kind == "none":
+                return None
+
+            cache_key = (session_id, key)
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            try:
+                value = self._load_file(kind, path)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                continue
+            with self._cache_lock:
+                self._cache[cache_key] = (version, value)
+            return value
+
+    @staticmethod
+    def _load_file(kind, path):
+        if kind == "npy":
+            return np.load(path, mmap_mode="r")
+        if kind == "columnar":
+            return read_columnar(path)
+        return _load_pickle(path)
+
+    def _write_value(self, session_id, key, value):
+        version = time.time_ns()
+        path = None
+        nbytes = 0
+        if value is None:
+            kind = "none"
+        else:
+            session_dir = self._session_dir(session_id)
+            os.makedirs(session_dir, exist_ok=True)
+            # Mỗi version một file mới (ghi vào file tạm rồi os.replace):
+            # worker khác đang đọc version cũ không bị ảnh hưởng
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                kind = "npy"
+                path = os.path.join(session_dir, f"{key}.{version}.npy")
+                with open(path + ".tmp", "wb") as f:
+                    np.save(f, np.ascontiguousarray(value))
+                os.replace(path + ".tmp", path)
+            elif isinstance(value, pd.DataFrame) and _columnar_compatible(value):
+                kind = "columnar"
+                path = os.path.join(session_dir, f"{key}.{version}.cols")
+                write_columnar(value, path + ".tmp")
+                os.replace(path + ".tmp", path)
+            else:
+                kind = "pickle"
+                path = os.path.join(session_dir, f"{key}.{version}.pkl")
+                _dump_pickle(value, path + ".tmp")
+                if os.path.exists(path + ".tmp.buf"):
+                    os.replace(path + ".tmp.buf", path + ".buf")
+                os.replace(path + ".tmp", path)
+            nbytes = _stored_size(path)
+
+        with self._connect() as conn:
+            old = conn.execute(
+                "SELECT path FROM session_values WHERE session_id = ? AND key = ?",
+                (session_id, key)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO session_values VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, key, kind, path, nbytes, version)
+            )
+        if old and old[0]:
+            self._retire_files([old[0]])
+        with self._cache_lock:
+            if kind in ("npy", "columnar"):
+                # Đọc lại qua mmap ở lần truy cập sau để dùng chung page cache
+                self._cache.pop((session_id, key), None)
+            else:
+                self._cache[(session_id, key)] = (version, value)
+
+    def _delete_value(self, session_id, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT path FROM session_values WHERE session_id = ? AND key = ?",
+                (session_id, key)
+            ).fetchone()
+            conn.execute(
+                "DELETE FROM session_values WHERE session_id = ? AND key = ?", (session_id, key)
+            )
+        with self._cache_lock:
+            self._cache.pop((session_id, key), None)
+        if row is None:
+            return False
+        if row[0]:
+            self._retire_files([row[0]])
+        return True
+
+    # ---------- file cleanup ----------
+
+    def _retire_files(self, paths):
+        """Schedule value files for deletion once readers of the old version are done"""
+        if not paths:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO retired_files VALUES (?, ?)", [(path, now) for path in paths]
+            )
+
+    def _collect_retired(self, grace=RETIRED_FILE_GRACE):
+        """Delete files retired more than grace seconds ago"""
+        with self._connect() as conn:
+            paths = [row[0] for row in conn.execute(
+                "SELECT path FROM retired_files WHERE retired_at < ?", (time.time() - grace,)
+            )]
+            if not paths:
+                return
+            conn.executemany("DELETE FROM retired_files WHERE path = ?", [(path,) for path in paths])
+        for path in paths:
+            self._remove_file(path)
+            try:
+                os.rmdir(os.path.dirname(path))  # thư mục session rỗng
+            except OSError:
+                pass
+
+    @staticmethod
+    def _remove_file(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        for name in (path, path + ".buf"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+
+def create_session_manager(backend=SESSION_BACKEND):
+    """Build the session store selected by KPDL_SESSION_BACKEND"""
+    if backend == "shared":
+        return SharedSessionManager()
+    if backend == "memory":
+        return SessionManager()
+    raise ValueError(f"Unknown session backend: {backend}")
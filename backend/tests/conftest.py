@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module backend là module phẳng (app.py import "preprocessing", ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
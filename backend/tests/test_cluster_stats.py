@@ -0,0 +1,52 @@
+import numpy as np
+
+from cluster_stats import ClusterStatsAccumulator, compute_cluster_statistics
+
+
+def _data(k=3, n=3000, n_features=4):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n, n_features))
+    labels = rng.integers(0, k, size=n)
+    centroids = np.stack([X[labels == c].mean(axis=0) for c in range(k)])
+    return X, labels, centroids
+
+
+def _reference(X, labels, cluster_id):
+    block = X[labels == cluster_id]
+    return block.mean(axis=0), block.std(axis=0), np.quantile(block, 0.5, axis=0)
+
+
+def test_exact_statistics_match_masked_computation():
+    X, labels, centroids = _data()
+    stats = compute_cluster_statistics(X, labels, centroids, ["a", "b", "c", "d"])
+    for cluster_id, entry in stats.items():
+        mean, std, median = _reference(X, labels, cluster_id)
+        assert entry["size"] == int((labels == cluster_id).sum())
+        np.testing.assert_allclose(entry["mean"], mean)
+        np.testing.assert_allclose(entry["std"], std)
+        np.testing.assert_allclose(entry["quantiles"]["p50"], median)
+    assert abs(sum(entry["percentage"] for entry in stats.values()) - 100) < 1e-9
+
+
+def test_accumulator_matches_exact_statistics():
+    X, labels, centroids = _data()
+    names = ["a", "b", "c", "d"]
+    accumulator = ClusterStatsAccumulator(len(centroids), X.shape[1])
+    for start in range(0, len(X), 700):
+        accumulator.update(X[start:start + 700], labels[start:start + 700])
+    streamed = accumulator.finalize(centroids, names)
+
+    # Reservoir lớn hơn mỗi cụm nên cả quantile cũng chính xác
+    exact = compute_cluster_statistics(X, labels, centroids, names)
+    for cluster_id in exact:
+        for field in ("size", "mean", "std", "min", "max"):
+            np.testing.assert_allclose(streamed[cluster_id][field], exact[cluster_id][field])
+        for key, values in exact[cluster_id]["quantiles"].items():
+            np.testing.assert_allclose(streamed[cluster_id]["quantiles"][key], values)
+
+
+def test_empty_cluster_reports_nan():
+    X, labels, _ = _data(k=2)
+    centroids = np.zeros((3, X.shape[1]))
+    stats = compute_cluster_statistics(X, labels, centroids, None)
+    assert stats[2]["size"] == 0 and np.isnan(stats[2]["mean"]).all()
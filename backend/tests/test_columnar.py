@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from columnar import COLUMNAR_MEDIA_TYPE, pack_columnar, unpack_columnar, wants_columnar
+
+
+def test_pack_unpack_round_trip():
+    columns = {
+        "x": np.linspace(-1, 1, 7),
+        "labels": np.array([0, 1, 2, 0, 1, 2, 0], dtype=np.int64),
+        "mask": np.array([True, False, True]),
+        "grid": np.arange(6, dtype=np.float32).reshape(2, 3)
+    }
+    payload = pack_columnar(columns, meta={"k": 3, "viewport": [0.0, float("nan")]})
+    decoded, meta = unpack_columnar(payload)
+
+    assert list(decoded) == list(columns)
+    np.testing.assert_array_equal(decoded["x"], columns["x"].astype(np.float32))
+    np.testing.assert_array_equal(decoded["labels"], columns["labels"])
+    np.testing.assert_array_equal(decoded["mask"], [1, 0, 1])
+    assert decoded["grid"].shape == (2, 3)
+    assert meta["k"] == 3 and meta["viewport"] == [0.0, None]
+    # Mỗi buffer căn lề 8 byte để client tạo TypedArray trực tiếp
+    base = 8 + int.from_bytes(payload[4:8], "little")
+    assert base % 8 == 0
+
+
+def test_pack_rejects_unsupported_dtype():
+    with pytest.raises(TypeError):
+        pack_columnar({"names": np.array(["a", "b"])})
+    with pytest.raises(ValueError):
+        unpack_columnar(b"JSON{}")
+
+
+def test_wants_columnar():
+    assert wants_columnar(f"{COLUMNAR_MEDIA_TYPE}, application/json")
+    assert not wants_columnar("application/json")
+    assert not wants_columnar(None)
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolExhausted
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def cursor(self):
+        if not self.alive:
+            raise RuntimeError("connection lost")
+        return FakeCursor()
+
+    def rollback(self):
+        if not self.alive:
+            raise RuntimeError("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def execute(self, sql):
+        pass
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakePool(ConnectionPool):
+    def _connect(self):
+        self.created += 1
+        return FakeConnection()
+
+
+def test_connections_are_reused_and_bounded():
+    pool = FakePool("fake", max_size=2, acquire_timeout=0.1)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+
+    a, b = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolExhausted):
+        pool.acquire()
+    # Trả connection khi đang có thread chờ: thread đó nhận được nó
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    pool.acquire_timeout = 5
+    waiter.start()
+    pool.release(a)
+    waiter.join()
+    assert got == [a]
+    assert pool.stats()["created"] == 2 and pool.stats()["in_use"] == 2
+
+
+def test_dead_connections_are_replaced(monkeypatch):
+    pool = FakePool("fake", max_size=1)
+    connection = pool.acquire()
+    connection.alive = False
+    pool.release(connection)  # rollback lỗi -> đóng, không trả về pool
+    assert connection.closed and pool.stats()["idle"] == 0
+
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.alive = False
+    monkeypatch.setattr(db_pool, "PING_AFTER_SECONDS", -1)
+    fresh = pool.acquire()
+    assert fresh is not connection and pool.reconnects == 1
+
+
+def test_idle_connections_expire():
+    pool = FakePool("fake", idle_timeout=-1)
+    connection = pool.acquire()
+    pool.release(connection)
+    assert pool.acquire() is not connection and connection.closed
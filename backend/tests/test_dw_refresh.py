@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+
+HEADERS = {"X-Session-ID": "dw-refresh-test"}
+
+
+def _insert_rows(db_path, start, n, rng):
+    rows = [(i, float(x), float(y), i) for i, (x, y) in enumerate(rng.normal(size=(n, 2)), start)]
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO customers VALUES (?, ?, ?, ?)", rows)
+
+
+def _result_count(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM Fact_Clustering_Result").fetchone()[0]
+
+
+@pytest.fixture
+def client():
+    with TestClient(app_module.app) as client:
+        yield client
+    app_module.session_manager.delete(HEADERS["X-Session-ID"])
+
+
+def _post(client, path, body):
+    response = client.post(path, json=body, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _load_and_refresh(client, db_path):
+    """1500 dòng được phân cụm và lưu, sau đó /dw/refresh thêm 500 dòng"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE customers (rid INTEGER, a REAL, b REAL, ver INTEGER)")
+    rng = np.random.default_rng(0)
+    _insert_rows(db_path, 1, 1500, rng)
+
+    _post(client, "/dw/views", {"connection_string": f"sqlite:///{db_path}"})
+    _post(client, "/dw/load", {"view_name": "customers", "id_column": "rid",
+                               "columns": ["a", "b"], "watermark_column": "ver"})
+    _post(client, "/preprocess", {"selected_columns": ["a", "b"]})
+    _post(client, "/kmeans", {"k": 3})
+    _post(client, "/dw/save-clusters", {})
+    assert _result_count(db_path) == 1500
+
+    _insert_rows(db_path, 1501, 500, rng)
+    refreshed = _post(client, "/dw/refresh", {"auto_refit": False})
+    assert refreshed["mode"] == "incremental" and refreshed["n_rows"] == 500
+    assert _result_count(db_path) == 2000
+
+
+def test_save_after_incremental_refresh_keeps_delta_rows(client, tmp_path):
+    db_path = str(tmp_path / "dw.db")
+    _load_and_refresh(client, db_path)
+
+    # Ghi lại kết quả của session không được xóa các dòng vừa refresh
+    saved = _post(client, "/dw/save-clusters", {})
+    assert saved["records_saved"] == 2000
+    assert _result_count(db_path) == 2000
+
+
+def test_job_refit_drops_labels_of_the_previous_model(client, tmp_path):
+    db_path = str(tmp_path / "dw.db")
+    _load_and_refresh(client, db_path)
+
+    job_id = _post(client, "/jobs/kmeans", {"k": 4})["job_id"]
+    for _ in range(200):
+        job = client.get(f"/jobs/{job_id}", headers=HEADERS).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "succeeded", job
+
+    # Model mới chỉ gán nhãn cho dữ liệu của session: không trộn nhãn model cũ
+    saved = _post(client, "/dw/save-clusters", {})
+    assert saved["records_saved"] == 1500
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT MAX(cluster_id) FROM Fact_Clustering_Result").fetchone()[0] <= 3
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+import app as app_module
+
+HEADERS = {"X-Session-ID": "http-cache-test"}
+
+
+def test_not_modified_carries_the_etag_of_the_negotiated_encoding():
+    rng = np.random.default_rng(0)
+    csv = pd.DataFrame(rng.normal(size=(300, 3)), columns=["a", "b", "c"]).to_csv(index=False)
+    with TestClient(app_module.app) as client:
+        try:
+            response = client.post("/upload", files={"file": ("data.csv", csv, "text/csv")}, headers=HEADERS)
+            assert response.status_code == 200, response.text
+            assert client.post("/preprocess", json={}, headers=HEADERS).status_code == 200
+            assert client.post("/kmeans", json={"k": 3}, headers=HEADERS).status_code == 200
+
+            for encoding in ("gzip", "identity"):
+                headers = {**HEADERS, "Accept-Encoding": encoding}
+                full = client.get("/kmeans/result", headers=headers)
+                cached = client.get("/kmeans/result", headers={**headers, "If-None-Match": full.headers["etag"]})
+                assert cached.status_code == 304
+                assert cached.headers["etag"] == full.headers["etag"]
+                assert "Accept-Encoding" in cached.headers["vary"]
+                assert full.headers["etag"].endswith('-gzip"') == (encoding == "gzip")
+        finally:
+            app_module.session_manager.delete(HEADERS["X-Session-ID"])
+
+
+def test_compression_keeps_repeated_headers():
+    from fastapi import FastAPI, Response
+
+    probe = FastAPI()
+    probe.middleware("http")(app_module.compress_responses)
+
+    @probe.get("/probe")
+    def _probe():
+        response = Response(content=b'{"x": "' + b"a" * 4096 + b'"}', media_type="application/json")
+        response.raw_headers += [
+            (b"set-cookie", b"a=1"), (b"set-cookie", b"b=2"),
+            (b"vary", b"Origin"), (b"vary", b"X-Session-ID"),
+        ]
+        return response
+
+    response = TestClient(probe).get("/probe", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers.get_list("set-cookie") == ["a=1", "b=2"]
+    assert response.headers.get_list("vary") == ["Origin, X-Session-ID, Accept-Encoding"]
+    assert response.json()["x"] == "a" * 4096
@@ -0,0 +1,47 @@
+import time
+
+from jobs import (
+    JOB_CANCELLED, JOB_SUCCEEDED, JobManager, SharedJobStore, _progress_reporter
+)
+
+
+def _wait_task(job_id, progress, cancel_flags, seconds):
+    report = _progress_reporter(job_id, progress, cancel_flags)
+    end = time.time() + seconds
+    while time.time() < end:
+        report({"stage": "wait"})
+        time.sleep(0.05)
+    return seconds
+
+
+def _wait_for(manager, job_id, status, timeout=20):
+    end = time.time() + timeout
+    while time.time() < end:
+        job = manager.get(job_id, "s")
+        if job["status"] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job did not reach {status}: {job}")
+
+
+def test_shared_store_serves_jobs_of_other_workers(tmp_path):
+    store_path = str(tmp_path / "jobs.db")
+    owner = JobManager(max_workers=1, store=SharedJobStore(store_path))
+    other = JobManager(max_workers=1, store=SharedJobStore(store_path))
+    try:
+        done = owner.submit("wait", "s", _wait_task, (0.2,), on_success=lambda seconds: {"waited": seconds})
+        assert "session_id" not in other.get(done, "s")
+        # Job chỉ hiện với session đã tạo ra nó
+        assert other.get(done, "intruder") is None and owner.get(done, "intruder") is None
+        assert _wait_for(other, done, JOB_SUCCEEDED)["result"] == {"waited": 0.2}
+
+        running = owner.submit("wait", "s", _wait_task, (30,))
+        _wait_for(other, running, "running")
+        assert not other.cancel(running, "intruder")
+        assert other.cancel(running, "s")
+        _wait_for(owner, running, JOB_CANCELLED)
+        _wait_for(other, running, JOB_CANCELLED)
+        assert other.get("missing", "s") is None
+    finally:
+        owner.shutdown()
+        other.shutdown()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from kmeans_engine import KMeansEngine
+
+
+def _engine_with_points(points, labels):
+    engine = KMeansEngine()
+    engine.pca_points = np.asarray(points, dtype=np.float64)
+    engine.labels = np.asarray(labels)
+    return engine
+
+
+def test_level_of_detail_widens_zero_width_viewport():
+    engine = _engine_with_points([[1.0, 2.0], [1.0, 2.0], [1.0, 3.0]], [0, 0, 1])
+
+    lod = engine.get_level_of_detail(None, resolution=16)
+    assert lod["visible_points"] == 3
+    assert lod["viewport"][0] < 1.0 < lod["viewport"][1]
+    assert sorted(lod["count"].tolist()) == [1, 2]
+
+    # Zoom vào đúng một điểm
+    lod = engine.get_level_of_detail((1.0, 1.0, 2.0, 2.0), resolution=16, mode="sample")
+    assert lod["visible_points"] == 2
+    assert lod["count"].tolist() == [2]
+
+
+def test_level_of_detail_rejects_inverted_viewport():
+    engine = _engine_with_points([[0.0, 0.0], [1.0, 1.0]], [0, 1])
+    with pytest.raises(ValueError):
+        engine.get_level_of_detail((2.0, 1.0, 0.0, 1.0))
+
+
+def test_cancelled_parallel_sweep_terminates_pool():
+    import multiprocessing
+    import time
+
+    X = np.random.default_rng(0).random((60000, 8))
+    engine = KMeansEngine(silhouette_mode="full")
+    deadline = time.perf_counter() + 0.5
+
+    def cancel_check():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("cancelled")
+
+    engine.cancel_check = cancel_check
+    with pytest.raises(RuntimeError):
+        engine.auto_select_k(X, k_range=(2, 5), n_jobs=2)
+    # Pool bị terminate, không còn worker đang fit K
+    assert time.perf_counter() - deadline < 5
+    assert not [p for p in multiprocessing.active_children() if "PoolWorker" in p.name]
+
+
+def test_sequential_sweep_checks_budget_between_restarts():
+    import time
+
+    X = np.random.default_rng(1).random((40000, 16))
+    engine = KMeansEngine(silhouette_mode="sampled", silhouette_sample_size=500)
+    single = time.perf_counter()
+    KMeansEngine()._fit_restarts(X, 5, n_init=1, report=False)
+    restart_seconds = time.perf_counter() - single
+
+    budget = restart_seconds * 3  # ít hơn n_init=10 restart của K đầu tiên
+    start = time.perf_counter()
+    best_k, scores = engine.auto_select_k(X, k_range=(2, 5), n_jobs=1, time_budget=budget)
+    elapsed = time.perf_counter() - start
+
+    assert scores == {} and engine.k_search["fallback"] and best_k == 2
+    assert elapsed < budget + 3 * restart_seconds + 0.5
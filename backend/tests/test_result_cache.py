@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from result_cache import ResultCache, fingerprint_dataframe, make_cache_key
+
+
+def test_fingerprint_tracks_content():
+    df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+    assert fingerprint_dataframe(df) == fingerprint_dataframe(df.copy())
+    changed = df.copy()
+    changed.loc[1, "a"] = 5
+    assert fingerprint_dataframe(changed) != fingerprint_dataframe(df)
+    assert fingerprint_dataframe(df.rename(columns={"a": "c"})) != fingerprint_dataframe(df)
+    assert fingerprint_dataframe(df.astype({"a": "float64"})) != fingerprint_dataframe(df)
+
+
+def test_cache_key_is_order_insensitive_for_dicts():
+    assert make_cache_key("kmeans", {"k": 3, "mode": "full"}) == make_cache_key("kmeans", {"mode": "full", "k": 3})
+    assert make_cache_key("kmeans", ["a", "b"]) != make_cache_key("kmeans", ["b", "a"])
+
+
+def test_lru_eviction_within_budget():
+    value = np.zeros(1000)  # 8000 byte
+    cache = ResultCache(max_bytes=20000)
+    cache.put("a", value)
+    cache.put("b", value)
+    assert cache.get("a") is value  # "a" thành mới dùng nhất
+    cache.put("c", value)
+
+    assert cache.get("b") is None and cache.get("a") is value and cache.get("c") is value
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["total_bytes"] <= cache.max_bytes
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+    cache.put("huge", np.zeros(10000))  # lớn hơn cả budget: bỏ qua
+    assert cache.get("huge") is None and cache.stats()["entries"] == 2
+
+
+def test_cached_preprocessor_keeps_each_session_source_info():
+    from fastapi.testclient import TestClient
+
+    import app as app_module
+
+    csv = pd.DataFrame(np.random.default_rng(0).normal(size=(200, 3)), columns=["a", "b", "c"]).to_csv(index=False)
+    sessions = {"cache-owner": "first.csv", "cache-reader": "second.csv"}
+    with TestClient(app_module.app) as client:
+        try:
+            for endpoint in ("/preprocess", "/jobs/preprocess"):
+                for session_id, filename in sessions.items():
+                    headers = {"X-Session-ID": session_id}
+                    response = client.post("/upload", files={"file": (filename, csv, "text/csv")}, headers=headers)
+                    assert response.status_code == 200, response.text
+                    assert client.post(endpoint, json={}, headers=headers).status_code == 200
+
+                owner, reader = (app_module.session_manager.get(sid)["preprocessor"] for sid in sessions)
+                assert owner is not reader
+                assert (owner.filename, reader.filename) == ("first.csv", "second.csv")
+                assert reader.feature_columns == owner.feature_columns
+        finally:
+            for session_id in sessions:
+                app_module.session_manager.delete(session_id)
@@ -0,0 +1,36 @@
+import threading
+import time
+
+from db_connector import SchemaCache
+
+
+def test_concurrent_misses_share_one_load_and_release_the_key_lock():
+    cache = SchemaCache(ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["dbo.v_customers"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(("cs", "views", None), loader)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and results == [["dbo.v_customers"]] * 5
+    assert cache._loading == {}
+
+
+def test_expired_entries_are_purged_on_load():
+    cache = SchemaCache(ttl=0.05)
+    for name in ("a", "b", "c"):
+        cache.get(("cs", "columns", name), lambda: [name])
+    time.sleep(0.1)
+    cache.get(("cs", "columns", "d"), lambda: ["d"])
+    assert cache.stats()["entries"] == 1 and cache._loading == {}
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from session_store import SessionManager, SharedSessionManager, session_label
+
+
+def _fill(manager, session_id, nbytes):
+    state = manager.get(session_id, create=True)
+    state["X_processed"] = np.ones(nbytes // 8)
+    return state
+
+
+def test_memory_budget_skips_pinned_sessions():
+    manager = SessionManager(max_bytes=3 * 8000)
+    for session_id in ("a", "b", "c", "d"):
+        _fill(manager, session_id, 8000)
+
+    manager.pin("a")
+    manager.enforce_budget()
+    # "a" cũ nhất nhưng đang được dùng: "b" bị xóa thay
+    assert "a" in manager and "b" not in manager
+
+    manager.unpin("a")
+    _fill(manager, "e", 8000)
+    manager.enforce_budget()
+    assert "a" not in manager
+
+
+def test_admin_stats_do_not_expose_session_ids(tmp_path):
+    for manager in (SessionManager(), SharedSessionManager(root_dir=str(tmp_path))):
+        manager.get("secret-session", create=True)
+        listed = manager.stats()["sessions"]
+        assert [entry["session"] for entry in listed] == [session_label("secret-session")]
+        assert "secret-session" not in str(listed)
+
+
+def test_shared_budget_skips_pinned_sessions(tmp_path):
+    manager = SharedSessionManager(root_dir=str(tmp_path), max_bytes=3 * 8000)
+    for session_id in ("a", "b", "c", "d"):
+        _fill(manager, session_id, 8000)
+
+    manager.pin("a")
+    manager.enforce_budget()
+    assert "a" in manager and "b" not in manager
+
+
+def test_shared_values_round_trip_between_workers(tmp_path):
+    writer = SharedSessionManager(root_dir=str(tmp_path))
+    state = writer.get("s", create=True)
+    df = pd.DataFrame({"x": np.arange(1000), "y": np.linspace(0, 1, 1000), "name": ["a", "b"] * 500})
+    model = {"centroids": np.random.default_rng(0).random((50000, 4)), "k": 3}
+    state["df"] = df
+    state["kmeans_engine"] = model
+
+    # Worker khác: không có cache trong process, đọc từ file
+    reader = SharedSessionManager(root_dir=str(tmp_path)).get("s")
+    pd.testing.assert_frame_equal(reader["df"], df)
+    np.testing.assert_array_equal(reader["kmeans_engine"]["centroids"], model["centroids"])
+
+    files = os.listdir(writer._session_dir("s"))
+    assert any(name.endswith(".cols") for name in files)  # DataFrame lưu theo cột
+    assert any(name.endswith(".pkl.buf") for name in files)  # mảng lớn nằm ngoài pickle
+
+
+def test_shared_old_version_survives_overwrite_until_collected(tmp_path):
+    manager = SharedSessionManager(root_dir=str(tmp_path))
+    state = manager.get("s", create=True)
+    state["X_processed"] = np.zeros(100)
+    old = state["X_processed"]
+    state["X_processed"] = np.ones(100)
+
+    manager._collect_retired()
+    assert old.sum() == 0 and len(os.listdir(manager._session_dir("s"))) == 2
+
+    manager._collect_retired(grace=0)
+    assert len(os.listdir(manager._session_dir("s"))) == 1
+    assert state["X_processed"].sum() == 100
@@ -0,0 +1,106 @@
+import functools
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from kmeans_engine import run_clustering
+from preprocessing import DataPreprocessor, iter_frame_chunks
+from upload_store import ColumnarWriter, iter_columnar, read_columnar, write_columnar
+
+
+def _mixed_frame(n=500, seed=0):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        "age": rng.randint(18, 80, n).astype(float),
+        "income": rng.lognormal(10, 1, n),
+        "city": rng.choice(["HN", "HCM", "DN", "HP"], n).astype(object),
+    })
+    df.loc[rng.rand(n) < 0.1, "age"] = np.nan
+    df.loc[rng.rand(n) < 0.1, "city"] = np.nan
+    return df
+
+
+def test_fit_chunks_matches_fit_transform():
+    df = _mixed_frame()
+    full = DataPreprocessor()
+    X = full.fit_transform(df)
+
+    streamed = DataPreprocessor()
+    n_rows = streamed.fit_chunks(functools.partial(iter_frame_chunks, df, 37))
+
+    assert n_rows == len(df)
+    assert streamed.fill_values == full.fill_values
+    assert list(streamed.encoders["city"].classes_) == list(full.encoders["city"].classes_)
+    np.testing.assert_allclose(streamed.scaler.mean_, full.scaler.mean_)
+    np.testing.assert_allclose(streamed.scaler.scale_, full.scaler.scale_)
+    chunks = list(streamed.stream(functools.partial(iter_frame_chunks, df, 37)))
+    np.testing.assert_allclose(np.concatenate(chunks), X)
+
+
+def test_iter_columnar_matches_read_columnar(tmp_path):
+    df = _mixed_frame()
+    write_columnar(df, str(tmp_path))
+
+    chunks = list(iter_columnar(str(tmp_path), ["city", "income"], chunk_rows=64))
+
+    assert [len(chunk) for chunk in chunks[:-1]] == [64] * (len(chunks) - 1)
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), read_columnar(str(tmp_path))[["city", "income"]]
+    )
+
+
+def test_streamed_minibatch_memory_is_bounded(tmp_path):
+    n_rows, n_features, chunk_rows = 300000, 32, 10000
+    rng = np.random.RandomState(0)
+    writer = ColumnarWriter(str(tmp_path))
+    for _ in range(n_rows // chunk_rows):
+        centers = rng.randint(0, 3, chunk_rows)[:, None] * 5.0
+        chunk = centers + rng.randn(chunk_rows, n_features)
+        writer.append(pd.DataFrame(chunk, columns=[f"f{i}" for i in range(n_features)]))
+    writer.close()
+    raw_chunks = functools.partial(iter_columnar, str(tmp_path), None, chunk_rows)
+    matrix_bytes = n_rows * n_features * 8
+
+    tracemalloc.start()
+    try:
+        preprocessor = DataPreprocessor()
+        result = preprocessor.preprocess_chunks(raw_chunks)
+        engine, _, fit_result, cluster_stats = run_clustering(
+            None, preprocessor.feature_columns, k=3, mode="minibatch",
+            # Silhouette mẫu tốn O(sample^2), không phụ thuộc n: giữ mẫu nhỏ để đo phần O(n x p)
+            chunk_size=chunk_rows, silhouette_sample_size=500,
+            chunk_source=functools.partial(preprocessor.stream, raw_chunks)
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result["processed_shape"] == [n_rows, n_features]
+    assert fit_result["n_samples"] == n_rows
+    assert len(engine.labels) == n_rows
+    assert sum(stats["size"] for stats in cluster_stats.values()) == n_rows
+    # Chỉ các kết quả O(n) (labels, điểm PCA) và vài chunk nằm trong RAM, không phải ma trận n x p
+    assert peak < matrix_bytes / 2
+
+
+def test_streamed_preprocess_rejects_unknown_columns():
+    from fastapi.testclient import TestClient
+
+    import app as app_module
+
+    headers = {"X-Session-ID": "stream-columns-test"}
+    csv = _mixed_frame().to_csv(index=False)
+    with TestClient(app_module.app) as client:
+        try:
+            for compact in ("true", "false"):
+                response = client.post("/upload", files={"file": ("data.csv", csv, "text/csv")},
+                                       data={"compact": compact}, headers=headers)
+                assert response.status_code == 200, response.text
+                body = {"selected_columns": ["age", "X"], "stream": True}
+                for path in ("/preprocess", "/jobs/preprocess"):
+                    response = client.post(path, json=body, headers=headers)
+                    assert response.status_code == 400
+                    assert response.json()["detail"] == "Missing columns: ['X']"
+        finally:
+            app_module.session_manager.delete(headers["X-Session-ID"])
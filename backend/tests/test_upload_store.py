@@ -0,0 +1,16 @@
+import numpy as np
+
+from upload_store import ingest_csv, read_columnar
+
+
+def test_ingest_csv_keeps_dtypes_of_duplicate_headers(tmp_path):
+    path = tmp_path / "dup.csv"
+    path.write_text("a,a,b\n1.5,1,x\n2.5,2,y\n", encoding="utf-8")
+    data_dir = str(tmp_path / "data")
+
+    assert ingest_csv(str(path), data_dir, chunk_rows=1) == 2
+    df = read_columnar(data_dir)
+    # pandas đổi tên cột trùng thành "a.1"; cột int không bị ép theo dtype của "a"
+    assert list(df.columns) == ["a", "a.1", "b"]
+    assert df["a"].dtype == np.float64 and df["a.1"].dtype == np.int64
+    assert df["b"].tolist() == ["x", "y"]
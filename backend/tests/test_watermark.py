@@ -0,0 +1,26 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from db_connector import max_watermark, watermark_from_json, watermark_to_json
+
+
+def test_max_watermark_returns_plain_values():
+    assert max_watermark(pd.Series([3, None, 7], dtype="float64")) == 7.0
+    assert type(max_watermark(pd.Series([1, 5, 2]))) is int
+    assert max_watermark(pd.Series([None, None], dtype="float64")) is None
+    stamp = max_watermark(pd.Series(pd.to_datetime(["2024-01-02", "2024-03-04"])))
+    assert stamp == datetime.datetime(2024, 3, 4) and isinstance(stamp, datetime.datetime)
+
+
+def test_watermark_json_round_trip():
+    rowversion = bytes.fromhex("00000000000007D1")
+    assert watermark_to_json(rowversion) == "0x00000000000007D1"
+    assert watermark_from_json(watermark_to_json(rowversion)) == rowversion
+    assert watermark_from_json(watermark_to_json(42)) == 42
+    when = datetime.datetime(2024, 5, 6, 7, 8, 9)
+    assert watermark_to_json(when) == "2024-05-06T07:08:09"
+    # Chuỗi thường (không phải hex) giữ nguyên
+    assert watermark_from_json("0xZZ") == "0xZZ" and watermark_from_json("abc") == "abc"
+    assert watermark_to_json(np.int64(3)) == 3
@@ -0,0 +1,330 @@
+import json
+import os
+import pickle
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+from preprocessing import inspect_workbook
+
+DEFAULT_UPLOAD_DIR = os.environ.get(
+    "KPDL_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+)
+MAX_UPLOAD_SIZE = int(os.environ.get("KPDL_MAX_UPLOAD_BYTES", 1024 ** 3))  # 1GB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # đọc request body theo từng 1MB
+CSV_SAMPLE_ROWS = 10000
+CSV_CHUNK_ROWS = 100000
+
+_MANIFEST = "columns.json"
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class SchemaChanged(ValueError):
+    """A CSV chunk's dtypes are incompatible with the dtypes written so far"""
+
+
+# ==================== COLUMNAR STORE ====================
+# Mỗi cột một file nhị phân thô (memory-map được). Cột chuỗi / category
+# lưu dưới dạng mã int32 + danh sách giá trị duy nhất.
+
+class ColumnarWriter:
+    """Append DataFrame chunks to an on-disk columnar table"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.columns = None
+        self.n_rows = 0
+
+    def _path(self, index, suffix):
+        return os.path.join(self.data_dir, f"col_{index}.{suffix}")
+
+    def _init_columns(self, chunk):
+        self.columns = []
+        for index, name in enumerate(chunk.columns):
+            series = chunk[name]
+            dtype = series.dtype
+            if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+                column = {"name": name, "kind": "array", "dtype": dtype.str}
+            else:
+                column = {"name": name, "kind": "codes", "dtype": str(dtype), "uniques": {}}
+            self.columns.append(column)
+            open(self._path(index, "bin"), "wb").close()
+
+    def append(self, chunk):
+        if self.columns is None:
+            self._init_columns(chunk)
+        if [c["name"] for c in self.columns] != list(chunk.columns):
+            raise SchemaChanged("Column names differ between chunks")
+
+        for index, column in enumerate(self.columns):
+            series = chunk[column["name"]]
+            if column["kind"] == "array":
+                values = self._coerce_array(index, column, series)
+            else:
+                values = self._encode_codes(column, series)
+            with open(self._path(index, "bin"), "ab") as f:
+                f.write(np.ascontiguousarray(values).tobytes())
+        self.n_rows += len(chunk)
+
+    def _coerce_array(self, index, column, series):
+        dtype = np.dtype(column["dtype"])
+        values = series.to_numpy()
+        if values.dtype == dtype:
+            return values
+        if dtype.kind in "iu" and values.dtype.kind == "f":
+            # Cột int gặp NaN ở chunk sau: nâng phần đã ghi lên float64 một lần
+            written = np.fromfile(self._path(index, "bin"), dtype=dtype)
+            written.astype(np.float64).tofile(self._path(index, "bin"))
+            column["dtype"] = np.dtype(np.float64).str
+            return values.astype(np.float64)
+        if dtype.kind in "fiu" and values.dtype.kind in "iu":
+            return values.astype(dtype)
+        raise SchemaChanged(f"Column '{column['name']}' changed dtype")
+
+    @staticmethod
+    def _encode_codes(column, series):
+        local_codes, local_uniques = pd.factorize(series, use_na_sentinel=True)
+        uniques = column["uniques"]
+        mapping = np.empty(len(local_uniques) + 1, dtype=np.int32)
+        mapping[-1] = -1  # NaN giữ mã -1
+        for i, value in enumerate(local_uniques):
+            mapping[i] = uniques.setdefault(value, len(uniques))
+        return mapping[local_codes]
+
+    def close(self):
+        """Write the manifest; the table is readable only after this"""
+        if self.columns is None:
+            raise ValueError("No data to write")
+        manifest = {"n_rows": self.n_rows, "columns": []}
+        for index, column in enumerate(self.columns):
+            entry = {"name": column["name"], "kind": column["kind"], "dtype": column["dtype"]}
+            if column["kind"] == "codes":
+                # Giá trị duy nhất có thể là số, chuỗi, ngày... -> pickle
+                with open(self._path(index, "pkl"), "wb") as f:
+                    pickle.dump(list(column["uniques"]), f, protocol=pickle.HIGHEST_PROTOCOL)
+            manifest["columns"].append(entry)
+        with open(os.path.join(self.data_dir, _MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, default=str)
+
+
+def write_columnar(df, data_dir):
+    """Convert an in-memory DataFrame to the columnar format"""
+    writer = ColumnarWriter(data_dir)
+    writer.append(df)
+    writer.close()
+
+
+def has_columnar(data_dir):
+    return os.path.exists(os.path.join(data_dir, _MANIFEST))
+
+
+def _open_columnar(data_dir, columns=None):
+    """
+    (n_rows, [(name, read)]) for the columns of a columnar table, where
+    read(start, stop) returns that row range of the column.
+
+    Numeric columns are memory-mapped copy-on-write, so they are paged in
+    from disk on demand; text columns are decoded only for the rows read.
+    """
+    with open(os.path.join(data_dir, _MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    n_rows = manifest["n_rows"]
+    if columns is not None:
+        missing = [col for col in columns if col not in {c["name"] for c in manifest["columns"]}]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+
+    def load_bin(index, dtype):
+        if n_rows == 0:
+            return np.empty(0, dtype=dtype)
+        mapped = np.memmap(os.path.join(data_dir, f"col_{index}.bin"), dtype=dtype, mode="c", shape=(n_rows,))
+        # View ndarray thường: phép tính trên cột không trả về memmap
+        return mapped.view(np.ndarray)
+
+    readers = {}
+    for index, column in enumerate(manifest["columns"]):
+        name = column["name"]
+        if columns is not None and name not in columns:
+            continue
+        if column["kind"] == "array":
+            values = load_bin(index, np.dtype(column["dtype"]))
+            readers[name] = lambda start, stop, values=values: values[start:stop]
+            continue
+        with open(os.path.join(data_dir, f"col_{index}.pkl"), "rb") as f:
+            uniques = pickle.load(f)
+        codes = load_bin(index, np.int32)
+        lookup = np.empty(len(uniques) + 1, dtype=object)
+        lookup[:-1] = uniques
+        lookup[-1] = np.nan
+        dtype = pd.api.types.pandas_dtype(column["dtype"])
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = "category"
+        readers[name] = lambda start, stop, codes=codes, lookup=lookup, dtype=dtype: pd.array(
+            lookup[codes[start:stop]], dtype=dtype
+        )
+    names = columns if columns is not None else list(readers)
+    return n_rows, [(name, readers[name]) for name in names]
+
+
+def read_columnar(data_dir):
+    """Load a columnar table as a DataFrame (numeric columns stay memory-mapped)"""
+    n_rows, readers = _open_columnar(data_dir)
+    return pd.DataFrame({name: read(0, n_rows) for name, read in readers}, copy=False)
+
+
+def iter_columnar(data_dir, columns=None, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield a columnar table as DataFrame row chunks, decoding text columns per chunk"""
+    n_rows, readers = _open_columnar(data_dir, columns)
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        yield pd.DataFrame({name: read(start, stop) for name, read in readers}, copy=False)
+
+
+# ==================== CSV INGEST ====================
+
+def infer_csv_dtypes(path, sample_rows=CSV_SAMPLE_ROWS):
+    """
+    Infer column dtypes from the first rows of a CSV.
+
+    Only float and text columns are pinned; integer and boolean columns are
+    left to the parser because a missing value further down turns them into
+    float / object. Dtypes are keyed by column position: with duplicate
+    headers a name would pin every column sharing it.
+    """
+    sample = pd.read_csv(path, nrows=sample_rows)
+    dtypes = {}
+    for index, dtype in enumerate(sample.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind == "f":
+            dtypes[index] = dtype
+        elif not isinstance(dtype, np.dtype) or dtype.kind == "O":
+            dtypes[index] = dtype
+    return dtypes
+
+
+def ingest_csv(path, data_dir, chunk_rows=CSV_CHUNK_ROWS, sample_rows=CSV_SAMPLE_ROWS):
+    """
+    Parse a CSV in chunks straight into the columnar format; returns the row count.
+
+    Falls back to a single full parse when a later chunk contradicts the dtypes
+    inferred from the sample (e.g. text in a numeric column).
+    """
+    try:
+        writer = ColumnarWriter(data_dir)
+        dtypes = infer_csv_dtypes(path, sample_rows)
+        for chunk in pd.read_csv(path, dtype=dtypes, chunksize=chunk_rows):
+            writer.append(chunk)
+        if writer.columns is None:
+            writer.append(pd.read_csv(path, dtype=dtypes))
+        writer.close()
+        return writer.n_rows
+    except (SchemaChanged, ValueError, TypeError):
+        shutil.rmtree(data_dir, ignore_errors=True)
+        df = pd.read_csv(path)
+        write_columnar(df, data_dir)
+        return len(df)
+
+
+# ==================== SPOOLED UPLOADS ====================
+
+class SpooledUpload:
+    """
+    An uploaded file spooled to disk, plus a columnar copy of every table
+    parsed from it (the CSV itself, or each Excel sheet on first selection).
+
+    Only paths are kept here, so the object is cheap to keep in a session
+    and pickles for the shared session backend.
+    """
+
+    def __init__(self, upload_dir, filename):
+        self.upload_dir = upload_dir
+        self.filename = filename
+
+    @classmethod
+    async def receive(cls, upload, root_dir=DEFAULT_UPLOAD_DIR, max_bytes=MAX_UPLOAD_SIZE):
+        """Stream a FastAPI UploadFile to disk chunk by chunk"""
+        upload_dir = os.path.join(root_dir, uuid.uuid4().hex)
+        os.makedirs(upload_dir)
+        spooled = cls(upload_dir, upload.filename)
+        try:
+            size = 0
+            with open(spooled.source_path, "wb") as f:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLarge(
+                            f"File too large. Maximum size is {max_bytes // (1024*1024)}MB"
+                        )
+                    f.write(chunk)
+        except Exception:
+            spooled.remove()
+            raise
+        return spooled
+
+    @property
+    def source_path(self):
+        extension = os.path.splitext(self.filename)[1].lower()
+        return os.path.join(self.upload_dir, f"source{extension}")
+
+    @property
+    def is_csv(self):
+        return self.filename.lower().endswith('.csv')
+
+    def sheets_info(self):
+        """Per-sheet metadata, inspected once and cached next to the spooled file"""
+        if self.is_csv:
+            return []
+        info_path = os.path.join(self.upload_dir, "sheets.json")
+        if os.path.exists(info_path):
+            with open(info_path, encoding="utf-8") as f:
+                return json.load(f)
+        if self.filename.lower().endswith('.xlsx'):
+            sheets_info = inspect_workbook(self.source_path)
+        else:
+            # .xls: không có metadata đọc nhanh, chỉ lấy tên sheet
+            sheets_info = [{"name": name} for name in pd.ExcelFile(self.source_path).sheet_names]
+        # Tên cột có thể là ngày/số: chuẩn hóa qua JSON
+        sheets_info = json.loads(json.dumps(sheets_info, default=str))
+        with open(info_path, "w", encoding="utf-8") as f:
+            json.dump(sheets_info, f, ensure_ascii=False)
+        return sheets_info
+
+    def sheet_names(self):
+        return [sheet["name"] for sheet in self.sheets_info()]
+
+    def _data_dir(self, sheet_name=None):
+        """Columnar copy of the CSV or of one sheet, converted on first use"""
+        if self.is_csv:
+            data_dir = os.path.join(self.upload_dir, "data")
+            if not has_columnar(data_dir):
+                ingest_csv(self.source_path, data_dir)
+                # Bản columnar thay thế file gốc
+                os.remove(self.source_path)
+            return data_dir
+
+        sheet_names = self.sheet_names()
+        index = sheet_names.index(sheet_name) if sheet_name in sheet_names else 0
+        data_dir = os.path.join(self.upload_dir, "sheets", str(index))
+        if not has_columnar(data_dir):
+            df = pd.read_excel(self.source_path, sheet_name=index)
+            write_columnar(df, data_dir)
+        return data_dir
+
+    def load(self, sheet_name=None):
+        """Return (df, sheet_names), converting to the columnar copy on first use"""
+        data_dir = self._data_dir(sheet_name)
+        return read_columnar(data_dir), [] if self.is_csv else self.sheet_names()
+
+    def iter_chunks(self, sheet_name=None, columns=None, chunk_rows=CSV_CHUNK_ROWS):
+        """Yield the table as DataFrame row chunks straight from the columnar copy"""
+        return iter_columnar(self._data_dir(sheet_name), columns, chunk_rows)
+
+    def remove(self):
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
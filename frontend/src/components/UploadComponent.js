@@ -74,7 +74,7 @@ function UploadComponent({ onSuccess, onError, loading, setLoading }) {
                 <p>Tải lên file dữ liệu của bạn để bắt đầu phân tích. Hệ thống sẽ tự động nhận diện các cột dữ liệu.</p>
                 <ul>
                     <li><strong>File hỗ trợ:</strong> CSV (.csv) hoặc Excel (.xlsx)</li>
-                    <li><strong>Giới hạn:</strong> Tối đa 10MB</li>
+                    <li><strong>Giới hạn:</strong> Tối đa 1GB</li>
                     <li><strong>Yêu cầu:</strong> File phải có tiêu đề cột ở hàng đầu tiên</li>
                 </ul>
             </div>